@@ -281,6 +281,9 @@ def main():
                     
                     step_by_step, reasoning_summary, relevant_pages, final_answer = format_answer(answer)
                     display_answer_result(step_by_step, reasoning_summary, relevant_pages, final_answer)
+                    cache_audit = answer.get("semantic_cache", {}) if isinstance(answer, dict) else {}
+                    if cache_audit.get("hit"):
+                        st.caption(f"♻️ 答案来自语义缓存（相似度 {cache_audit['similarity']}，原问题：{cache_audit['cached_question']}）")
                     
                 except Exception as e:
                     st.error(f"生成答案时出错: {e}")
@@ -1,6 +1,8 @@
 import click
 from pathlib import Path
 from src.pipeline import Pipeline, configs, preprocess_configs
+from src.bench import run_benchmark
+from src.mock_api_server import MockAPIConfig, run_mock_server
 
 @click.group()
 def cli():
@@ -37,14 +39,28 @@ def serialize_tables(max_workers):
 
 @cli.command()
 @click.option('--config', type=click.Choice(['ser_tab', 'no_ser_tab']), default='no_ser_tab', help='Configuration preset to use')
-def process_reports(config):
+@click.option('--max-workers', default=1, help='Number of worker processes for building report indexes')
+@click.option('--streaming', is_flag=True, help='Chunk, embed and index markdown reports in one streaming pass')
+def process_reports(config, max_workers, streaming):
     """Process parsed reports through the pipeline stages."""
     root_path = Path.cwd()
     run_config = preprocess_configs[config]
     pipeline = Pipeline(root_path, run_config=run_config)
     
-    click.echo(f"Processing parsed reports (config={config})...")
-    pipeline.process_parsed_reports()
+    click.echo(f"Processing parsed reports (config={config}, max_workers={max_workers}, streaming={streaming})...")
+    pipeline.process_parsed_reports(max_workers=max_workers, streaming=streaming)
+
+@cli.command()
+@click.option('--k', default=10, help='Number of neighbours used for recall@k')
+@click.option('--num-queries', default=200, help='Number of sampled queries')
+@click.option('--quantization', is_flag=True, help='Compare float32/fp16/sq8 encodings instead of index types')
+def index_report(k, num_queries, quantization):
+    """Compare recall and latency of ANN index types (or vector encodings) against flat search."""
+    root_path = Path.cwd()
+    pipeline = Pipeline(root_path)
+
+    click.echo(f"Building recall-vs-latency report (k={k}, num_queries={num_queries}, quantization={quantization})...")
+    pipeline.report_vector_index_recall(k=k, num_queries=num_queries, quantization=quantization)
 
 @cli.command()
 @click.option('--config', type=click.Choice(['base', 'pdr', 'max', 'max_no_ser_tab', 'max_nst_o3m', 'max_st_o3m', 'ibm_llama70b', 'ibm_llama8b', 'gemini_thinking']), default='base', help='Configuration preset to use')
@@ -57,5 +73,44 @@ def process_questions(config):
     click.echo(f"Processing questions (config={config})...")
     pipeline.process_questions()
 
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='Host to bind')
+@click.option('--port', default=8765, help='Port to bind')
+@click.option('--latency-ms', default=200.0, help='Median response latency in milliseconds')
+@click.option('--latency-sigma', default=0.5, help='Lognormal sigma of the latency distribution (0 for fixed latency)')
+@click.option('--error-429-rate', default=0.0, help='Fraction of requests randomly rejected with HTTP 429')
+@click.option('--rpm', default=None, type=float, help='Requests per minute before the server answers 429')
+@click.option('--tpm', default=None, type=float, help='Tokens per minute before the server answers 429')
+def mock_server(host, port, latency_ms, latency_sigma, error_429_rate, rpm, tpm):
+    """Run a local mock of the DashScope and OpenAI-compatible chat/embedding APIs."""
+    config = MockAPIConfig(
+        latency_ms=latency_ms,
+        latency_sigma=latency_sigma,
+        error_429_rate=error_429_rate,
+        max_requests_per_minute=rpm,
+        max_tokens_per_minute=tpm
+    )
+    run_mock_server(config, host=host, port=port)
+
+@cli.command()
+@click.option('--base-url', default=None, help='API server to benchmark; starts an in-process mock server if omitted')
+@click.option('--provider', type=click.Choice(['dashscope', 'openai']), default='dashscope', help='API flavour to drive')
+@click.option('--concurrency', default=8, help='Concurrent requests')
+@click.option('--num-texts', default=500, help='Number of texts to embed')
+@click.option('--num-requests', default=50, help='Number of answer and rerank requests')
+@click.option('--latency-ms', default=200.0, help='Median latency of the in-process mock server')
+@click.option('--error-429-rate', default=0.0, help='429 rate of the in-process mock server')
+def bench(base_url, provider, concurrency, num_texts, num_requests, latency_ms, error_429_rate):
+    """Benchmark embedding, answering and reranking against a (mock) API server."""
+    mock_config = MockAPIConfig(latency_ms=latency_ms, error_429_rate=error_429_rate)
+    run_benchmark(
+        base_url=base_url,
+        provider=provider,
+        concurrency=concurrency,
+        num_texts=num_texts,
+        num_requests=num_requests,
+        mock_config=mock_config
+    )
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+
+import dashscope
+from dotenv import load_dotenv
+
+# 远程接口地址均可通过环境变量（或 .env）指向本地 mock 服务，用于离线压测：
+# - DASHSCOPE_HTTP_BASE_URL  DashScope 原生接口，如 http://127.0.0.1:8765/api/v1
+# - OPENAI_BASE_URL          OpenAI 兼容接口，如 http://127.0.0.1:8765/v1（openai 客户端自动读取）
+DEFAULT_DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+def configure_dashscope():
+    """设置 DashScope API Key 和接口地址；SDK 只在导入时读取环境变量，这里在调用前重新读取"""
+    load_dotenv()
+    dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+    dashscope.base_http_api_url = os.getenv("DASHSCOPE_HTTP_BASE_URL") or DEFAULT_DASHSCOPE_BASE_URL
+
+
+def openai_base_url() -> str:
+    load_dotenv()
+    return (os.getenv("OPENAI_BASE_URL") or DEFAULT_OPENAI_BASE_URL).rstrip("/")
@@ -316,11 +316,12 @@ class APIRequest:
 
 def api_endpoint_from_url(request_url):
     """Extract the API endpoint from the request URL."""
-    match = re.search("^https://[^/]+/v\\d+/(.+)$", request_url)
+    # 兼容 http 地址（本地 mock 服务）和带路径前缀的网关地址，如 /compatible-mode/v1/
+    match = re.search("^https?://[^/]+/(?:[^/]+/)*?v\\d+/(.+)$", request_url)
     if match is None:
         # for Azure OpenAI deployment urls
         match = re.search(
-            r"^https://[^/]+/openai/deployments/[^/]+/(.+?)(\?|$)", request_url
+            r"^https?://[^/]+/openai/deployments/[^/]+/(.+?)(\?|$)", request_url
         )
     return match[1]
 
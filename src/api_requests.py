@@ -16,6 +16,9 @@ from copy import deepcopy
 from tenacity import retry, stop_after_attempt, wait_fixed
 import dashscope
 
+from src import async_http
+from src.api_endpoints import configure_dashscope, openai_base_url
+
 # OpenAI基础处理器，封装了消息发送、结构化输出、计费等逻辑
 class BaseOpenaiProcessor:
     def __init__(self):
@@ -75,6 +78,42 @@ class BaseOpenaiProcessor:
 
         return content
 
+    async def asend_message(
+        self,
+        model=None,
+        temperature=0.5,
+        seed=None,
+        system_content='You are a helpful assistant.',
+        human_content='Hello!',
+        is_structured=False,
+        response_format=None
+        ):
+        # send_message 的异步版本，经 async_http 共享连接池请求 chat/completions
+        if model is None:
+            model = self.default_model
+        params = {
+            "model": model,
+            "seed": seed,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": human_content}
+            ]
+        }
+
+        if "o3-mini" not in model:
+            params["temperature"] = temperature
+
+        if is_structured:
+            params["response_format"] = type_to_response_format_param(response_format)
+        completion = await async_http.openai_chat(params)
+        content = completion["choices"][0]["message"]["content"]
+        if is_structured:
+            content = response_format.model_validate_json(content).model_dump()
+
+        usage = completion.get("usage", {})
+        self.response_data = {"model": completion.get("model", model), "input_tokens": usage.get("prompt_tokens"), "output_tokens": usage.get("completion_tokens")}
+        return content
+
     @staticmethod
     def count_tokens(string, encoding_name="o200k_base"):
         # 统计字符串的token数
@@ -410,6 +449,37 @@ class APIProcessor:
             **kwargs
         )
 
+    async def asend_message(
+        self,
+        model=None,
+        temperature=0.5,
+        seed=None,
+        system_content="You are a helpful assistant.",
+        human_content="Hello!",
+        is_structured=False,
+        response_format=None,
+        **kwargs
+    ):
+        """
+        send_message 的异步版本。openai/dashscope 使用原生异步请求，
+        其余 provider 的 SDK 只有同步接口，在线程中调用。
+        """
+        if model is None:
+            model = self.processor.default_model
+        params = dict(
+            model=model,
+            temperature=temperature,
+            seed=seed,
+            system_content=system_content,
+            human_content=human_content,
+            is_structured=is_structured,
+            response_format=response_format,
+            **kwargs
+        )
+        if hasattr(self.processor, "asend_message"):
+            return await self.processor.asend_message(**params)
+        return await asyncio.to_thread(self.processor.send_message, **params)
+
     def get_answer_from_rag_context(self, question, rag_context, schema, model, domain="universal"):
         system_prompt, response_format, user_prompt = self._build_rag_context_prompts(schema, domain)
         
@@ -421,6 +491,24 @@ class APIProcessor:
             response_format=response_format
         )
         self.response_data = self.processor.response_data
+        return self._complete_answer_dict(answer_dict)
+
+    async def aget_answer_from_rag_context(self, question, rag_context, schema, model, domain="universal"):
+        """get_answer_from_rag_context 的异步版本；同一实例上并发调用时 response_data 只保留最后一次"""
+        system_prompt, response_format, user_prompt = self._build_rag_context_prompts(schema, domain)
+
+        answer_dict = await self.asend_message(
+            model=model,
+            system_content=system_prompt,
+            human_content=user_prompt.format(context=rag_context, question=question),
+            is_structured=True,
+            response_format=response_format
+        )
+        self.response_data = self.processor.response_data
+        return self._complete_answer_dict(answer_dict)
+
+    @staticmethod
+    def _complete_answer_dict(answer_dict):
         # 兜底逻辑：确保所有必要字段都存在
         if 'step_by_step_analysis' not in answer_dict:
             answer_dict['step_by_step_analysis'] = ""
@@ -564,7 +652,7 @@ class AsyncOpenaiProcessor:
         save_filepath='./temp_async_llm_results.jsonl',
         preserve_requests=False,
         preserve_results=True,
-        request_url="https://api.openai.com/v1/chat/completions",
+        request_url=None,
         max_requests_per_minute=3_500,
         max_tokens_per_minute=3_500_000,
         token_encoding_name="o200k_base",
@@ -572,6 +660,9 @@ class AsyncOpenaiProcessor:
         logging_level=20,
         progress_callback=None
     ):
+        # 默认使用 OPENAI_BASE_URL，可指向本地 mock 服务
+        request_url = request_url or f"{openai_base_url()}/chat/completions"
+
         # Create requests for jsonl
         jsonl_requests = []
         for idx, query in enumerate(queries):
@@ -694,8 +785,8 @@ class AsyncOpenaiProcessor:
 # DashScope基础处理器，支持Qwen大模型对话
 class BaseDashscopeProcessor:
     def __init__(self):
-        # 从环境变量读取API-KEY
-        dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+        # 从环境变量读取API-KEY和接口地址
+        configure_dashscope()
         self.default_model = 'qwen-turbo-latest'
 
     def send_message(
@@ -747,3 +838,31 @@ class BaseDashscopeProcessor:
         print('content=', content)
         # 始终返回 dict，避免下游 AttributeError
         return {"final_answer": content}
+
+    async def asend_message(
+        self,
+        model="qwen-turbo-latest",
+        temperature=0.1,
+        seed=None,
+        system_content='You are a helpful assistant.',
+        human_content='Hello!',
+        is_structured=False,
+        response_format=None,
+        **kwargs
+    ):
+        """send_message 的异步版本，经 async_http 共享连接池请求 DashScope"""
+        if model is None:
+            model = self.default_model
+        messages = []
+        if system_content:
+            messages.append({"role": "system", "content": system_content})
+        if human_content:
+            messages.append({"role": "user", "content": human_content})
+        response = await async_http.dashscope_generation(model, messages, temperature=temperature)
+        try:
+            content = response["output"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            content = str(response)
+        usage = response.get("usage", {})
+        self.response_data = {"model": model, "input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens")}
+        return {"final_answer": content}
@@ -0,0 +1,127 @@
+"""
+ASYNC HTTP
+
+异步接口（aretrieve、arerank_documents、aget_answer_from_rag_context 等）共用的 aiohttp 客户端：
+
+- 每个事件循环一个 ClientSession，连接池上限 ASYNC_HTTP_MAX_CONNECTIONS（默认 100），
+  同一事件循环上的所有请求复用连接；上限同时约束在途请求数，超出的请求在连接池排队
+- 429 和 5xx 按指数退避重试，其余错误直接抛出 AsyncAPIError
+- 接口地址与同步实现一致（configure_dashscope、openai_base_url），可指向本地 mock 服务
+
+事件循环结束前调用 close_session() 关闭连接池。
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from typing import Dict, List, Optional
+
+import aiohttp
+import dashscope
+from dotenv import load_dotenv
+
+from src.api_endpoints import configure_dashscope, openai_base_url
+
+_log = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "100"))
+MAX_ATTEMPTS = 5
+REQUEST_TIMEOUT_SECONDS = 300
+
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+class AsyncAPIError(RuntimeError):
+    def __init__(self, status: int, body: str, url: str):
+        self.status = status
+        self.body = body
+        super().__init__(f"{url} 返回错误 {status}: {body[:500]}")
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+def get_session() -> aiohttp.ClientSession:
+    """返回当前事件循环共享的 ClientSession（需在协程中调用）"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """关闭当前事件循环的 ClientSession"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def post_json(url: str, payload: dict, headers: Dict[str, str], max_attempts: int = MAX_ATTEMPTS) -> dict:
+    session = get_session()
+    for attempt in range(1, max_attempts + 1):
+        try:
+            async with session.post(url, json=payload, headers=headers) as response:
+                if response.status == 200:
+                    return await response.json()
+                error = AsyncAPIError(response.status, await response.text(), url)
+        except aiohttp.ClientError as e:
+            # 连接错误按可重试处理
+            error = AsyncAPIError(599, f"{type(e).__name__}: {e}", url)
+        if not error.retryable or attempt == max_attempts:
+            raise error
+        delay = min(2 ** (attempt - 1), 30)
+        _log.warning(f"请求失败（第 {attempt} 次），{delay} 秒后重试: {error}")
+        await asyncio.sleep(delay)
+
+
+def _dashscope_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {dashscope.api_key}", "Content-Type": "application/json"}
+
+
+def _openai_headers() -> Dict[str, str]:
+    load_dotenv()
+    return {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}", "Content-Type": "application/json"}
+
+
+async def dashscope_generation(model: str, messages: List[dict], temperature: Optional[float] = None) -> dict:
+    """DashScope 对话（result_format=message），返回原始响应，结构同 Generation.call"""
+    configure_dashscope()
+    parameters = {"result_format": "message"}
+    if temperature is not None:
+        parameters["temperature"] = temperature
+    payload = {"model": model, "input": {"messages": messages}, "parameters": parameters}
+    url = f"{dashscope.base_http_api_url.rstrip('/')}/services/aigc/text-generation/generation"
+    return await post_json(url, payload, _dashscope_headers())
+
+
+async def dashscope_embeddings(model: str, texts: List[str]) -> List[List[float]]:
+    """DashScope 文本嵌入，结果与 texts 同序"""
+    configure_dashscope()
+    payload = {"model": model, "input": {"texts": texts}, "parameters": {}}
+    url = f"{dashscope.base_http_api_url.rstrip('/')}/services/embeddings/text-embedding/text-embedding"
+    rsp = await post_json(url, payload, _dashscope_headers())
+    embeddings = [None] * len(texts)
+    for emb in rsp.get("output", {}).get("embeddings", []):
+        if not emb.get("embedding"):
+            raise RuntimeError(f"DashScope返回的embedding为空，text_index={emb.get('text_index', None)}")
+        embeddings[emb.get("text_index", 0)] = emb["embedding"]
+    if any(emb is None for emb in embeddings):
+        raise RuntimeError(f"DashScope返回的embedding数量不足: {rsp}")
+    return embeddings
+
+
+async def openai_chat(params: dict) -> dict:
+    """OpenAI 兼容的 chat/completions，params 同 chat.completions.create 的参数，返回原始响应"""
+    return await post_json(f"{openai_base_url()}/chat/completions", params, _openai_headers())
+
+
+async def openai_embeddings(model: str, texts: List[str]) -> List[List[float]]:
+    rsp = await post_json(f"{openai_base_url()}/embeddings", {"model": model, "input": texts}, _openai_headers())
+    return [item["embedding"] for item in sorted(rsp["data"], key=lambda item: item["index"])]
@@ -0,0 +1,224 @@
+"""
+BENCH
+
+压测工具：用真实的入库/问答代码路径（VectorDBIngestor 嵌入调度、APIProcessor 问答、LLMReranker 重排）
+并发调用模型接口，统计延迟分位数、吞吐和错误数。
+
+接口地址由 src.api_endpoints 的环境变量决定；未指定 base_url 时在进程内启动 mock_api_server，
+可以在没有 API Key、没有网络的环境下复现限流、长尾延迟等场景，对比并发度和批大小等参数的效果。
+"""
+
+import atexit
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+import requests
+from tabulate import tabulate
+
+from src.api_endpoints import configure_dashscope
+from src.api_requests import APIProcessor
+from src.embedding_cache import EmbeddingCache
+from src.embedding_dispatcher import EmbeddingDispatcher
+from src.ingestion import VectorDBIngestor
+from src.mock_api_server import MockAPIConfig, MockAPIServer, MockServerThread
+from src.reranking import LLMReranker
+
+_WORDS = (
+    "revenue profit margin dividend shareholders quarter growth operating cash flow assets liabilities "
+    "营业收入 净利润 毛利率 分红 股东 季度 增长 经营活动 现金流 资产 负债 研发 投入 市场 份额"
+).split()
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def _summarize(name: str, latencies: List[float], errors: int, elapsed: float, units: int) -> dict:
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "benchmark": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "max_ms": round(float(values.max()), 1),
+        "elapsed_s": round(elapsed, 2),
+        "units_per_s": round(units / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+class PipelineBenchmark:
+    def __init__(
+        self,
+        provider: str = "dashscope",
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        seconds_between_attempts: float = 1.0,
+        seed: int = 0
+    ):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.seconds_between_attempts = seconds_between_attempts
+        self.rng = random.Random(seed)
+
+    def _run_concurrently(self, name: str, calls: List[Callable[[], object]], units_per_call: int = 1) -> dict:
+        latencies, errors = [], []
+
+        def timed(call):
+            t0 = time.perf_counter()
+            try:
+                call()
+                latencies.append(time.perf_counter() - t0)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+        t0 = time.perf_counter()
+        # 问答和重排代码会打印完整响应，压测时丢弃这些输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(timed, calls))
+        elapsed = time.perf_counter() - t0
+        if errors:
+            print(f"{name}: {len(errors)} 个请求失败，例如 {errors[0]}")
+        return _summarize(name, latencies, len(errors), elapsed, len(latencies) * units_per_call)
+
+    def bench_embedding(self, num_texts: int = 500, text_length: int = 600) -> dict:
+        """经 VectorDBIngestor 的嵌入缓存和并发限流调度器嵌入随机文本（空缓存，全部请求接口）"""
+        texts = [_random_text(self.rng, text_length) for _ in range(num_texts)]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ingestor = VectorDBIngestor(
+                embedding_concurrency=self.concurrency,
+                embedding_cache=EmbeddingCache(cache_dir)
+            )
+            # 压测时缩短重试间隔，使 429 的影响体现在延迟里而不是固定的 20 秒等待
+            ingestor.dispatcher = EmbeddingDispatcher(
+                embed_batch_fn=ingestor._embed_batch,
+                max_batch_size=25,
+                max_batch_tokens=ingestor.max_batch_tokens,
+                max_in_flight=self.concurrency,
+                max_requests_per_minute=ingestor.max_requests_per_minute,
+                max_tokens_per_minute=ingestor.max_tokens_per_minute,
+                max_attempts=self.max_attempts,
+                seconds_between_attempts=self.seconds_between_attempts
+            )
+            batch_latencies = []
+            embed_batch = ingestor._embed_batch
+
+            def timed_batch(batch):
+                t0 = time.perf_counter()
+                try:
+                    return embed_batch(batch)
+                finally:
+                    batch_latencies.append(time.perf_counter() - t0)
+
+            ingestor.dispatcher.embed_batch_fn = timed_batch
+            t0 = time.perf_counter()
+            errors = 0
+            try:
+                embeddings = ingestor.embedding_cache.get_or_compute(
+                    ingestor.embedding_provider, ingestor.embedding_model, texts, ingestor._embed_texts, flush=False
+                )
+                assert len(embeddings) == num_texts
+            except Exception as e:
+                print(f"embedding: 失败 {type(e).__name__}: {e}")
+                errors = 1
+            elapsed = time.perf_counter() - t0
+            stats = ingestor.dispatcher.last_stats
+            # 临时缓存目录随后删除，取消退出时的 flush
+            atexit.unregister(ingestor.embedding_cache.flush)
+        summary = _summarize("embedding (texts)", batch_latencies, errors, elapsed, 0 if errors else num_texts)
+        summary["requests"] = len(batch_latencies)
+        summary["batches"] = stats.num_batches
+        summary["capacity_wait_s"] = round(stats.seconds_waiting_for_capacity, 2)
+        return summary
+
+    def bench_answers(self, num_requests: int = 50, context_length: int = 4000) -> dict:
+        """并发调用 APIProcessor.get_answer_from_rag_context，与问答流程的请求内容规模一致"""
+        processor = APIProcessor(provider=self.provider)
+        contexts = [_random_text(self.rng, context_length) for _ in range(num_requests)]
+
+        def call(context):
+            # 每个请求独立的 processor 状态（response_data）在多线程下互相覆盖，这里只关心延迟
+            return lambda: processor.get_answer_from_rag_context(
+                question="What is the company's net profit?", rag_context=context, schema="number", model=None
+            )
+
+        return self._run_concurrently("rag answer", [call(c) for c in contexts])
+
+    def bench_rerank(self, num_requests: int = 50, blocks_per_request: int = 10, block_length: int = 500) -> dict:
+        """并发调用 LLMReranker.get_rank_for_multiple_blocks"""
+        reranker = LLMReranker(provider=self.provider)
+        requests_blocks = [
+            [_random_text(self.rng, block_length) for _ in range(blocks_per_request)]
+            for _ in range(num_requests)
+        ]
+
+        def call(blocks):
+            return lambda: reranker.get_rank_for_multiple_blocks("net profit", blocks)
+
+        return self._run_concurrently("rerank (blocks)", [call(b) for b in requests_blocks], blocks_per_request)
+
+    def run(self, num_texts: int = 500, num_requests: int = 50) -> List[dict]:
+        results = []
+        if self.provider == "dashscope":
+            results.append(self.bench_embedding(num_texts))
+        results.append(self.bench_answers(num_requests))
+        results.append(self.bench_rerank(num_requests))
+        return results
+
+
+def run_benchmark(
+    base_url: Optional[str] = None,
+    provider: str = "dashscope",
+    concurrency: int = 8,
+    num_texts: int = 500,
+    num_requests: int = 50,
+    mock_config: Optional[MockAPIConfig] = None
+) -> List[dict]:
+    """
+    压测入口。base_url 为空时在本进程内启动 mock 服务，并使用占位 API Key；
+    指定 base_url 时（如单独运行的 mock 服务）按该地址设置 DASHSCOPE_HTTP_BASE_URL 和 OPENAI_BASE_URL。
+    """
+    with contextlib.ExitStack() as stack:
+        server = None
+        if base_url is None:
+            server = MockAPIServer(mock_config)
+            base_url = stack.enter_context(MockServerThread(server)).base_url
+            os.environ.setdefault("DASHSCOPE_API_KEY", "mock-key")
+            os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        base_url = base_url.rstrip("/")
+        os.environ["DASHSCOPE_HTTP_BASE_URL"] = f"{base_url}/api/v1"
+        os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+        configure_dashscope()
+        print(f"Benchmarking {provider} API at {base_url} (concurrency={concurrency})")
+
+        results = PipelineBenchmark(provider=provider, concurrency=concurrency).run(num_texts, num_requests)
+        print(tabulate(results, headers="keys", tablefmt="github"))
+
+        if server is not None:
+            stats = server.stats()
+        else:
+            try:
+                stats = requests.get(f"{base_url}/stats", timeout=5).json()
+            except (requests.RequestException, ValueError):
+                stats = None
+        if stats:
+            print(
+                f"Server: {stats['requests']} requests, {stats['throttled']} throttled (429), "
+                f"{stats['rejected']} rejected, latency p50 {stats['latency_p50_ms']} ms, p95 {stats['latency_p95_ms']} ms"
+            )
+        return results
@@ -0,0 +1,161 @@
+"""
+CHUNK DEDUP
+
+入库前的文本块去重：只嵌入每组重复文本块中的一个代表，重复块复用代表的向量。
+
+- 精确重复：空白归一化后的文本 sha1 相同
+- 近似重复：字符 shingle 的 MinHash 签名，LSH 分段分桶找候选，
+  签名估计的 Jaccard 相似度不低于阈值时视为重复（年报每页重复的页眉、页脚、免责声明等）
+
+按添加顺序增量判断，第一次出现的文本块作为代表，批量入库和流式入库共用同一套逻辑，结果确定。
+去重只节省嵌入请求，不从索引中删除文本块：组内每个文本块都以自己的下标入索引（向量与代表相同），
+逐年对比的财务表格等近似文本块仍能各自被检索和引用。向量 id 到文本块下标的映射保存为 <sha1>.chunk_ids.npy。
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+# 64 位多项式滚动哈希的基数，以及 MinHash 置换参数的随机种子（固定，保证结果可复现）
+_BASE = np.uint64(1_000_003)
+_SEED = 20240601
+
+
+@dataclass
+class DedupStats:
+    num_chunks: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    @property
+    def num_representatives(self) -> int:
+        return self.num_chunks - self.exact_duplicates - self.near_duplicates
+
+
+@dataclass
+class DedupResult:
+    # 代表文本块在输入中的下标（升序），以及每个输入对应的代表下标（代表自身映射到自己）
+    representatives: List[int] = field(default_factory=list)
+    assignment: List[int] = field(default_factory=list)
+    stats: DedupStats = field(default_factory=DedupStats)
+
+
+class ChunkDeduplicator:
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 5, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError(f"num_perm={num_perm} 必须能被 bands={bands} 整除")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(_SEED)
+        # 奇数乘数的 64 位乘法哈希族，取高 32 位作为置换后的值
+        self._a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self._exact: Dict[bytes, int] = {}
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._count = 0
+        self.stats = DedupStats()
+
+    @property
+    def num_added(self) -> int:
+        """已添加的文本块个数，即下一个文本块的序号"""
+        return self._count
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return _WHITESPACE.sub(" ", text).strip()
+
+    def signature(self, text: str) -> np.ndarray:
+        """归一化文本的 MinHash 签名（num_perm 个 uint32）"""
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = min(self.shingle_size, len(codes))
+        if k == 0:
+            return np.zeros(self.num_perm, dtype=np.uint32)
+        # 所有长度为 k 的字符 shingle 的滚动哈希（uint64 溢出即取模 2^64）
+        num_shingles = len(codes) - k + 1
+        shingles = np.zeros(num_shingles, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for j in range(k):
+                shingles = shingles * _BASE + codes[j:j + num_shingles]
+            shingles = np.unique(shingles)
+            permuted = self._a[:, None] * shingles[None, :] + self._b[:, None]
+        return (permuted >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+    def add(self, text: str) -> Optional[int]:
+        """
+        按顺序添加一个文本块（序号为已添加的个数）。
+        是已有文本块的重复时返回代表的序号，否则该文本块成为新的代表并返回 None。
+        """
+        position = self._count
+        self._count += 1
+        self.stats.num_chunks += 1
+        normalized = self.normalize(text)
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        representative = self._exact.get(digest)
+        if representative is not None:
+            self.stats.exact_duplicates += 1
+            return representative
+
+        signature = self.signature(normalized)
+        band_keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+        # 多个候选时取相似度最高的，相同时取最早的代表
+        best, best_similarity = None, 0.0
+        for key in band_keys:
+            for candidate in self._buckets.get(key, ()):
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold and (best is None or (similarity, -candidate) > (best_similarity, -best)):
+                    best, best_similarity = candidate, similarity
+        if best is not None:
+            self.stats.near_duplicates += 1
+            self._exact[digest] = best
+            return best
+
+        self._exact[digest] = position
+        self._signatures[position] = signature
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(position)
+        return None
+
+    def deduplicate(self, texts: List[str]) -> DedupResult:
+        """对一组文本块去重（通常是一份报告的全部待嵌入文本块），只能在新实例上调用"""
+        if self._count:
+            raise ValueError("deduplicate 需要在未添加过文本块的实例上调用")
+        result = DedupResult()
+        for i, text in enumerate(texts):
+            representative = self.add(text)
+            if representative is None:
+                result.representatives.append(i)
+                result.assignment.append(i)
+            else:
+                result.assignment.append(representative)
+        result.stats = self.stats
+        return result
+
+
+# 分报告索引的向量 id -> 文本块下标映射，与 <sha1>.faiss 同目录；没有该文件的旧索引按非空文本块顺序对应
+def vector_chunk_ids_path(vector_db_dir: Path, sha1: str) -> Path:
+    return Path(vector_db_dir) / f"{sha1}.chunk_ids.npy"
+
+
+def save_vector_chunk_ids(vector_db_dir: Path, sha1: str, chunk_ids: List[int]):
+    path = vector_chunk_ids_path(vector_db_dir, sha1)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, np.asarray(chunk_ids, dtype=np.int32))
+    os.replace(tmp_path, path)
+
+
+def load_vector_chunk_ids(vector_db_dir: Path, sha1: str) -> Optional[np.ndarray]:
+    path = vector_chunk_ids_path(vector_db_dir, sha1)
+    return np.load(path) if path.exists() else None
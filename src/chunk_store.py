@@ -0,0 +1,314 @@
+"""
+CHUNK STORE
+
+分块报告的列式二进制存储，供检索时按需读取文本块，替代每次完整解析 chunked_reports/*.json。
+
+每份报告两个文件，位于分块报告目录的 chunks/ 子目录：
+- <sha1>.meta.npz   定长元数据表（文本块：id、页码、起止行号、token 数、字节偏移和长度；
+                    页面：页码、字节偏移和长度）、页码 -> 页面行号的稠密数组，
+                    以及 metainfo、来源 JSON 的大小和修改时间
+- <sha1>.text.bin   所有文本块和页面文本按 UTF-8 依次拼接，检索时以内存映射方式打开，
+                    只有被访问的文本会读入内存
+
+分块报告 JSON 仍是入库的数据源；来源 JSON 的大小或修改时间变化时自动重建存储。
+缺失的整数字段记为 -1。
+
+markdown 分块报告没有页面，写入时按行号把原文切成每 MARKDOWN_PAGE_LINES 行一个的合成页面，
+文本块归入其中间行所在的页面，父页面检索和全文模式对 markdown 报告同样可用。
+合成页码不是原文页码，chunk_page 对这类报告返回 None，父页面检索用 parent_page。
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+CHUNK_DTYPE = np.dtype([
+    ("id", "<i4"),
+    ("page", "<i4"),
+    ("line_start", "<i4"),
+    ("line_end", "<i4"),
+    ("length_tokens", "<i4"),
+    ("offset", "<i8"),
+    ("length", "<i4"),
+])
+
+PAGE_DTYPE = np.dtype([
+    ("page", "<i4"),
+    ("offset", "<i8"),
+    ("length", "<i4"),
+])
+
+# 存储格式版本，旧版本存储打开时自动重建
+FORMAT_VERSION = 2
+MARKDOWN_PAGE_LINES = 60
+
+# 同一进程内按存储路径串行化重建，多个检索线程同时打开缺失的存储时只构建一次
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def _build_lock(store_dir: Path, sha1: str) -> threading.Lock:
+    key = str(Path(store_dir).resolve() / sha1)
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def build_page_rows(pages: np.ndarray) -> np.ndarray:
+    """页码 -> 页面表行号（无该页为 -1），按页码直接下标访问"""
+    page_numbers = pages["page"].astype(np.int64)
+    valid = page_numbers >= 0
+    page_rows = np.full(int(page_numbers[valid].max()) + 1 if valid.any() else 0, -1, dtype=np.int32)
+    page_rows[page_numbers[valid]] = np.nonzero(valid)[0]
+    return page_rows
+
+
+class ChunkStoreWriter:
+    """逐块追加写入：文本直接写入临时 blob 文件，内存中只保留定长元数据行"""
+
+    def __init__(self, store_dir: Path, sha1: str, page_lines: int = MARKDOWN_PAGE_LINES):
+        self.store_dir = Path(store_dir)
+        self.sha1 = sha1
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.store_dir / f"{sha1}.meta.npz"
+        self.text_path = self.store_dir / f"{sha1}.text.bin"
+        # 临时文件名带进程号和随机后缀，同一进程内的多个写入者互不覆盖
+        self._tmp_suffix = f"{os.getpid()}.{uuid.uuid4().hex}"
+        self._tmp_text_path = self.text_path.with_name(f"{self.text_path.name}.{self._tmp_suffix}.tmp")
+        self._text_file = open(self._tmp_text_path, "wb")
+        self._offset = 0
+        self._chunks: List[tuple] = []
+        self._pages: List[tuple] = []
+        # 合成页面：没有页码、只有行号的文本块（markdown）按行号切页
+        self.page_lines = page_lines
+        self._synthetic = False
+        self._synthetic_page: Optional[int] = None
+        self._synthetic_lines: List[str] = []
+        self._last_line = 0
+
+    def _write_text(self, text: str):
+        data = text.encode("utf-8")
+        offset = self._offset
+        self._text_file.write(data)
+        self._offset += len(data)
+        return offset, len(data)
+
+    def _collect_lines(self, text: str, line_start: int, line_end: int):
+        # 分块按行切分且相互重叠，只收集尚未见过的行；行数对不上时跳过该分块
+        parts = text.split("\n")
+        lines = [part + "\n" for part in parts[:-1]] + ([parts[-1]] if parts[-1] else [])
+        if len(lines) != line_end - line_start + 1:
+            _log.warning(f"{self.sha1} 分块行号 {line_start}-{line_end} 与文本行数不一致，合成页面可能不完整")
+            return
+        for number, line in enumerate(lines, line_start):
+            if number <= self._last_line:
+                continue
+            page = (number - 1) // self.page_lines + 1
+            if page != self._synthetic_page:
+                self._flush_synthetic_page()
+                self._synthetic_page = page
+            self._synthetic_lines.append(line)
+            self._last_line = number
+
+    def _flush_synthetic_page(self):
+        if self._synthetic_page is not None and self._synthetic_lines:
+            self.append_page({"page": self._synthetic_page, "text": "".join(self._synthetic_lines)})
+        self._synthetic_lines = []
+
+    def append_chunk(self, chunk: dict):
+        offset, length = self._write_text(chunk["text"])
+        lines = chunk.get("lines") or (-1, -1)
+        page = chunk.get("page", -1)
+        if page < 0 and lines[0] > 0 and self.page_lines > 0:
+            self._synthetic = True
+            self._collect_lines(chunk["text"], lines[0], lines[1])
+            page = ((lines[0] + lines[1]) // 2 - 1) // self.page_lines + 1
+        self._chunks.append((
+            chunk.get("id", len(self._chunks)),
+            page,
+            lines[0],
+            lines[1],
+            chunk.get("length_tokens", -1),
+            offset,
+            length,
+        ))
+
+    def append_page(self, page: dict):
+        offset, length = self._write_text(page["text"])
+        self._pages.append((page["page"], offset, length))
+
+    def close(self, metainfo: dict, source_path: Path):
+        """写入元数据并原子替换；source_path 的大小和修改时间用于判断存储是否过期"""
+        self._flush_synthetic_page()
+        self._text_file.close()
+        stat = Path(source_path).stat()
+        pages = np.array(self._pages, dtype=PAGE_DTYPE)
+        header = {
+            "format": FORMAT_VERSION,
+            "synthetic_pages": self._synthetic,
+            "metainfo": metainfo,
+            "source_file": Path(source_path).name,
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "text_bytes": self._offset,
+        }
+        tmp_meta_path = self.meta_path.with_name(f"{self.meta_path.name}.{self._tmp_suffix}.tmp.npz")
+        np.savez(
+            tmp_meta_path,
+            chunks=np.array(self._chunks, dtype=CHUNK_DTYPE),
+            pages=pages,
+            page_rows=build_page_rows(pages),
+            header=np.array(json.dumps(header, ensure_ascii=False))
+        )
+        # 先替换文本再替换元数据：元数据中的 text_bytes 与文本文件大小一致才视为有效
+        os.replace(self._tmp_text_path, self.text_path)
+        os.replace(tmp_meta_path, self.meta_path)
+
+    def abort(self):
+        self._text_file.close()
+        if self._tmp_text_path.exists():
+            self._tmp_text_path.unlink()
+
+
+class ChunkStore:
+    DIR_NAME = "chunks"
+
+    def __init__(self, chunks: np.ndarray, pages: np.ndarray, page_rows: np.ndarray, text: np.ndarray, header: dict):
+        self.chunks = chunks
+        self.pages = pages
+        self.page_rows = page_rows
+        self._text = text
+        self.header = header
+
+    @classmethod
+    def store_dir(cls, documents_dir: Path) -> Path:
+        return Path(documents_dir) / cls.DIR_NAME
+
+    @classmethod
+    def write(cls, documents_dir: Path, document_path: Path, document: dict) -> "ChunkStore":
+        """由已解析的分块报告写入存储（document 应与 document_path 的内容一致）"""
+        sha1 = document["metainfo"]["sha1"]
+        writer = ChunkStoreWriter(cls.store_dir(documents_dir), sha1)
+        try:
+            content = document.get("content", {})
+            for chunk in content.get("chunks", []):
+                writer.append_chunk(chunk)
+            for page in content.get("pages", []):
+                writer.append_page(page)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close(document["metainfo"], document_path)
+        return cls.read(documents_dir, sha1)
+
+    @classmethod
+    def read(cls, documents_dir: Path, sha1: str) -> "ChunkStore":
+        store_dir = cls.store_dir(documents_dir)
+        with np.load(store_dir / f"{sha1}.meta.npz") as data:
+            chunks, pages = data["chunks"], data["pages"]
+            header = json.loads(str(data["header"]))
+            if header.get("format") != FORMAT_VERSION:
+                raise ValueError(f"文本块存储格式已过期: {sha1}")
+            page_rows = data["page_rows"]
+        text_path = store_dir / f"{sha1}.text.bin"
+        if text_path.stat().st_size != header["text_bytes"]:
+            raise ValueError(f"文本块存储不完整: {text_path}")
+        # 空文件无法内存映射
+        text = np.memmap(text_path, dtype=np.uint8, mode="r") if header["text_bytes"] else np.zeros(0, dtype=np.uint8)
+        return cls(chunks, pages, page_rows, text, header)
+
+    @classmethod
+    def open(cls, documents_dir: Path, document_path: Path, sha1: str) -> "ChunkStore":
+        """打开报告的存储；不存在、损坏或来源 JSON 已变化时从 JSON 重建"""
+        document_path = Path(document_path)
+        store = cls._read_current(documents_dir, document_path, sha1)
+        if store is not None:
+            return store
+        with _build_lock(cls.store_dir(documents_dir), sha1):
+            # 等锁期间其他线程可能已经重建完成
+            store = cls._read_current(documents_dir, document_path, sha1)
+            if store is not None:
+                return store
+            _log.info(f"Building chunk store for {document_path.name}")
+            with open(document_path, 'r', encoding='utf-8') as f:
+                document = json.load(f)
+            return cls.write(documents_dir, document_path, document)
+
+    @classmethod
+    def _read_current(cls, documents_dir: Path, document_path: Path, sha1: str) -> Optional["ChunkStore"]:
+        # 存储存在、完整且与来源 JSON 一致时返回，否则返回 None
+        try:
+            store = cls.read(documents_dir, sha1)
+            stat = document_path.stat()
+            if (store.header["source_size"], store.header["source_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                return store
+        except (OSError, KeyError, ValueError):
+            pass
+        return None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def metainfo(self) -> dict:
+        return self.header.get("metainfo", {})
+
+    @property
+    def nbytes(self) -> int:
+        # 元数据常驻内存；文本为内存映射，可由系统回收，只按一半计入
+        return self.chunks.nbytes + self.pages.nbytes + self.page_rows.nbytes + self.header["text_bytes"] // 2
+
+    def _decode(self, offset: int, length: int) -> str:
+        return self._text[offset:offset + length].tobytes().decode("utf-8")
+
+    def text(self, index: int) -> str:
+        row = self.chunks[index]
+        return self._decode(int(row["offset"]), int(row["length"]))
+
+    @property
+    def synthetic_pages(self) -> bool:
+        return bool(self.header.get("synthetic_pages"))
+
+    def chunk_page(self, index: int) -> Optional[int]:
+        """文本块在原文中的页码，没有页码或只有合成页码时返回 None"""
+        if self.synthetic_pages:
+            return None
+        return self.parent_page(index)
+
+    def parent_page(self, index: int) -> Optional[int]:
+        """取父页面文本用的页码，markdown 报告为合成页码"""
+        page = int(self.chunks[index]["page"])
+        return page if page >= 0 else None
+
+    def chunk(self, index: int) -> dict:
+        """还原为分块报告 JSON 中的文本块结构，缺失的页码、行号、token 数不输出"""
+        row = self.chunks[index]
+        chunk = {"id": int(row["id"])}
+        if row["page"] >= 0 and not self.synthetic_pages:
+            chunk["page"] = int(row["page"])
+        if row["line_start"] >= 0:
+            chunk["lines"] = [int(row["line_start"]), int(row["line_end"])]
+        if row["length_tokens"] >= 0:
+            chunk["length_tokens"] = int(row["length_tokens"])
+        chunk["text"] = self._decode(int(row["offset"]), int(row["length"]))
+        return chunk
+
+    def page_text(self, page: int) -> Optional[str]:
+        if not 0 <= page < len(self.page_rows):
+            return None
+        row = self.page_rows[page]
+        if row < 0:
+            return None
+        return self._decode(int(self.pages[row]["offset"]), int(self.pages[row]["length"]))
+
+    def iter_pages(self):
+        """按页码顺序产出 {"page", "text"}"""
+        for row in self.pages[np.argsort(self.pages["page"], kind="stable")]:
+            yield {"page": int(row["page"]), "text": self._decode(int(row["offset"]), int(row["length"]))}
@@ -0,0 +1,296 @@
+"""
+CORPUS INDEX
+
+全语料单一向量索引：所有报告的文本块向量放在同一个 faiss 索引中，
+向量 id（即添加顺序）映射到 (文档 sha1, 文本块下标)。
+检索时通过 faiss 的 IDSelector 限定文档子集，跨文档问题只需一次 search。
+
+磁盘文件（与分报告索引位于同一目录）：
+- corpus_ids.npz     文档 id 列表、每个向量所属文档序号和文本块下标、来源签名、当前版本号；
+                     每次保存整体原子替换，作为指向当前版本的指针
+- corpus_generations/<版本号>/
+  - corpus.faiss       faiss 索引
+  - corpus_vectors.npy 全精度向量（仅量化索引保存），检索时以内存映射方式打开，
+                       用于对候选重打分，只有被访问的行会读入内存
+"""
+
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from src.vector_index import build_index, describe_encoding, make_search_params, read_index, rescore_top_k, set_search_params
+
+_log = logging.getLogger(__name__)
+
+
+class CorpusIndex:
+    INDEX_FILE = "corpus.faiss"
+    IDS_FILE = "corpus_ids.npz"
+    VECTORS_FILE = "corpus_vectors.npy"
+    GENERATIONS_DIR = "corpus_generations"
+    # 读取过程中版本被替换时重新读取的次数
+    LOAD_RETRIES = 3
+
+    def __init__(
+        self,
+        index: Optional[faiss.Index] = None,
+        doc_ids: Optional[List[str]] = None,
+        vector_doc: Optional[np.ndarray] = None,
+        vector_chunk: Optional[np.ndarray] = None,
+        signature: str = "",
+        full_vectors: Optional[np.ndarray] = None
+    ):
+        self.index = index
+        self.doc_ids: List[str] = list(doc_ids or [])
+        # 第 i 个向量所属文档在 doc_ids 中的序号，以及在该文档 chunks 中的下标
+        self.vector_doc = np.asarray(vector_doc if vector_doc is not None else [], dtype=np.int32)
+        self.vector_chunk = np.asarray(vector_chunk if vector_chunk is not None else [], dtype=np.int32)
+        # 生成索引时各报告内容的签名，用于判断是否需要重建
+        self.signature = signature
+        self.doc_ranges: Dict[str, List[Tuple[int, int]]] = self._compute_doc_ranges()
+        self.ef_search: Optional[int] = None
+        self.nprobe: Optional[int] = None
+        # 量化索引的全精度向量（构建时在内存中，加载时为内存映射），rescore_factor > 1 时用于重打分
+        self.full_vectors = full_vectors
+        self.rescore_factor = 0
+
+    def _compute_doc_ranges(self) -> Dict[str, List[Tuple[int, int]]]:
+        # 每个文档占用的向量 id 区间（左闭右开）；整体构建时每个文档恰好一段
+        ranges: Dict[str, List[Tuple[int, int]]] = {}
+        if len(self.vector_doc) == 0:
+            return ranges
+        boundaries = np.flatnonzero(np.diff(self.vector_doc)) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(self.vector_doc)]])
+        for start, end in zip(starts, ends):
+            doc_index = int(self.vector_doc[start])
+            if doc_index < 0:
+                continue
+            ranges.setdefault(self.doc_ids[doc_index], []).append((int(start), int(end)))
+        return ranges
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_ranges
+
+    def __len__(self) -> int:
+        return 0 if self.index is None else self.index.ntotal
+
+    @property
+    def document_ids(self) -> List[str]:
+        return list(self.doc_ranges.keys())
+
+    @property
+    def num_dead_vectors(self) -> int:
+        return int(np.count_nonzero(self.vector_doc < 0))
+
+    @classmethod
+    def build(
+        cls,
+        documents: Iterable[Tuple[str, np.ndarray, Sequence[int]]],
+        index_type: str = "auto",
+        memory_budget_mb: Optional[float] = None,
+        signature: str = "",
+        vector_encoding: str = "float32"
+    ) -> "CorpusIndex":
+        """由 (文档 id, 向量矩阵, 对应文本块下标) 序列一次性构建全语料索引"""
+        doc_ids, vectors, vector_doc, vector_chunk = [], [], [], []
+        for doc_id, embeddings, chunk_ids in documents:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if len(embeddings) != len(chunk_ids):
+                raise ValueError(f"文档 {doc_id} 的向量数 {len(embeddings)} 与文本块下标数 {len(chunk_ids)} 不一致")
+            if len(embeddings) == 0:
+                continue
+            vector_doc.append(np.full(len(embeddings), len(doc_ids), dtype=np.int32))
+            vector_chunk.append(np.asarray(chunk_ids, dtype=np.int32))
+            vectors.append(embeddings)
+            doc_ids.append(doc_id)
+        if not vectors:
+            return cls(signature=signature)
+        vectors = np.concatenate(vectors)
+        index = build_index(vectors, index_type=index_type, memory_budget_mb=memory_budget_mb, vector_encoding=vector_encoding)
+        # 有损索引保留一份全精度向量，保存后供重打分使用
+        full_vectors = vectors if describe_encoding(index) != "float32" else None
+        return cls(index, doc_ids, np.concatenate(vector_doc), np.concatenate(vector_chunk), signature, full_vectors)
+
+    def add_document(
+        self,
+        doc_id: str,
+        embeddings: np.ndarray,
+        chunk_ids: Sequence[int],
+        index_type: str = "auto",
+        vector_encoding: str = "float32"
+    ):
+        """增量添加一个文档；同名文档已存在时旧向量作废。首个文档决定索引类型（需训练的索引只用首批向量训练）"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) != len(chunk_ids):
+            raise ValueError(f"文档 {doc_id} 的向量数 {len(embeddings)} 与文本块下标数 {len(chunk_ids)} 不一致")
+        if doc_id in self.doc_ranges:
+            self.remove_document(doc_id)
+        if len(embeddings) == 0:
+            return
+        if self.index is None:
+            self.index = build_index(embeddings, index_type=index_type, vector_encoding=vector_encoding)
+            set_search_params(self.index, ef_search=self.ef_search, nprobe=self.nprobe)
+        else:
+            self.index.add(embeddings)
+        start = len(self.vector_doc)
+        self.doc_ids.append(doc_id)
+        self.vector_doc = np.concatenate([self.vector_doc, np.full(len(embeddings), len(self.doc_ids) - 1, dtype=np.int32)])
+        self.vector_chunk = np.concatenate([self.vector_chunk, np.asarray(chunk_ids, dtype=np.int32)])
+        self.doc_ranges[doc_id] = [(start, start + len(embeddings))]
+
+    def remove_document(self, doc_id: str):
+        # 不从 faiss 中物理删除（HNSW 不支持），仅标记作废，检索时由 ID 过滤器排除
+        for start, end in self.doc_ranges.pop(doc_id, []):
+            self.vector_doc[start:end] = -1
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None, rescore_factor: int = 0):
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.rescore_factor = rescore_factor
+        if self.index is not None:
+            set_search_params(self.index, ef_search=ef_search, nprobe=nprobe)
+
+    def _make_selector(self, doc_ids: Optional[Sequence[str]]) -> Tuple[Optional[faiss.IDSelector], int]:
+        """返回 (ID 过滤器, 可检索向量数)；不需要过滤时过滤器为 None"""
+        if doc_ids is None:
+            if self.num_dead_vectors == 0:
+                return None, len(self)
+            doc_ids = self.document_ids
+        ranges = sorted(r for doc_id in dict.fromkeys(doc_ids) for r in self.doc_ranges.get(doc_id, []))
+        count = sum(end - start for start, end in ranges)
+        if count == 0:
+            return None, 0
+        if count == len(self):
+            return None, count
+        if len(ranges) == 1:
+            return faiss.IDSelectorRange(ranges[0][0], ranges[0][1]), count
+        ids = np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in ranges])
+        return faiss.IDSelectorBatch(ids), count
+
+    def search(self, query_vectors: np.ndarray, k: int, doc_ids: Optional[Sequence[str]] = None) -> List[List[Tuple[str, int, float]]]:
+        """
+        在全语料索引中检索，doc_ids 为 None 时检索全部文档。
+        返回每条查询的 [(文档 id, 文本块下标, 相似度)]，按相似度降序。
+        """
+        query_vectors = np.ascontiguousarray(np.atleast_2d(query_vectors), dtype=np.float32)
+        selector, count = self._make_selector(doc_ids)
+        k = min(k, count)
+        if k <= 0:
+            return [[] for _ in range(len(query_vectors))]
+        params = make_search_params(self.index, selector, ef_search=self.ef_search, nprobe=self.nprobe)
+        if self.rescore_factor > 1 and self.full_vectors is not None:
+            # 量化索引多取候选，再用全精度向量精排
+            _, candidates = self.index.search(query_vectors, min(k * self.rescore_factor, count), params=params)
+            distances, indices = rescore_top_k(query_vectors, candidates, self.full_vectors, k)
+        else:
+            distances, indices = self.index.search(query_vectors, k, params=params)
+
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            hits = []
+            for distance, vector_id in zip(row_distances, row_indices):
+                # HNSW/IVF 在过滤较严格时可能返回不足 k 个结果，以 -1 填充
+                if vector_id < 0:
+                    continue
+                hits.append((self.doc_ids[self.vector_doc[vector_id]], int(self.vector_chunk[vector_id]), float(distance)))
+            results.append(hits)
+        return results
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        return (Path(directory) / cls.IDS_FILE).exists()
+
+    @staticmethod
+    def _read_generation(ids_path: Path) -> Optional[str]:
+        try:
+            with np.load(ids_path) as data:
+                return str(data["generation"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, directory: Path):
+        # 索引和全精度向量写入新的版本目录，最后原子替换 id 映射文件切换版本；
+        # 读取方按映射文件中记录的版本号打开索引，不会把新映射和旧索引配在一起
+        directory = Path(directory)
+        if self.index is None:
+            raise ValueError("语料索引为空，无法保存")
+        ids_path = directory / self.IDS_FILE
+        previous_generation = self._read_generation(ids_path)
+        generation = uuid.uuid4().hex
+        generation_dir = directory / self.GENERATIONS_DIR / generation
+        generation_dir.mkdir(parents=True)
+        tmp_ids_path = ids_path.with_name(f"{ids_path.name}.{generation}.tmp.npz")
+        try:
+            faiss.write_index(self.index, str(generation_dir / self.INDEX_FILE))
+            if self.full_vectors is not None:
+                np.save(generation_dir / self.VECTORS_FILE, np.asarray(self.full_vectors, dtype=np.float32))
+            np.savez(
+                tmp_ids_path,
+                doc_ids=np.array(self.doc_ids, dtype=np.str_),
+                vector_doc=self.vector_doc,
+                vector_chunk=self.vector_chunk,
+                signature=np.array(self.signature),
+                generation=np.array(generation),
+                has_full_vectors=np.array(self.full_vectors is not None)
+            )
+            os.replace(tmp_ids_path, ids_path)
+        except BaseException:
+            tmp_ids_path.unlink(missing_ok=True)
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            raise
+        # 已打开（内存映射）的旧版本文件在删除后仍可读；刚读到旧映射的读取方会重试
+        if previous_generation is not None:
+            shutil.rmtree(directory / self.GENERATIONS_DIR / previous_generation, ignore_errors=True)
+        # 旧版本布局直接放在目录下的索引文件
+        for legacy_path in (directory / self.INDEX_FILE, directory / self.VECTORS_FILE):
+            legacy_path.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = False) -> "CorpusIndex":
+        """加载已保存的语料索引；mmap=True 时索引以只读内存映射方式打开，不能再 add_document"""
+        directory = Path(directory)
+        for _ in range(cls.LOAD_RETRIES):
+            with np.load(directory / cls.IDS_FILE) as data:
+                if "generation" not in data:
+                    raise ValueError("语料索引为旧版本格式，需要重建")
+                generation = str(data["generation"])
+                has_full_vectors = bool(data["has_full_vectors"])
+                doc_ids = data["doc_ids"].tolist()
+                vector_doc, vector_chunk = data["vector_doc"], data["vector_chunk"]
+                signature = str(data["signature"])
+            generation_dir = directory / cls.GENERATIONS_DIR / generation
+            try:
+                index = read_index(generation_dir / cls.INDEX_FILE, mmap=mmap)
+                full_vectors = np.load(generation_dir / cls.VECTORS_FILE, mmap_mode="r") if has_full_vectors else None
+            except (RuntimeError, OSError):
+                if generation_dir.exists():
+                    raise
+                # 读到映射后该版本已被新的保存替换并清理，重新读取映射
+                _log.info(f"语料索引版本 {generation} 已被替换，重新读取")
+                continue
+            corpus = cls(index, doc_ids, vector_doc, vector_chunk, signature, full_vectors)
+            if len(corpus.vector_doc) != index.ntotal:
+                raise ValueError(f"语料索引与 id 映射不一致: {index.ntotal} 条向量, {len(corpus.vector_doc)} 条映射")
+            return corpus
+        raise ValueError(f"语料索引在读取过程中被连续替换 {cls.LOAD_RETRIES} 次: {directory}")
+
+    @staticmethod
+    def read_signature(directory: Path) -> Optional[str]:
+        """只读取已保存索引的来源签名，不加载向量；旧版本格式返回 None 以触发重建"""
+        ids_path = Path(directory) / CorpusIndex.IDS_FILE
+        if not ids_path.exists():
+            return None
+        try:
+            with np.load(ids_path) as data:
+                if "generation" not in data:
+                    return None
+                return str(data["signature"])
+        except (OSError, KeyError, ValueError):
+            return None
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 from typing import List, Dict, Tuple, Optional, Union
@@ -6,17 +7,51 @@ import faiss
 import numpy as np
 import hashlib
 import time
+import uuid
 
+from src import async_http
+from src.api_endpoints import configure_dashscope
 from src.reranking import LLMReranker
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.retrieval_cache import RetrievalCache, get_retrieval_cache, normalize_query
+from src.corpus_index import CorpusIndex
+from src.local_embedding import LocalEmbedder
 
 _log = logging.getLogger(__name__)
 
 class DynamicVectorRetriever:
-    def __init__(self, embedding_provider: str = "dashscope"):
+    EMBEDDING_MODELS = {
+        "openai": "text-embedding-3-large",
+        "dashscope": "text-embedding-v1"
+    }
+    # 异步批量嵌入时每次请求的条数（DashScope text-embedding-v1 单次最多 25 条）
+    EMBEDDING_BATCH_SIZE = 25
+
+    def __init__(
+        self,
+        embedding_provider: str = "dashscope",
+        embedding_cache: Optional[EmbeddingCache] = None,
+        index_type: str = "auto",
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        vector_encoding: str = "float32",
+        result_cache: Optional[RetrievalCache] = None
+    ):
         self.embedding_provider = embedding_provider.lower()
+        self.index_type = index_type
+        # 向量编码：float32/fp16/sq8，每个会话的索引常驻内存，量化可显著降低占用
+        self.vector_encoding = vector_encoding
+        self.ef_search = ef_search
+        self.nprobe = nprobe
         self.documents: Dict[str, dict] = {}
-        self.vector_dbs: Dict[str, faiss.Index] = {}
+        # 所有文档共用一个索引，按文档 id 过滤检索
+        self.corpus_index = self._create_corpus_index()
         self._initialize_embedding_client()
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        # 检索结果缓存：每个实例独立命名空间，添加文档或清空时递增索引版本
+        self.result_cache = result_cache if result_cache is not None else get_retrieval_cache()
+        self._cache_namespace = uuid.uuid4().hex
+        self.index_version = 0
 
     def _initialize_embedding_client(self):
         from dotenv import load_dotenv
@@ -27,13 +62,47 @@ class DynamicVectorRetriever:
             from openai import OpenAI
             self.llm = OpenAI(timeout=None, max_retries=2)
         elif self.embedding_provider == "dashscope":
-            import dashscope
-            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+            configure_dashscope()
+            self.llm = None
+        elif self.embedding_provider == "local":
+            # 会话内的文档没有预先拟合的 IDF，使用纯 TF 的本地嵌入
+            self.local_embedder = LocalEmbedder()
             self.llm = None
         else:
             raise ValueError(f"不支持的 embedding provider: {self.embedding_provider}")
 
+    @property
+    def embedding_model(self) -> str:
+        if self.embedding_provider == "local":
+            return self.local_embedder.model_name
+        return self.EMBEDDING_MODELS[self.embedding_provider]
+
     def _get_embedding(self, text: str) -> List[float]:
+        return self._get_embeddings([text])[0]
+
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 批量查询缓存，只对未命中的文本调用API（本地嵌入整批计算），最后统一落盘
+        if self.embedding_provider == "local":
+            compute = lambda missing: self.local_embedder.embed(missing).tolist()
+        else:
+            compute = lambda missing: [self._request_embedding(t) for t in missing]
+        return self.embedding_cache.get_or_compute(self.embedding_provider, self.embedding_model, texts, compute)
+
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_provider == "local":
+            return self._get_embeddings(texts)
+        return await self.embedding_cache.aget_or_compute(self.embedding_provider, self.embedding_model, texts, self._arequest_embeddings)
+
+    async def _arequest_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_provider == "openai":
+            request = lambda batch: async_http.openai_embeddings("text-embedding-3-large", batch)
+        else:
+            request = lambda batch: async_http.dashscope_embeddings("text-embedding-v1", batch)
+        batches = [texts[i:i + self.EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), self.EMBEDDING_BATCH_SIZE)]
+        results = await asyncio.gather(*(request(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    def _request_embedding(self, text: str) -> List[float]:
         if self.embedding_provider == "openai":
             embedding = self.llm.embeddings.create(
                 input=text,
@@ -54,12 +123,10 @@ class DynamicVectorRetriever:
             else:
                 raise RuntimeError(f"DashScope embedding API返回格式异常: {rsp}")
 
-    def _create_vector_db(self, embeddings: List[List[float]]) -> faiss.Index:
-        embeddings_array = np.array(embeddings, dtype=np.float32)
-        dimension = len(embeddings[0])
-        index = faiss.IndexFlatIP(dimension)
-        index.add(embeddings_array)
-        return index
+    def _create_corpus_index(self) -> CorpusIndex:
+        corpus_index = CorpusIndex()
+        corpus_index.set_search_params(ef_search=self.ef_search, nprobe=self.nprobe)
+        return corpus_index
 
     def add_document(self, document_id: str, document: dict) -> None:
         chunks = document.get("content", {}).get("chunks", [])
@@ -67,22 +134,25 @@ class DynamicVectorRetriever:
             _log.warning(f"文档 {document_id} 没有内容块")
             return
 
-        texts = [chunk.get("text", "") for chunk in chunks]
-        texts = [t[:2048] for t in texts if t]
+        # 记录参与嵌入的文本块下标，检索结果据此映射回原始 chunks
+        chunk_ids = [i for i, chunk in enumerate(chunks) if chunk.get("text", "").strip()]
+        texts = [chunks[i]["text"][:2048] for i in chunk_ids]
 
         if not texts:
             _log.warning(f"文档 {document_id} 没有有效文本内容")
             return
 
-        embeddings = []
-        for text in texts:
-            emb = self._get_embedding(text)
-            embeddings.append(emb)
-
-        index = self._create_vector_db(embeddings)
+        embeddings = self._get_embeddings(texts)
 
+        self.corpus_index.add_document(
+            document_id,
+            np.array(embeddings, dtype=np.float32),
+            chunk_ids,
+            index_type=self.index_type,
+            vector_encoding=self.vector_encoding
+        )
         self.documents[document_id] = document
-        self.vector_dbs[document_id] = index
+        self.index_version += 1
         _log.info(f"文档 {document_id} 已添加，包含 {len(chunks)} 个分块")
 
     def retrieve(
@@ -92,39 +162,51 @@ class DynamicVectorRetriever:
         top_n: int = 5
     ) -> List[Dict]:
         if document_ids is None:
-            document_ids = list(self.vector_dbs.keys())
+            document_ids = self.corpus_index.document_ids
 
         if not document_ids:
             raise ValueError("没有可检索的文档")
 
-        query_embedding = self._get_embedding(query)
-        query_array = np.array([query_embedding], dtype=np.float32)
+        key = ("dynamic", self._cache_namespace, tuple(sorted(set(document_ids))), normalize_query(query), top_n)
+        return self.result_cache.get_or_compute(key, self.index_version, lambda: self._search(self._get_embedding(query), document_ids, top_n))
 
-        all_results = []
+    async def aretrieve(
+        self,
+        query: str,
+        document_ids: Optional[List[str]] = None,
+        top_n: int = 5
+    ) -> List[Dict]:
+        """retrieve 的异步版本：查询嵌入走异步请求，索引检索在线程中执行"""
+        if document_ids is None:
+            document_ids = self.corpus_index.document_ids
 
-        for doc_id in document_ids:
-            if doc_id not in self.vector_dbs:
-                continue
+        if not document_ids:
+            raise ValueError("没有可检索的文档")
+
+        async def compute():
+            query_embedding = (await self._aget_embeddings([query]))[0]
+            return await asyncio.to_thread(self._search, query_embedding, document_ids, top_n)
 
-            index = self.vector_dbs[doc_id]
-            document = self.documents[doc_id]
-            chunks = document.get("content", {}).get("chunks", [])
+        key = ("dynamic", self._cache_namespace, tuple(sorted(set(document_ids))), normalize_query(query), top_n)
+        return await self.result_cache.aget_or_compute(key, self.index_version, compute)
 
-            distances, indices = index.search(query_array, min(top_n, len(chunks)))
+    def _search(self, query_embedding: List[float], document_ids: List[str], top_n: int) -> List[Dict]:
+        query_array = np.array([query_embedding], dtype=np.float32)
 
-            for distance, idx in zip(distances[0], indices[0]):
-                if idx < len(chunks):
-                    chunk = chunks[idx]
-                    result = {
-                        "distance": round(float(distance), 4),
-                        "document_id": doc_id,
-                        "page": chunk.get("page", 0),
-                        "text": chunk.get("text", "")
-                    }
-                    all_results.append(result)
+        # 一次检索覆盖所有目标文档，结果已按相似度降序
+        hits = self.corpus_index.search(query_array, top_n, doc_ids=document_ids)[0]
 
-        all_results.sort(key=lambda x: x["distance"], reverse=True)
-        return all_results[:top_n]
+        all_results = []
+        for doc_id, chunk_id, distance in hits:
+            chunk = self.documents[doc_id].get("content", {}).get("chunks", [])[chunk_id]
+            result = {
+                "distance": round(float(distance), 4),
+                "document_id": doc_id,
+                "page": chunk.get("page", 0),
+                "text": chunk.get("text", "")
+            }
+            all_results.append(result)
+        return all_results
 
     def get_all_documents(self) -> List[dict]:
         return list(self.documents.values())
@@ -134,12 +216,13 @@ class DynamicVectorRetriever:
 
     def clear(self) -> None:
         self.documents.clear()
-        self.vector_dbs.clear()
+        self.corpus_index = self._create_corpus_index()
+        self.index_version += 1
 
 
 class DynamicHybridRetriever:
-    def __init__(self, embedding_provider: str = "dashscope"):
-        self.vector_retriever = DynamicVectorRetriever(embedding_provider)
+    def __init__(self, embedding_provider: str = "dashscope", vector_encoding: str = "float32"):
+        self.vector_retriever = DynamicVectorRetriever(embedding_provider, vector_encoding=vector_encoding)
         self.reranker = LLMReranker()
 
     def retrieve(
@@ -151,7 +234,7 @@ class DynamicHybridRetriever:
         llm_weight: float = 0.7
     ) -> List[Dict]:
         if document_ids is None:
-            document_ids = list(self.vector_retriever.vector_dbs.keys())
+            document_ids = self.vector_retriever.corpus_index.document_ids
 
         if not document_ids:
             return []
@@ -174,6 +257,38 @@ class DynamicHybridRetriever:
 
         return reranked_results[:top_n]
 
+    async def aretrieve(
+        self,
+        query: str,
+        document_ids: Optional[List[str]] = None,
+        llm_reranking_sample_size: int = 20,
+        top_n: int = 5,
+        llm_weight: float = 0.7
+    ) -> List[Dict]:
+        if document_ids is None:
+            document_ids = self.vector_retriever.corpus_index.document_ids
+
+        if not document_ids:
+            return []
+
+        vector_results = await self.vector_retriever.aretrieve(
+            query=query,
+            document_ids=document_ids,
+            top_n=llm_reranking_sample_size
+        )
+
+        if not vector_results:
+            return []
+
+        reranked_results = await self.reranker.arerank_documents(
+            query=query,
+            documents=vector_results,
+            documents_batch_size=10,
+            llm_weight=llm_weight
+        )
+
+        return reranked_results[:top_n]
+
     def add_document(self, document_id: str, document: dict) -> None:
         self.vector_retriever.add_document(document_id, document)
 
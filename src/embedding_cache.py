@@ -0,0 +1,372 @@
+"""
+EMBEDDING CACHE
+
+按内容寻址的持久化嵌入缓存，供入库（VectorDBIngestor）和检索（VectorRetriever、DynamicVectorRetriever）共用。
+
+存储结构（每个 provider + model 一个命名空间目录）：
+- vectors.f32  float32 向量按行追加，检索时以内存映射方式读取
+- keys.bin     每行对应文本的 sha1 摘要（20 字节），与 vectors.f32 行号一一对应
+- access.f64   每行最近一次访问时间，用于按容量淘汰（LRU）
+- meta.json    向量维度和代数（compaction 后递增，其他进程据此重新加载）
+
+写入只追加，并通过锁文件保证多进程安全；超过 max_entries 时保留最近使用的条目并重写文件。
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+_KEY_BYTES = 20  # sha1 摘要长度
+# 命中时只更新内存中的访问时间，access.f64 最多每隔该秒数整体重写一次（退出时总会写入）
+ACCESS_WRITE_INTERVAL = 60.0
+
+
+class _FileLock:
+    """基于 O_EXCL 创建锁文件的跨平台进程锁"""
+
+    def __init__(self, path: Path, timeout: float = 60.0, stale_after: float = 300.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(str(self.path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except FileExistsError:
+                # 持锁进程崩溃时锁文件会残留，超过 stale_after 视为失效
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_after:
+                        self.path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"等待嵌入缓存锁超时: {self.path}")
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _CacheSegment:
+    """单个 (provider, model) 命名空间的缓存数据"""
+
+    def __init__(self, directory: Path, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = directory / "vectors.f32"
+        self.keys_path = directory / "keys.bin"
+        self.access_path = directory / "access.f64"
+        self.meta_path = directory / "meta.json"
+        self.lock_path = directory / ".lock"
+
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self.rows: Dict[bytes, int] = {}
+        self.access = np.zeros(0, dtype=np.float64)
+        self.vectors: Optional[np.ndarray] = None
+        self.pending: Dict[bytes, np.ndarray] = {}
+        self.access_dirty = False
+        self.access_written_at = time.monotonic()
+        self._load()
+
+    def _read_meta(self) -> dict:
+        if not self.meta_path.exists():
+            return {}
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim, "generation": self.generation}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _on_disk_rows(self) -> int:
+        # 以 keys 和 vectors 中较短者为准，容忍写入中断留下的残缺行
+        if self.dim is None or not self.keys_path.exists() or not self.vectors_path.exists():
+            return 0
+        n_keys = self.keys_path.stat().st_size // _KEY_BYTES
+        n_vectors = self.vectors_path.stat().st_size // (4 * self.dim)
+        return min(n_keys, n_vectors)
+
+    def _open_vectors(self, n_rows: int):
+        self.vectors = None
+        if n_rows > 0:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+
+    def _load(self):
+        meta = self._read_meta()
+        self.dim = meta.get("dim")
+        self.generation = meta.get("generation", 0)
+        self.rows = {}
+        n_rows = self._on_disk_rows()
+        if n_rows > 0:
+            keys = np.fromfile(self.keys_path, dtype=f"S{_KEY_BYTES}", count=n_rows)
+            self.rows = {key: row for row, key in enumerate(keys.tolist())}
+        access = np.zeros(n_rows, dtype=np.float64)
+        if self.access_path.exists():
+            stored = np.fromfile(self.access_path, dtype=np.float64)[:n_rows]
+            access[:len(stored)] = stored
+        self.access = access
+        self._open_vectors(n_rows)
+
+    def _sync_from_disk(self):
+        """合并其他进程追加的条目；若发生过 compaction 则整体重新加载"""
+        meta = self._read_meta()
+        if meta.get("generation", 0) != self.generation:
+            self._load()
+            return
+        if self.dim is None:
+            self.dim = meta.get("dim")
+        n_rows = self._on_disk_rows()
+        known_rows = len(self.access)
+        if n_rows > known_rows:
+            with open(self.keys_path, 'rb') as f:
+                f.seek(known_rows * _KEY_BYTES)
+                new_keys = np.frombuffer(f.read((n_rows - known_rows) * _KEY_BYTES), dtype=f"S{_KEY_BYTES}")
+            for offset, key in enumerate(new_keys.tolist()):
+                self.rows[key] = known_rows + offset
+            self.access = np.concatenate([self.access, np.zeros(n_rows - known_rows, dtype=np.float64)])
+            self._open_vectors(n_rows)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self.pending.get(key)
+        if vector is not None:
+            return vector
+        row = self.rows.get(key)
+        if row is None or self.vectors is None:
+            return None
+        self.access[row] = time.time()
+        self.access_dirty = True
+        return np.array(self.vectors[row])
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if self.dim is None:
+            self.dim = int(vector.shape[0])
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"嵌入维度不一致: 缓存为 {self.dim}，写入为 {vector.shape[0]}")
+        if key not in self.rows:
+            self.pending[key] = vector
+
+    def flush(self, write_access: bool = True):
+        """
+        追加新条目。write_access 为 False 时，命中产生的访问时间只在距上次写入超过
+        ACCESS_WRITE_INTERVAL 秒时才整体重写 access.f64，新条目的访问时间直接追加。
+        """
+        rewrite_access = self.access_dirty and (
+            write_access or time.monotonic() - self.access_written_at >= ACCESS_WRITE_INTERVAL
+        )
+        if not self.pending and not rewrite_access:
+            return
+        with _FileLock(self.lock_path):
+            self._sync_from_disk()
+            new_items = [(k, v) for k, v in self.pending.items() if k not in self.rows]
+            if new_items:
+                start_row = len(self.access)
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.stack([v for _, v in new_items]).astype(np.float32).tobytes())
+                with open(self.keys_path, 'ab') as f:
+                    f.write(b"".join(k for k, _ in new_items))
+                now = time.time()
+                for offset, (key, _) in enumerate(new_items):
+                    self.rows[key] = start_row + offset
+                new_access = np.full(len(new_items), now)
+                self.access = np.concatenate([self.access, new_access])
+                self._open_vectors(len(self.access))
+                access_rows = self.access_path.stat().st_size // 8 if self.access_path.exists() else 0
+                if access_rows == start_row and not rewrite_access:
+                    with open(self.access_path, 'ab') as f:
+                        f.write(new_access.tobytes())
+                else:
+                    # access.f64 行数与 keys 不一致（旧版本或写入中断）时整体重写
+                    rewrite_access = True
+            self.pending.clear()
+            if len(self.access) > self.max_entries:
+                # compaction 会重写全部文件，包括 access.f64
+                self._compact()
+            elif rewrite_access:
+                # 访问时间与磁盘上的记录取较大值，避免覆盖其他进程的访问记录
+                if self.access_path.exists():
+                    stored = np.fromfile(self.access_path, dtype=np.float64)[:len(self.access)]
+                    self.access[:len(stored)] = np.maximum(self.access[:len(stored)], stored)
+                self.access.tofile(self.access_path)
+            else:
+                self._write_meta()
+                return
+            self.access_dirty = False
+            self.access_written_at = time.monotonic()
+            self._write_meta()
+
+    def _compact(self):
+        """按最近访问时间保留约 90% 容量的条目，重写全部文件"""
+        keep_count = int(self.max_entries * 0.9)
+        keep_rows = np.sort(np.argsort(-self.access, kind='stable')[:keep_count])
+        keys_by_row = [None] * len(self.access)
+        for key, row in self.rows.items():
+            keys_by_row[row] = key
+        kept_vectors = np.array(self.vectors[keep_rows], dtype=np.float32)
+        kept_keys = [keys_by_row[row] for row in keep_rows]
+        kept_access = self.access[keep_rows]
+        self.vectors = None  # 先释放内存映射，Windows 下才能替换文件
+
+        for path, payload in (
+            (self.vectors_path, kept_vectors.tobytes()),
+            (self.keys_path, b"".join(kept_keys)),
+            (self.access_path, kept_access.tobytes()),
+        ):
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+        evicted = len(self.access) - len(kept_keys)
+        self.generation += 1
+        self.rows = {key: row for row, key in enumerate(kept_keys)}
+        self.access = kept_access
+        self._open_vectors(len(kept_keys))
+        _log.info(f"嵌入缓存淘汰 {evicted} 条，剩余 {len(kept_keys)} 条: {self.directory}")
+
+
+class EmbeddingCache:
+    """
+    以 (provider, model, sha1(text)) 为键的嵌入缓存。
+    典型用法：cache.get_or_compute(provider, model, texts, compute_fn)，只有未命中的文本会交给 compute_fn。
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_entries: int = 500_000):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._segments: Dict[str, _CacheSegment] = {}
+        self._lock = threading.RLock()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def _segment(self, provider: str, model: str) -> _CacheSegment:
+        name = re.sub(r'[^0-9A-Za-z._-]+', '_', f"{provider}__{model}")
+        if name not in self._segments:
+            self._segments[name] = _CacheSegment(self.cache_dir / name, self.max_entries)
+        return self._segments[name]
+
+    def get_many(self, provider: str, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        with self._lock:
+            segment = self._segment(provider, model)
+            keys = [self._key(text) for text in texts]
+            # 有未命中时先合并其他进程已写入的条目（仅需检查文件大小）
+            if any(key not in segment.rows and key not in segment.pending for key in keys):
+                segment._sync_from_disk()
+            results = []
+            for key in keys:
+                vector = segment.get(key)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(vector.tolist())
+            return results
+
+    def put_many(self, provider: str, model: str, texts: List[str], embeddings: List[List[float]]):
+        with self._lock:
+            segment = self._segment(provider, model)
+            for text, embedding in zip(texts, embeddings):
+                segment.put(self._key(text), np.asarray(embedding, dtype=np.float32))
+
+    def get_or_compute(
+        self,
+        provider: str,
+        model: str,
+        texts: List[str],
+        compute_fn: Callable[[List[str]], List[List[float]]],
+        flush: bool = True
+    ) -> List[List[float]]:
+        """返回与 texts 同序的向量，未命中的文本（去重后）调用 compute_fn 计算并写入缓存"""
+        results = self.get_many(provider, model, texts)
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing_texts:
+            computed = compute_fn(missing_texts)
+            self.put_many(provider, model, missing_texts, computed)
+            by_text = dict(zip(missing_texts, computed))
+            results = [by_text[text] if vector is None else vector for text, vector in zip(texts, results)]
+            if flush:
+                self.flush(write_access=False)
+        return results
+
+    async def aget_or_compute(
+        self,
+        provider: str,
+        model: str,
+        texts: List[str],
+        compute_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        flush: bool = True
+    ) -> List[List[float]]:
+        """get_or_compute 的异步版本，compute_fn 为协程函数，落盘在线程中执行"""
+        results = self.get_many(provider, model, texts)
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing_texts:
+            computed = await compute_fn(missing_texts)
+            self.put_many(provider, model, missing_texts, computed)
+            by_text = dict(zip(missing_texts, computed))
+            results = [by_text[text] if vector is None else vector for text, vector in zip(texts, results)]
+            if flush:
+                await asyncio.to_thread(self.flush, False)
+        return results
+
+    def flush(self, write_access: bool = True):
+        """写入新条目；write_access 为 False 时访问时间按 ACCESS_WRITE_INTERVAL 批量写入"""
+        with self._lock:
+            for segment in self._segments.values():
+                if segment.pending or segment.dim is not None:
+                    try:
+                        segment.flush(write_access)
+                    except Exception as e:
+                        _log.error(f"嵌入缓存写入失败 {segment.directory}: {e}")
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": sum(len(s.rows) + len(s.pending) for s in self._segments.values())
+        }
+
+
+_default_caches: Dict[Path, EmbeddingCache] = {}
+_default_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(cache_dir: Optional[Union[str, Path]] = None) -> EmbeddingCache:
+    """返回进程内共享的缓存实例，默认目录可通过环境变量 EMBEDDING_CACHE_DIR 配置"""
+    if cache_dir is None:
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+    cache_dir = Path(cache_dir).resolve()
+    with _default_caches_lock:
+        if cache_dir not in _default_caches:
+            _default_caches[cache_dir] = EmbeddingCache(cache_dir)
+        return _default_caches[cache_dir]
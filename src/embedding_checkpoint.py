@@ -0,0 +1,117 @@
+"""
+EMBEDDING CHECKPOINT
+
+单份报告嵌入任务的断点续传检查点。
+
+嵌入调度器每完成一个批次就把向量追加写入 <向量库目录>/checkpoints/<sha1>.ckpt 并 fsync；
+入库中途失败（接口限流、网络中断、进程被杀）后重跑同一份报告时，已完成的批次直接从检查点读取，
+只有缺失的文本重新请求接口。报告的 faiss 文件写入成功后删除检查点。
+
+文件格式（小端）：
+- 头部：MAGIC、uint32 头部长度、头部 JSON（content_hash、embedding_model）
+- 记录：uint32 条数 n、uint32 维度 d、n 个 20 字节 sha1(text)、n×d 个 float32
+按文本哈希而不是位置索引，嵌入缓存命中情况变化后仍可复用。
+头部与当前报告内容或嵌入模型不一致时检查点作废；末尾不完整的记录（写入时中断）被截断丢弃。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+_MAGIC = b"ECKP1\n"
+_UINT32 = struct.Struct("<I")
+_RECORD_HEADER = struct.Struct("<II")
+_KEY_SIZE = 20
+
+
+class EmbeddingCheckpoint:
+    DIR_NAME = "checkpoints"
+
+    def __init__(self, output_dir: Path, sha1: str, content_hash: str, embedding_model: str):
+        self.path = Path(output_dir) / self.DIR_NAME / f"{sha1}.ckpt"
+        self.header = {"content_hash": content_hash, "embedding_model": embedding_model}
+        self._vectors: Dict[bytes, np.ndarray] = {}
+        self._loaded = False
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._vectors)
+
+    def _write_header(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = json.dumps(self.header, sort_keys=True).encode("utf-8")
+        with open(self.path, "wb") as f:
+            f.write(_MAGIC + _UINT32.pack(len(header)) + header)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self) -> Dict[bytes, np.ndarray]:
+        """读取已完成的向量（sha1(text) -> 向量）；检查点不存在或已作废时返回空"""
+        if self._loaded:
+            return self._vectors
+        self._loaded = True
+        if not self.path.exists():
+            return self._vectors
+        data = self.path.read_bytes()
+        offset = len(_MAGIC) + _UINT32.size
+        if not data.startswith(_MAGIC) or len(data) < offset:
+            _log.warning(f"嵌入检查点格式无效，已丢弃: {self.path}")
+            self.remove()
+            return self._vectors
+        (header_size,) = _UINT32.unpack_from(data, len(_MAGIC))
+        try:
+            header = json.loads(data[offset:offset + header_size].decode("utf-8"))
+        except ValueError:
+            header = None
+        if header != self.header:
+            _log.info(f"报告内容或嵌入模型已变化，丢弃嵌入检查点: {self.path.name}")
+            self.remove()
+            return self._vectors
+        offset += header_size
+        while offset + _RECORD_HEADER.size <= len(data):
+            count, dim = _RECORD_HEADER.unpack_from(data, offset)
+            end = offset + _RECORD_HEADER.size + count * (_KEY_SIZE + 4 * dim)
+            if end > len(data):
+                break
+            keys_start = offset + _RECORD_HEADER.size
+            vectors = np.frombuffer(data, dtype="<f4", count=count * dim, offset=keys_start + count * _KEY_SIZE)
+            for i, vector in enumerate(vectors.reshape(count, dim)):
+                self._vectors[data[keys_start + i * _KEY_SIZE:keys_start + (i + 1) * _KEY_SIZE]] = vector
+            offset = end
+        if offset < len(data):
+            # 最后一条记录写入时被中断，截断后继续追加
+            _log.warning(f"嵌入检查点末尾记录不完整，已截断: {self.path.name}")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        return self._vectors
+
+    def append(self, texts: Sequence[str], embeddings: List[List[float]]):
+        """追加一个已完成批次，写入磁盘后才返回"""
+        self.load()
+        if not self.path.exists():
+            self._write_header()
+        vectors = np.asarray(embeddings, dtype="<f4")
+        keys = [self.key(text) for text in texts]
+        with open(self.path, "ab") as f:
+            f.write(_RECORD_HEADER.pack(len(keys), vectors.shape[1]) + b"".join(keys) + vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        for key, vector in zip(keys, vectors):
+            self._vectors[key] = vector
+
+    def remove(self):
+        self._vectors = {}
+        if self.path.exists():
+            self.path.unlink()
@@ -0,0 +1,219 @@
+"""
+EMBEDDING DISPATCHER
+
+并发、限流的嵌入请求调度器，供 VectorDBIngestor 等批量嵌入场景使用。
+
+功能：
+- 按条数和 token 数双重上限切分批次
+- 同时保持多个批次在途（线程池，DashScope SDK 为同步调用）
+- 按每分钟请求数（QPM）和每分钟 token 数（TPM）限流
+- 单批次失败自动重试，结果按原始顺序返回
+- 每个批次完成后回调 on_batch（用于断点续传检查点）；个别批次最终失败不影响其他批次，
+  全部批次结束后统一抛出 EmbeddingBatchError
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import tiktoken
+from tenacity import retry, stop_after_attempt, wait_fixed
+
+_log = logging.getLogger(__name__)
+
+
+class EmbeddingBatchError(RuntimeError):
+    """部分批次重试后仍失败；其余批次已完成并通过 on_batch 交付"""
+
+    def __init__(self, failed_indices: List[int], errors: List[BaseException], num_texts: int):
+        self.failed_indices = failed_indices
+        self.errors = errors
+        super().__init__(
+            f"{len(errors)} 个嵌入批次失败（{len(failed_indices)}/{num_texts} 条文本），"
+            f"首个错误: {type(errors[0]).__name__}: {errors[0]}"
+        )
+
+
+@dataclass
+class DispatchStats:
+    """记录一次调度的批次数、token 数和限流等待时间"""
+
+    num_batches: int = 0
+    num_texts: int = 0
+    num_tokens: int = 0
+    seconds_waiting_for_capacity: float = 0.0
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限流器，同时约束 QPM 和 TPM。
+    容量按时间线性恢复，上限为每分钟配额（与 api_request_parallel_processor 的算法一致）。
+    """
+
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = max_requests_per_minute
+        self.available_token_capacity = max_tokens_per_minute
+        self.last_update_time = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        current_time = time.time()
+        seconds_since_update = current_time - self.last_update_time
+        self.available_request_capacity = min(
+            self.available_request_capacity + self.max_requests_per_minute * seconds_since_update / 60.0,
+            self.max_requests_per_minute,
+        )
+        self.available_token_capacity = min(
+            self.available_token_capacity + self.max_tokens_per_minute * seconds_since_update / 60.0,
+            self.max_tokens_per_minute,
+        )
+        self.last_update_time = current_time
+
+    def acquire(self, num_tokens: int) -> float:
+        """阻塞直到有足够容量发出一个请求，返回等待的秒数"""
+        # 单个请求超过 TPM 上限时按上限扣减，避免永远等待
+        num_tokens = min(num_tokens, self.max_tokens_per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available_request_capacity >= 1 and self.available_token_capacity >= num_tokens:
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= num_tokens
+                    return waited
+                # 估算补足容量所需时间
+                request_deficit = max(0.0, 1 - self.available_request_capacity)
+                token_deficit = max(0.0, num_tokens - self.available_token_capacity)
+                sleep_seconds = max(
+                    request_deficit * 60.0 / self.max_requests_per_minute,
+                    token_deficit * 60.0 / self.max_tokens_per_minute,
+                    0.001,
+                )
+            time.sleep(sleep_seconds)
+            waited += sleep_seconds
+
+
+class EmbeddingDispatcher:
+    """
+    将文本列表切分为批次并发送给嵌入函数。
+    embed_batch_fn 接收一个字符串列表，返回等长、同序的向量列表。
+    """
+
+    def __init__(
+        self,
+        embed_batch_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 25,
+        max_batch_tokens: int = 20_000,
+        max_in_flight: int = 4,
+        max_requests_per_minute: float = 1_200,
+        max_tokens_per_minute: float = 1_000_000,
+        max_attempts: int = 2,
+        seconds_between_attempts: float = 20,
+        token_encoding_name: str = "cl100k_base",
+    ):
+        self.embed_batch_fn = embed_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_in_flight = max(1, max_in_flight)
+        self.rate_limiter = RateLimiter(max_requests_per_minute, max_tokens_per_minute)
+        self.token_encoding_name = token_encoding_name
+        self._encoding = None
+        self.last_stats = DispatchStats()
+        self._stats_lock = threading.Lock()
+        # 单批次重试，失败的批次不会影响其他在途批次
+        self._call_with_retry = retry(
+            wait=wait_fixed(seconds_between_attempts),
+            stop=stop_after_attempt(max_attempts),
+            reraise=True,
+        )(self._call_batch)
+
+    def count_tokens(self, text: str) -> int:
+        # 编码表首次使用时再加载，避免构造调度器时就触发下载
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(self.token_encoding_name)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def make_batches(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[int]]:
+        """按条数和 token 数上限切分批次，返回每个批次对应的原始下标"""
+        if token_counts is None:
+            token_counts = [self.count_tokens(t) for t in texts]
+        batches = []
+        current, current_tokens = [], 0
+        for i, n_tokens in enumerate(token_counts):
+            if current and (len(current) >= self.max_batch_size or current_tokens + n_tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _call_batch(self, batch: List[str], num_tokens: int) -> List[List[float]]:
+        waited = self.rate_limiter.acquire(num_tokens)
+        # 多个工作线程同时累加等待时间
+        with self._stats_lock:
+            self.last_stats.seconds_waiting_for_capacity += waited
+        embeddings = self.embed_batch_fn(batch)
+        # 预分配的结果列表长度总是正确，还要检查每个位置都有向量
+        if len(embeddings) != len(batch) or any(embedding is None for embedding in embeddings):
+            missing = len(batch) - sum(embedding is not None for embedding in embeddings)
+            raise RuntimeError(f"嵌入结果数量不匹配: 期望 {len(batch)}，实际 {len(embeddings)}，缺失 {missing}")
+        return embeddings
+
+    def embed(
+        self,
+        texts: List[str],
+        on_batch: Optional[Callable[[Sequence[int], List[List[float]]], None]] = None
+    ) -> List[List[float]]:
+        """
+        并发嵌入全部文本，结果与输入顺序一致。
+        on_batch(indices, embeddings) 在调用线程中按完成顺序对每个成功批次调用一次，indices 为 texts 中的下标。
+        """
+        if not texts:
+            return []
+        token_counts = [self.count_tokens(t) for t in texts]
+        batches = self.make_batches(texts, token_counts)
+        self.last_stats = DispatchStats(
+            num_batches=len(batches),
+            num_texts=len(texts),
+            num_tokens=sum(token_counts),
+        )
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as executor:
+            future_to_batch = {
+                executor.submit(
+                    self._call_with_retry,
+                    [texts[i] for i in batch],
+                    sum(token_counts[i] for i in batch),
+                ): batch
+                for batch in batches
+            }
+            failed_indices, errors = [], []
+            for future in as_completed(future_to_batch):
+                batch = future_to_batch[future]
+                try:
+                    embeddings = future.result()
+                except Exception as e:
+                    failed_indices.extend(batch)
+                    errors.append(e)
+                    continue
+                for i, embedding in zip(batch, embeddings):
+                    results[i] = embedding
+                if on_batch is not None:
+                    on_batch(batch, embeddings)
+
+        if errors:
+            raise EmbeddingBatchError(sorted(failed_indices), errors, len(texts))
+
+        _log.info(
+            f"嵌入完成: {len(texts)} 条文本, {len(batches)} 个批次, "
+            f"{self.last_stats.num_tokens} tokens, 限流等待 {self.last_stats.seconds_waiting_for_capacity:.2f} 秒"
+        )
+        return results
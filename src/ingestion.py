@@ -1,66 +1,331 @@
 import os
 import json
-import pickle
-from typing import List, Union
+from typing import List, Optional, Union
 from pathlib import Path
 from tqdm import tqdm
 import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from dotenv import load_dotenv
 from openai import OpenAI
-from rank_bm25 import BM25Okapi
 import faiss
 import numpy as np
-from tenacity import retry, wait_fixed, stop_after_attempt
 import dashscope
 from dashscope import TextEmbedding
 
+from src.api_endpoints import configure_dashscope
+from src.embedding_dispatcher import EmbeddingDispatcher
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.embedding_checkpoint import EmbeddingCheckpoint
+from src.chunk_dedup import ChunkDeduplicator, load_vector_chunk_ids, save_vector_chunk_ids
+from src.ingestion_manifest import IngestionManifest
+from src.vector_index import build_index, extract_vectors
+from src.corpus_index import CorpusIndex
+from src.bm25_index import BM25Index
+from src.tokenization import TokenStore, get_tokenizer
+from src.local_embedding import LocalEmbedder
+
+
+def _atomic_write(output_file: Path, write_fn):
+    """先写入同目录临时文件再原子替换，读取方不会看到写了一半的索引"""
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    try:
+        write_fn(tmp_file)
+        os.replace(tmp_file, output_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+# 工作进程内的入库器实例，由 _init_ingest_worker 在每个进程启动时创建一次
+_worker_ingestor = None
+
+
+def _init_ingest_worker(ingestor_cls, ingestor_kwargs: dict, embedding_cache_dir: Optional[str] = None):
+    global _worker_ingestor
+    if embedding_cache_dir is not None:
+        ingestor_kwargs = {**ingestor_kwargs, "embedding_cache": get_embedding_cache(embedding_cache_dir)}
+    _worker_ingestor = ingestor_cls(**ingestor_kwargs)
+
+
+def _ingest_report_in_worker(report_path: Path, output_dir: Path, force: bool) -> dict:
+    # 清单只在主进程写入，工作进程读取快照判断是否跳过
+    manifest = IngestionManifest(output_dir)
+    return _worker_ingestor._safe_ingest_report(report_path, output_dir, manifest, force)
+
+
+def _run_ingestion(ingestor, all_reports_dir: Path, output_dir: Path, force: bool, max_workers: int, desc: str) -> dict:
+    """
+    顺序或多进程处理目录下所有报告，主进程统一更新入库清单并汇总结果。
+    任一报告失败时，在全部报告处理完后抛出汇总异常。
+    """
+    all_report_paths = list(all_reports_dir.glob("*.json"))
+    manifest = IngestionManifest(output_dir)
+    summary = {"processed": [], "skipped": [], "failed": []}
+
+    def collect(result: dict):
+        summary[result["status"]].append(result)
+        if result["status"] == "processed":
+            # 每份报告写入成功后立即更新清单，中断后重跑只处理剩余报告
+            manifest.record(**result["manifest_entry"])
+            manifest.save()
+
+    if max_workers <= 1 or len(all_report_paths) <= 1:
+        for report_path in tqdm(all_report_paths, desc=desc):
+            collect(ingestor._safe_ingest_report(report_path, output_dir, manifest, force))
+    else:
+        ingestor_cls, ingestor_kwargs, cache_dir = ingestor._worker_init_args(max_workers)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_ingest_worker,
+            initargs=(ingestor_cls, ingestor_kwargs, cache_dir)
+        ) as executor:
+            futures = [executor.submit(_ingest_report_in_worker, path, output_dir, force) for path in all_report_paths]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f"{desc} ({max_workers} workers)"):
+                collect(future.result())
+
+    print(
+        f"Processed {len(summary['processed'])} reports, "
+        f"skipped {len(summary['skipped'])} unchanged reports, "
+        f"failed {len(summary['failed'])} reports"
+    )
+    if summary["failed"]:
+        for result in summary["failed"]:
+            print(f"  失败: {result['report']}: {result['error']}")
+        raise RuntimeError(f"{len(summary['failed'])} 份报告入库失败: {[r['report'] for r in summary['failed']]}")
+    return summary
+
+
 # BM25Ingestor：BM25索引构建与保存工具
 class BM25Ingestor:
-    def __init__(self):
-        pass
+    BM25_PARAMS = {"k1": 1.5, "b": 0.75, "epsilon": 0.25}
+
+    def __init__(self, tokenizer: str = "char_ngram"):
+        # 分词模式见 src/tokenization.py，中文报告默认按字符 n-gram 切分
+        self.tokenizer_name = tokenizer
+        self.tokenizer = get_tokenizer(tokenizer)
+        # 索引参数写入入库清单，参数变化时对应报告会被重建
+        self.index_params = {"index_type": "bm25_csr", "tokenizer": self.tokenizer.params, **self.BM25_PARAMS}
 
-    def create_bm25_index(self, chunks: List[str]) -> BM25Okapi:
-        """从文本块列表创建BM25索引"""
-        tokenized_chunks = [chunk.split() for chunk in chunks]
-        return BM25Okapi(tokenized_chunks)
+    def create_bm25_index(self, chunks: List[str]) -> BM25Index:
+        """从文本块列表创建BM25索引（CSR 倒排表，打分与 BM25Okapi 一致）"""
+        ids, offsets = self.tokenizer.encode_batch(chunks)
+        return self._index_from_token_arrays(ids, offsets)
+
+    def _index_from_token_arrays(self, ids: np.ndarray, offsets: np.ndarray) -> BM25Index:
+        return BM25Index.from_token_arrays(ids, offsets, tokenizer_params=self.tokenizer.params, **self.BM25_PARAMS)
     
-    def process_reports(self, all_reports_dir: Path, output_dir: Path):
+    def _safe_ingest_report(self, report_path: Path, output_dir: Path, manifest: IngestionManifest, force: bool) -> dict:
+        try:
+            return self._ingest_report(report_path, output_dir, manifest, force)
+        except Exception as e:
+            return {"status": "failed", "report": report_path.name, "error": f"{type(e).__name__}: {e}"}
+
+    def _ingest_report(self, report_path: Path, output_dir: Path, manifest: IngestionManifest, force: bool) -> dict:
+        # 加载报告
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report_data = json.load(f)
+
+        # 提取文本块，内容未变化则跳过
+        text_chunks = [chunk['text'] for chunk in report_data['content']['chunks']]
+        sha1_name = report_data["metainfo"]["sha1"]
+        content_hash = IngestionManifest.hash_chunks(text_chunks)
+        if not force and manifest.is_current(sha1_name, content_hash, None, self.index_params):
+            return {"status": "skipped", "report": report_path.name}
+
+        # token id 数组缓存在分块报告旁，文本未变化时换用其他BM25参数重建也无需重新分词
+        ids, offsets = TokenStore(report_path.parent, self.tokenizer).load_or_encode(sha1_name, text_chunks)
+        bm25_index = self._index_from_token_arrays(ids, offsets)
+
+        # 保存BM25索引，文件名用sha1_name
+        output_file = output_dir / f"{sha1_name}.bm25.npz"
+
+        def write(tmp_file: Path):
+            with open(tmp_file, 'wb') as f:
+                bm25_index.save(f)
+
+        _atomic_write(output_file, write)
+        return {
+            "status": "processed",
+            "report": report_path.name,
+            "manifest_entry": {
+                "sha1": sha1_name,
+                "content_hash": content_hash,
+                "embedding_model": None,
+                "index_params": self.index_params,
+                "output_file": output_file.name,
+                "source_file": report_path.name,
+                "num_chunks": len(text_chunks)
+            }
+        }
+
+    def _worker_init_args(self, max_workers: int):
+        return BM25Ingestor, {"tokenizer": self.tokenizer_name}, None
+
+    def process_reports(self, all_reports_dir: Path, output_dir: Path, force: bool = False, max_workers: int = 1) -> dict:
         """
         批量处理所有报告，生成并保存BM25索引。
+        内容和索引参数未变化的报告会根据入库清单跳过。
         参数：
             all_reports_dir (Path): 存放JSON报告的目录
             output_dir (Path): 保存BM25索引的目录
+            force (bool): 忽略入库清单，全部重建
+            max_workers (int): 工作进程数，大于1时按报告并行处理
+        返回：
+            processed/skipped/failed 三类报告的汇总
         """
         output_dir.mkdir(parents=True, exist_ok=True)
-        all_report_paths = list(all_reports_dir.glob("*.json"))
-
-        for report_path in tqdm(all_report_paths, desc="Processing reports for BM25"):
-            # 加载报告
-            with open(report_path, 'r', encoding='utf-8') as f:
-                report_data = json.load(f)
-                
-            # 提取文本块并创建BM25索引
-            text_chunks = [chunk['text'] for chunk in report_data['content']['chunks']]
-            bm25_index = self.create_bm25_index(text_chunks)
-            
-            # 保存BM25索引，文件名用sha1_name
-            sha1_name = report_data["metainfo"]["sha1"]
-            output_file = output_dir / f"{sha1_name}.pkl"
-            with open(output_file, 'wb') as f:
-                pickle.dump(bm25_index, f)
-                
-        print(f"Processed {len(all_report_paths)} reports")
+        return _run_ingestion(self, all_reports_dir, output_dir, force, max_workers, desc="Processing reports for BM25")
 
 # VectorDBIngestor：向量库构建与保存工具
 class VectorDBIngestor:
-    def __init__(self):
-        # 初始化DashScope API Key
-        dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+    EMBEDDING_MODEL = "text-embedding-v1"
+    # 文本块截断长度，与索引参数一起写入入库清单
+    MAX_CHUNK_LENGTH = 2048
+
+    def __init__(
+        self,
+        embedding_concurrency: int = 4,
+        max_requests_per_minute: float = 1_200,
+        max_tokens_per_minute: float = 1_000_000,
+        max_batch_tokens: int = 20_000,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        index_type: str = "auto",
+        memory_budget_mb: Optional[float] = None,
+        vector_encoding: str = "float32",
+        embedding_provider: str = "dashscope",
+        dedup_threshold: Optional[float] = None
+    ):
+        # 初始化DashScope API Key和接口地址
+        configure_dashscope()
+        # 嵌入来源：dashscope 远程接口，或 local 本地哈希 n-gram TF-IDF（离线运行和压测）
+        if embedding_provider not in ("dashscope", "local"):
+            raise ValueError(f"不支持的 embedding provider: {embedding_provider}")
+        self.embedding_provider = embedding_provider
+        self.local_embedder = LocalEmbedder() if embedding_provider == "local" else None
+        self._local_embedder_dir: Optional[Path] = None
+        self.embedding_model = self.local_embedder.model_name if self.local_embedder else self.EMBEDDING_MODEL
+        self.embedding_concurrency = embedding_concurrency
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.max_batch_tokens = max_batch_tokens
+        # 索引类型：auto 时按文本块数量和内存预算在 flat/hnsw/ivf/ivfpq 中选择
+        self.index_type = index_type
+        self.memory_budget_mb = memory_budget_mb
+        # 向量编码：float32/fp16/sq8，量化后索引内存减为 1/2 或 1/4
+        self.vector_encoding = vector_encoding
+        self.index_params = {
+            "index_type": index_type,
+            "memory_budget_mb": memory_budget_mb,
+            "vector_encoding": vector_encoding,
+            "max_chunk_length": self.MAX_CHUNK_LENGTH
+        }
+        # 文本块去重：设置 MinHash 相似度阈值后，重复和近似重复的文本块只嵌入一个代表，组内文本块共用代表的向量
+        self.dedup_threshold = dedup_threshold
+        if dedup_threshold is not None:
+            self.index_params["dedup_threshold"] = dedup_threshold
+            # 早先的去重索引只含代表的向量，记录去重方式使这些索引被判定为过期并重建
+            self.index_params["dedup_mode"] = "shared_vectors"
+        # 按内容寻址的嵌入缓存，重复入库时未变化的文本块不再调用API
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        # 并发限流调度器：多个批次同时在途，按QPM/TPM限流，结果保持原始顺序
+        self.dispatcher = EmbeddingDispatcher(
+            embed_batch_fn=self._embed_batch,
+            max_batch_size=25,
+            max_batch_tokens=max_batch_tokens,
+            max_in_flight=embedding_concurrency,
+            max_requests_per_minute=max_requests_per_minute,
+            max_tokens_per_minute=max_tokens_per_minute
+        )
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        # 单批次调用DashScope嵌入接口（最多25条），由调度器负责并发、限流与重试
+        LOG_FILE = 'embedding_error.log'
+        resp = TextEmbedding.call(
+            model=TextEmbedding.Models.text_embedding_v1,
+            input=batch
+        )
+        # 限流（429）等错误响应没有 output，抛出带错误码的异常交给调度器重试
+        if getattr(resp, 'status_code', 200) != 200:
+            raise RuntimeError(f"DashScope嵌入接口返回错误 {resp.status_code} {resp.code}: {resp.message}")
+        # 兼容单条和多条输入
+        if 'output' in resp and 'embeddings' in resp['output']:
+            embeddings = [None] * len(batch)
+            for position, emb in enumerate(resp['output']['embeddings']):
+                text_index = emb.get('text_index', position)
+                if emb['embedding'] is None or len(emb['embedding']) == 0:
+                    error_text = batch[text_index] if text_index < len(batch) else None
+                    with open(LOG_FILE, 'a', encoding='utf-8') as f:
+                        f.write(f"DashScope返回的embedding为空，text_index={text_index}，文本内容如下：\n{error_text}\n{'-'*60}\n")
+                    raise RuntimeError(f"DashScope返回的embedding为空，text_index={text_index}，文本内容已写入 {LOG_FILE}")
+                # 按 text_index 放回，保证与输入顺序一致
+                embeddings[text_index] = emb['embedding']
+            if any(emb is None for emb in embeddings):
+                raise RuntimeError(f"DashScope返回的embedding数量不足: 期望 {len(batch)}，实际 {len(resp['output']['embeddings'])}")
+            return embeddings
+        elif 'output' in resp and 'embedding' in resp['output']:
+            if resp['output']['embedding'] is None or len(resp['output']['embedding']) == 0:
+                print('单个嵌入响应为空...')
+                with open(LOG_FILE, 'a', encoding='utf-8') as f:
+                    f.write("DashScope返回的embedding为空，文本内容如下：\n{}\n{}\n".format(batch[0] if batch else None, '-'*60))
+                raise RuntimeError("DashScope返回的embedding为空，文本内容已写入 {}".format(LOG_FILE))
+            return [resp['output']['embedding']]
+        else:
+            print('DashScope嵌入API返回格式异常...')
+            raise RuntimeError(f"DashScope embedding API返回格式异常: {resp}")
+
+    def _prepare_embedder(self, output_dir: Path):
+        # 本地嵌入从向量库目录加载拟合好的 IDF，入库与检索使用同一份参数
+        if self.embedding_provider != "local" or self._local_embedder_dir == output_dir:
+            return
+        self.local_embedder = LocalEmbedder.load(output_dir)
+        self.embedding_model = self.local_embedder.model_name
+        self._local_embedder_dir = output_dir
 
-    @retry(wait=wait_fixed(20), stop=stop_after_attempt(2))
-    def _get_embeddings(self, text: Union[str, List[str]], model: str = "text-embedding-v1") -> List[float]:
-        # 获取文本或文本块的嵌入向量，支持重试（使用阿里云DashScope，分批处理）
+    def _fit_local_embedder(self, all_reports_dir: Path, output_dir: Path, refit: bool = False):
+        # IDF 决定嵌入模型名（嵌入缓存命名空间和入库清单都以此为准），已保存时默认沿用；
+        # 重新拟合会使全部已入库报告失效并重新嵌入，只在 refit 时进行
+        if not refit and (output_dir / LocalEmbedder.FILE_NAME).exists():
+            self._prepare_embedder(output_dir)
+            print(f"沿用已保存的本地嵌入 IDF: {self.embedding_model}")
+            return
+
+        def iter_texts():
+            for report_path in sorted(all_reports_dir.glob("*.json")):
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    yield self._get_text_chunks(json.load(f))
+
+        embedder = LocalEmbedder(**LocalEmbedder.load(output_dir).params).fit(iter_texts())
+        embedder.save(output_dir)
+        self._local_embedder_dir = None
+        self._prepare_embedder(output_dir)
+        print(f"本地嵌入 IDF 拟合完成: {self.embedding_model}")
+
+    def _embed_texts(self, texts: List[str], checkpoint: Optional[EmbeddingCheckpoint] = None) -> List[List[float]]:
+        if self.local_embedder is not None:
+            return self.local_embedder.embed(texts).tolist()
+        if checkpoint is None:
+            return self.dispatcher.embed(texts)
+        # 断点续传：检查点中已有的文本不再请求，新完成的批次逐个写入检查点
+        done = checkpoint.load()
+        keys = [checkpoint.key(text) for text in texts]
+        todo_texts = [text for text, key in zip(texts, keys) if key not in done]
+        if len(todo_texts) < len(texts):
+            print(f"从嵌入检查点恢复 {len(texts) - len(todo_texts)} 条向量，剩余 {len(todo_texts)} 条待嵌入")
+        if todo_texts:
+            self.dispatcher.embed(
+                todo_texts,
+                on_batch=lambda batch, embeddings: checkpoint.append([todo_texts[i] for i in batch], embeddings)
+            )
+        return [done[key].tolist() for key in keys]
+
+    def _get_embeddings(
+        self,
+        text: Union[str, List[str]],
+        model: Optional[str] = None,
+        checkpoint: Optional[EmbeddingCheckpoint] = None
+    ) -> List[float]:
+        # 获取文本或文本块的嵌入向量（使用阿里云DashScope，并发分批处理，单批次失败自动重试）
         if isinstance(text, str) and not text.strip():
             raise ValueError("Input text cannot be an empty string.")
         
@@ -79,67 +344,148 @@ class VectorDBIngestor:
         if not text_chunks:
             raise ValueError("所有待嵌入文本均为空字符串！")
         print('start embedding ================================')
-        embeddings = []
-        MAX_BATCH_SIZE = 25
-        LOG_FILE = 'embedding_error.log'
-        for i in range(0, len(text_chunks), MAX_BATCH_SIZE):
-            batch = text_chunks[i:i+MAX_BATCH_SIZE]
-            resp = TextEmbedding.call(
-                model=TextEmbedding.Models.text_embedding_v1,
-                input=batch
-            )
-            # print('i=',i)
-            # print('resp=',resp)
-            # with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            #     f.write('i='+str(i)+'\n')
-            #     f.write('resp='+str(resp)+'\n')
-            # 兼容单条和多条输入
-            #print('resp=',resp)
-            # with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            #     f.write('resp='+str(resp)+'\n')
-            if 'output' in resp and 'embeddings' in resp['output']:
-                print('处理批量嵌入响应...')
-                for emb in resp['output']['embeddings']:
-                    if emb['embedding'] is None or len(emb['embedding']) == 0:
-                        error_text = batch[emb.text_index] if hasattr(emb, 'text_index') else None
-                        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                            f.write(f"DashScope返回的embedding为空，text_index={getattr(emb, 'text_index', None)}，文本内容如下：\n{error_text}\n{'-'*60}\n")
-                        raise RuntimeError(f"DashScope返回的embedding为空，text_index={getattr(emb, 'text_index', None)}，文本内容已写入 {LOG_FILE}")
-                    embeddings.append(emb['embedding'])
-            elif 'output' in resp and 'embedding' in resp['output']:
-                if resp['output']['embedding'] is None or len(resp['output']['embedding']) == 0:
-                    print('单个嵌入响应为空...')
-                    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                        f.write("DashScope返回的embedding为空，文本内容如下：\n{}\n{}\n".format(batch[0] if batch else None, '-'*60))
-                    raise RuntimeError("DashScope返回的embedding为空，文本内容已写入 {}".format(LOG_FILE))
-                embeddings.append(resp.output.embedding)
-            else:
-                print('DashScope嵌入API返回格式异常...')
-                raise RuntimeError(f"DashScope embedding API返回格式异常: {resp}")
+        embeddings = self.embedding_cache.get_or_compute(
+            self.embedding_provider,
+            model or self.embedding_model,
+            text_chunks,
+            lambda texts: self._embed_texts(texts, checkpoint)
+        )
+        print(f"嵌入缓存统计: {self.embedding_cache.stats()}")
         return embeddings
 
     def _create_vector_db(self, embeddings: List[float]):
-        # 用faiss构建向量库，采用内积（余弦距离）
+        # 用faiss构建向量库，采用内积（余弦距离），索引类型见 src/vector_index.py
         embeddings_array = np.array(embeddings, dtype=np.float32)
-        dimension = len(embeddings[0])
-        index = faiss.IndexFlatIP(dimension)  # Cosine distance
-        index.add(embeddings_array)
-        return index
+        return build_index(
+            embeddings_array,
+            index_type=self.index_type,
+            memory_budget_mb=self.memory_budget_mb,
+            vector_encoding=self.vector_encoding
+        )
     
-    def _process_report(self, report: dict):
-        # 针对单份报告，提取文本块并生成向量库
-        text_chunks = [chunk['text'] for chunk in report['content']['chunks']]
-        # 过滤空内容，超长内容截断到 2048 字符
-        max_len = 2048
-        text_chunks = [t[:max_len] for t in text_chunks if len(t) > 0]
-        embeddings = self._get_embeddings(text_chunks)
+    def _get_chunk_ids(self, report: dict) -> List[int]:
+        # 参与嵌入的文本块在 chunks 中的下标，第 i 个向量对应 chunks[chunk_ids[i]]
+        return [i for i, chunk in enumerate(report['content']['chunks']) if chunk['text'].strip()]
+
+    def _get_text_chunks(self, report: dict) -> List[str]:
+        # 提取待嵌入的文本块：过滤空内容，超长内容截断到 MAX_CHUNK_LENGTH 字符
+        chunks = report['content']['chunks']
+        return [chunks[i]['text'][:self.MAX_CHUNK_LENGTH] for i in self._get_chunk_ids(report)]
+
+    def _select_chunks(self, report: dict, text_chunks: Optional[List[str]] = None):
+        """
+        返回 (文本块下标, 实际嵌入的文本, 每个向量取用的嵌入下标)。
+        开启去重时只嵌入每组重复文本块的代表，组内每个文本块仍以自己的下标入索引，向量复用代表的嵌入；
+        未去重时第三项为 None，向量与文本一一对应。
+        """
+        chunk_ids = self._get_chunk_ids(report)
+        if text_chunks is None:
+            text_chunks = self._get_text_chunks(report)
+        if self.dedup_threshold is None:
+            return chunk_ids, text_chunks, None
+        result = ChunkDeduplicator(threshold=self.dedup_threshold).deduplicate(text_chunks)
+        stats = result.stats
+        print(
+            f"文本块去重: {stats.num_chunks} 个文本块，精确重复 {stats.exact_duplicates}，"
+            f"近似重复 {stats.near_duplicates}，嵌入 {stats.num_representatives} 个"
+        )
+        embedding_position = {representative: j for j, representative in enumerate(result.representatives)}
+        sources = [embedding_position[representative] for representative in result.assignment]
+        return chunk_ids, [text_chunks[i] for i in result.representatives], sources
+
+    def _process_report(
+        self,
+        report: dict,
+        text_chunks: Optional[List[str]] = None,
+        checkpoint: Optional[EmbeddingCheckpoint] = None,
+        sources: Optional[List[int]] = None
+    ):
+        # 针对单份报告，提取文本块并生成向量库；sources 见 _select_chunks
+        if text_chunks is None:
+            text_chunks = self._get_text_chunks(report)
+        embeddings = self._get_embeddings(text_chunks, checkpoint=checkpoint)
+        if sources is not None:
+            embeddings = [embeddings[j] for j in sources]
         index = self._create_vector_db(embeddings)
         return index
 
-    def process_reports(self, all_reports_dir: Path, output_dir: Path):
-        # 批量处理所有报告，生成并保存faiss向量库
-        all_report_paths = list(all_reports_dir.glob("*.json"))
-        
+    def _safe_ingest_report(self, report_path: Path, output_dir: Path, manifest: IngestionManifest, force: bool) -> dict:
+        try:
+            return self._ingest_report(report_path, output_dir, manifest, force)
+        except Exception as e:
+            return {"status": "failed", "report": report_path.name, "error": f"{type(e).__name__}: {e}"}
+
+    def _ingest_report(self, report_path: Path, output_dir: Path, manifest: IngestionManifest, force: bool) -> dict:
+        # 加载报告
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report_data = json.load(f)
+        # 用 metainfo['sha1'] 作为 faiss 文件名，避免中文和特殊字符
+        sha1 = report_data["metainfo"].get("sha1", "")
+        if not sha1:
+            raise ValueError(f"分块报告 {report_path} 缺少 sha1 字段，无法保存 faiss 文件！")
+
+        self._prepare_embedder(output_dir)
+        text_chunks = self._get_text_chunks(report_data)
+        content_hash = IngestionManifest.hash_chunks(text_chunks)
+        if not force and manifest.is_current(sha1, content_hash, self.embedding_model, self.index_params):
+            print(f"报告未变化，跳过: {report_path.name}")
+            return {"status": "skipped", "report": report_path.name}
+
+        # 已完成的嵌入批次写入检查点，本报告中途失败后重跑只请求剩余批次
+        checkpoint = EmbeddingCheckpoint(output_dir, sha1, content_hash, self.embedding_model)
+        chunk_ids, embedded_chunks, sources = self._select_chunks(report_data, text_chunks)
+        index = self._process_report(report_data, embedded_chunks, checkpoint, sources)
+        faiss_file_path = output_dir / f"{sha1}.faiss"
+
+        # 再次确保目录存在（以防被意外删除）
+        faiss_file_path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写向量 id 到文本块下标的映射，再写索引
+        save_vector_chunk_ids(output_dir, sha1, chunk_ids)
+
+        print(f"尝试写入faiss文件: {faiss_file_path}")
+        _atomic_write(faiss_file_path, lambda tmp_file: faiss.write_index(index, str(tmp_file)))
+        print(f"faiss文件写入成功: {faiss_file_path}")
+        checkpoint.remove()
+        return {
+            "status": "processed",
+            "report": report_path.name,
+            "manifest_entry": {
+                "sha1": sha1,
+                "content_hash": content_hash,
+                "embedding_model": self.embedding_model,
+                "index_params": self.index_params,
+                "output_file": faiss_file_path.name,
+                "source_file": report_path.name,
+                "num_chunks": len(chunk_ids)
+            }
+        }
+
+    def _worker_init_args(self, max_workers: int):
+        # 限流配额按进程数均分，所有工作进程合计仍不超过QPM/TPM上限
+        kwargs = {
+            "embedding_concurrency": self.embedding_concurrency,
+            "max_requests_per_minute": self.max_requests_per_minute / max_workers,
+            "max_tokens_per_minute": self.max_tokens_per_minute / max_workers,
+            "max_batch_tokens": self.max_batch_tokens,
+            "index_type": self.index_type,
+            "memory_budget_mb": self.memory_budget_mb,
+            "vector_encoding": self.vector_encoding,
+            "embedding_provider": self.embedding_provider,
+            "dedup_threshold": self.dedup_threshold
+        }
+        return VectorDBIngestor, kwargs, str(self.embedding_cache.cache_dir)
+
+    def process_reports(
+        self,
+        all_reports_dir: Path,
+        output_dir: Path,
+        force: bool = False,
+        max_workers: int = 1,
+        refit_embedder: bool = False
+    ) -> dict:
+        # 批量处理所有报告，生成并保存faiss向量库；内容、嵌入模型、索引参数均未变化的报告直接跳过
+        # max_workers 大于1时按报告分配到多个工作进程，返回 processed/skipped/failed 汇总
+        # 本地嵌入只在首次入库、force 或 refit_embedder 时拟合 IDF，新增报告沿用已有 IDF
         # 确保输出目录存在
         print(f"确保目录存在: {output_dir}")
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -149,22 +495,65 @@ class VectorDBIngestor:
             raise RuntimeError(f"目录创建失败: {output_dir}")
         print(f"目录已存在: {output_dir}")
 
-        for report_path in tqdm(all_report_paths, desc="Processing reports for FAISS"):
-            # 加载报告
-            with open(report_path, 'r', encoding='utf-8') as f:
-                report_data = json.load(f)
-            index = self._process_report(report_data)
-            # 用 metainfo['sha1'] 作为 faiss 文件名，避免中文和特殊字符
-            sha1 = report_data["metainfo"].get("sha1", "")
-            if not sha1:
-                raise ValueError(f"分块报告 {report_path} 缺少 sha1 字段，无法保存 faiss 文件！")
-            faiss_file_path = output_dir / f"{sha1}.faiss"
-            
-            # 再次确保目录存在（以防被意外删除）
-            faiss_file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            print(f"尝试写入faiss文件: {faiss_file_path}")
-            faiss.write_index(index, str(faiss_file_path))
-            print(f"faiss文件写入成功: {faiss_file_path}")
-
-        print(f"Processed {len(all_report_paths)} reports")
\ No newline at end of file
+        if self.embedding_provider == "local":
+            self._fit_local_embedder(all_reports_dir, output_dir, refit=force or refit_embedder)
+        summary = _run_ingestion(self, all_reports_dir, output_dir, force, max_workers, desc="Processing reports for FAISS")
+        self.build_corpus_index(all_reports_dir, output_dir, force=force)
+        return summary
+
+    def _vector_chunk_ids(self, report: dict, output_dir: Path) -> List[int]:
+        # 分报告索引中各向量对应的文本块下标；旧索引没有映射文件，按非空文本块顺序对应
+        chunk_ids = load_vector_chunk_ids(output_dir, report["metainfo"]["sha1"])
+        return chunk_ids.tolist() if chunk_ids is not None else self._get_chunk_ids(report)
+
+    def _load_report_vectors(self, report: dict, index_path: Path, chunk_ids: List[int]) -> np.ndarray:
+        # 优先从嵌入缓存取全精度向量；分报告索引是量化索引时从中取回的只是近似值
+        chunks = report['content']['chunks']
+        texts = [chunks[i]['text'][:self.MAX_CHUNK_LENGTH] for i in chunk_ids]
+        cached = self.embedding_cache.get_many(self.embedding_provider, self.embedding_model, texts)
+        if all(vector is not None for vector in cached):
+            return np.array(cached, dtype=np.float32)
+        return extract_vectors(faiss.read_index(str(index_path)))
+
+    def build_corpus_index(self, all_reports_dir: Path, output_dir: Path, force: bool = False) -> Optional[CorpusIndex]:
+        """
+        将入库清单中的全部分报告索引合并为一个全语料索引（corpus.faiss），
+        向量 id 映射到 (报告 sha1, 文本块下标)。各报告内容和索引参数均未变化时跳过重建。
+        """
+        self._prepare_embedder(output_dir)
+        manifest = IngestionManifest(output_dir)
+        reports = []
+        for sha1, entry in sorted(manifest.entries.items()):
+            report_path = all_reports_dir / entry.get("source_file", "")
+            index_path = output_dir / entry.get("output_file", "")
+            if report_path.is_file() and index_path.is_file():
+                reports.append((sha1, entry, report_path, index_path))
+        if not reports:
+            print("没有可合并的分报告索引，跳过语料索引构建")
+            return None
+
+        signature = IngestionManifest.hash_chunks(
+            [json.dumps(self.index_params, sort_keys=True)]
+            + [f"{sha1}:{entry.get('content_hash')}:{entry.get('embedding_model')}" for sha1, entry, _, _ in reports]
+        )
+        if not force and CorpusIndex.read_signature(output_dir) == signature:
+            print("语料索引未变化，跳过重建")
+            return None
+
+        def iter_documents():
+            for sha1, _, report_path, index_path in tqdm(reports, desc="Building corpus index"):
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    report_data = json.load(f)
+                chunk_ids = self._vector_chunk_ids(report_data, output_dir)
+                yield sha1, self._load_report_vectors(report_data, index_path, chunk_ids), chunk_ids
+
+        corpus_index = CorpusIndex.build(
+            iter_documents(),
+            index_type=self.index_type,
+            memory_budget_mb=self.memory_budget_mb,
+            signature=signature,
+            vector_encoding=self.vector_encoding
+        )
+        corpus_index.save(output_dir)
+        print(f"语料索引写入成功: {len(corpus_index.document_ids)} 份报告, {len(corpus_index)} 条向量")
+        return corpus_index
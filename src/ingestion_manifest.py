@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+from datetime import datetime
+
+
+class ChunkHasher:
+    """增量计算 hash_chunks，逐块 update，流式入库时不必保留全部文本"""
+
+    def __init__(self):
+        self._digest = hashlib.sha1()
+
+    def update(self, text: str):
+        self._digest.update(hashlib.sha1(text.encode('utf-8')).digest())
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+# IngestionManifest：记录每份报告入库时的内容哈希、嵌入模型和索引参数，用于增量入库
+class IngestionManifest:
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILE_NAME
+        self.entries: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("reports", {})
+        except (json.JSONDecodeError, OSError):
+            # 清单损坏时视为空清单，所有报告会重新入库
+            return {}
+
+    @staticmethod
+    def hash_chunks(texts: List[str]) -> str:
+        """对报告中参与建索引的文本块计算内容哈希（顺序敏感）"""
+        hasher = ChunkHasher()
+        for text in texts:
+            hasher.update(text)
+        return hasher.hexdigest()
+
+    def is_current(self, sha1: str, content_hash: str, embedding_model: Optional[str], index_params: dict) -> bool:
+        """报告内容、模型、索引参数均未变化且索引文件仍存在时返回True"""
+        entry = self.entries.get(sha1)
+        if entry is None:
+            return False
+        if not (self.output_dir / entry.get("output_file", "")).exists():
+            return False
+        return (
+            entry.get("content_hash") == content_hash
+            and entry.get("embedding_model") == embedding_model
+            and entry.get("index_params") == index_params
+        )
+
+    def record(self, sha1: str, content_hash: str, embedding_model: Optional[str], index_params: dict, output_file: str, source_file: str, num_chunks: int):
+        self.entries[sha1] = {
+            "content_hash": content_hash,
+            "embedding_model": embedding_model,
+            "index_params": index_params,
+            "output_file": output_file,
+            "source_file": source_file,
+            "num_chunks": num_chunks,
+            "updated_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def save(self):
+        # 先写临时文件再替换，避免中断时留下半个清单
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"reports": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,117 @@
+"""
+LOCAL EMBEDDING
+
+本地确定性嵌入（embedding_provider="local"）：不访问网络，用于离线运行、压测，
+以及远程嵌入接口被限流时的降级检索。
+
+做法：文本按 tokenization.CharNgramTokenizer 切成字符/单词 n-gram 并哈希到 num_features 维稀疏空间，
+词频取 1+log(tf)，乘以 IDF，再用带符号的特征哈希投影到 dimension 维并做 L2 归一化。
+整个批次的计数、加权和投影都用 NumPy 一次完成。
+
+IDF 需要语料统计：VectorDBIngestor 入库时对全部文本块拟合，保存为向量库目录下的 local_embedding.npz，
+检索器从同一目录加载；没有该文件时 IDF 全为 1（纯 TF）。
+模型名包含维度和 IDF 摘要，IDF 变化后嵌入缓存和入库清单自然失效。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from src.tokenization import CharNgramTokenizer
+
+# 64 位黄金分割乘法哈希，用于把特征打散到投影维度和符号
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class LocalEmbedder:
+    FILE_NAME = "local_embedding.npz"
+
+    def __init__(
+        self,
+        dimension: int = 1024,
+        num_features: int = 1 << 20,
+        min_n: int = 1,
+        max_n: int = 2,
+        idf: Optional[np.ndarray] = None
+    ):
+        if idf is not None and len(idf) != num_features:
+            raise ValueError(f"IDF 长度 {len(idf)} 与特征空间大小 {num_features} 不一致")
+        self.dimension = dimension
+        self.num_features = num_features
+        self.tokenizer = CharNgramTokenizer(min_n=min_n, max_n=max_n)
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+
+    @property
+    def params(self) -> dict:
+        return {
+            "dimension": self.dimension,
+            "num_features": self.num_features,
+            "min_n": self.tokenizer.min_n,
+            "max_n": self.tokenizer.max_n
+        }
+
+    @property
+    def model_name(self) -> str:
+        idf_digest = hashlib.sha1(self.idf.tobytes()).hexdigest()[:12] if self.idf is not None else "tf"
+        return f"local-ngram-{self.tokenizer.min_n}-{self.tokenizer.max_n}-d{self.dimension}-{idf_digest}"
+
+    def _features(self, texts: List[str]):
+        """返回 (文本序号, 特征 id, 词频)，每个 (文本, 特征) 只出现一次"""
+        ids, offsets = self.tokenizer.encode_batch(texts)
+        doc = np.repeat(np.arange(len(texts), dtype=np.int64), np.diff(offsets))
+        keys = doc * self.num_features + ids.astype(np.int64) % self.num_features
+        keys, tf = np.unique(keys, return_counts=True)
+        return keys // self.num_features, keys % self.num_features, tf
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """批量嵌入，返回 (len(texts), dimension) 的 float32 单位向量（无 token 的文本为零向量）"""
+        doc, feature, tf = self._features(texts)
+        weights = 1.0 + np.log(tf)
+        if self.idf is not None:
+            weights *= self.idf[feature]
+        mixed = feature.astype(np.uint64) * _MIX
+        bucket = ((mixed >> np.uint64(32)) % np.uint64(self.dimension)).astype(np.int64)
+        sign = 1.0 - 2.0 * ((mixed >> np.uint64(63)) & np.uint64(1)).astype(np.float64)
+        vectors = np.bincount(
+            doc * self.dimension + bucket,
+            weights=sign * weights,
+            minlength=len(texts) * self.dimension
+        ).reshape(len(texts), self.dimension)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def fit(self, text_batches: Iterable[List[str]]) -> "LocalEmbedder":
+        """按批统计文档频率并设置平滑 IDF：log((1+N)/(1+df))+1"""
+        df = np.zeros(self.num_features, dtype=np.int64)
+        num_docs = 0
+        for texts in text_batches:
+            _, feature, _ = self._features(texts)
+            df += np.bincount(feature, minlength=self.num_features)
+            num_docs += len(texts)
+        self.idf = (np.log((1 + num_docs) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def save(self, directory: Path):
+        path = Path(directory) / self.FILE_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp.npz")
+        arrays = {"params": np.array(json.dumps(self.params))}
+        if self.idf is not None:
+            arrays["idf"] = self.idf
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: Optional[Path] = None) -> "LocalEmbedder":
+        """从向量库目录加载参数和 IDF；目录为空或没有保存文件时返回默认参数的纯 TF 嵌入"""
+        path = Path(directory) / cls.FILE_NAME if directory is not None else None
+        if path is None or not path.exists():
+            return cls()
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            idf = data["idf"] if "idf" in data else None
+        return cls(idf=idf, **params)
@@ -0,0 +1,317 @@
+"""
+MOCK API SERVER
+
+本地 aiohttp 模拟服务，实现 DashScope 和 OpenAI 兼容的对话、嵌入接口，用于压测和延迟测试：
+
+- POST /api/v1/services/aigc/text-generation/generation      DashScope 对话
+- POST /api/v1/services/embeddings/text-embedding/text-embedding  DashScope 嵌入
+- POST /v1/chat/completions、/v1/embeddings                  OpenAI 兼容接口
+- GET  /stats                                                请求数、429 次数、延迟分位数
+
+可配置延迟分布（对数正态，sigma=0 时为固定延迟）、随机 429 比例、每分钟请求数/token 数上限
+和单次请求的 token 上限。嵌入向量由本地哈希 n-gram 嵌入生成，同一文本结果确定；
+对话返回通用的 JSON 答案，OpenAI 结构化输出请求按 json_schema 生成占位结果。
+
+将接口地址指向本服务：
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8765/api/v1
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from src.embedding_dispatcher import RateLimiter
+from src.local_embedding import LocalEmbedder
+
+_log = logging.getLogger(__name__)
+
+# 对话接口默认返回的答案结构，与 prompts 中 RAG 答案的字段一致
+MOCK_ANSWER = {
+    "step_by_step_analysis": "Mock analysis.",
+    "reasoning_summary": "Mock reasoning.",
+    "relevant_pages": [],
+    "final_answer": "N/A"
+}
+
+
+@dataclass
+class MockAPIConfig:
+    # 延迟：对数正态分布的中位数和 sigma（sigma=0 为固定延迟），另加每个输出 token 的生成耗时
+    latency_ms: float = 200.0
+    latency_sigma: float = 0.5
+    per_output_token_ms: float = 0.0
+    # 随机返回 429 的比例，与限流无关
+    error_429_rate: float = 0.0
+    # 服务端限流，超出时返回 429；None 表示不限
+    max_requests_per_minute: Optional[float] = None
+    max_tokens_per_minute: Optional[float] = None
+    # 单次请求输入 token 上限，超出时返回 400
+    max_input_tokens: int = 30_000
+    # 单次嵌入请求最多文本条数（DashScope text-embedding-v1 为 25）
+    max_batch_size: int = 25
+    embedding_dimension: int = 1536
+    output_tokens: int = 64
+    seed: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估计：中文约 1 字 1 token，英文约 4 字符 1 token，不依赖 tiktoken 下载编码表
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return max(1, (len(text) - ascii_chars) + ascii_chars // 4)
+
+
+def _placeholder_from_schema(schema: dict, definitions: dict):
+    """按 JSON schema 生成占位值，用于模拟 OpenAI 结构化输出"""
+    if "$ref" in schema:
+        return _placeholder_from_schema(definitions.get(schema["$ref"].split("/")[-1], {}), definitions)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return _placeholder_from_schema(schema[key][0], definitions)
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: _placeholder_from_schema(prop, definitions) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [_placeholder_from_schema(schema.get("items", {}), definitions) for _ in range(schema.get("minItems", 0))]
+    if schema_type in ("number", "integer"):
+        return 0.5 if schema_type == "number" else 0
+    if schema_type == "boolean":
+        return False
+    if schema_type == "null":
+        return None
+    return "mock"
+
+
+class MockAPIServer:
+    def __init__(self, config: Optional[MockAPIConfig] = None):
+        self.config = config or MockAPIConfig()
+        self.embedder = LocalEmbedder(dimension=self.config.embedding_dimension)
+        self._random = random.Random(self.config.seed)
+        self._limiter = None
+        if self.config.max_requests_per_minute or self.config.max_tokens_per_minute:
+            self._limiter = RateLimiter(
+                self.config.max_requests_per_minute or float("inf"),
+                self.config.max_tokens_per_minute or float("inf")
+            )
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.latencies_ms: List[float] = []
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/v1/services/aigc/text-generation/generation", self.dashscope_generation)
+        app.router.add_post("/api/v1/services/embeddings/text-embedding/text-embedding", self.dashscope_embedding)
+        for prefix in ("/v1", "/compatible-mode/v1"):
+            app.router.add_post(f"{prefix}/chat/completions", self.openai_chat)
+            app.router.add_post(f"{prefix}/embeddings", self.openai_embedding)
+        app.router.add_get("/stats", self.stats_handler)
+        return app
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                "config": asdict(self.config)
+            }
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def _admit(self, num_tokens: int) -> Optional[str]:
+        """返回拒绝原因（throttled/too_long），允许时返回 None"""
+        with self._lock:
+            self.requests += 1
+            if num_tokens > self.config.max_input_tokens:
+                self.rejected += 1
+                return "too_long"
+            throttled = self._random.random() < self.config.error_429_rate
+            if not throttled and self._limiter is not None:
+                # 服务端不排队：令牌不足时直接返回 429
+                self._limiter._refill()
+                if self._limiter.available_request_capacity < 1 or self._limiter.available_token_capacity < num_tokens:
+                    throttled = True
+                else:
+                    self._limiter.available_request_capacity -= 1
+                    self._limiter.available_token_capacity -= num_tokens
+            if throttled:
+                self.throttled += 1
+                return "throttled"
+            return None
+
+    async def _sleep(self, output_tokens: int = 0):
+        with self._lock:
+            latency = self.config.latency_ms
+            if self.config.latency_sigma > 0:
+                latency *= self._random.lognormvariate(0.0, self.config.latency_sigma)
+            latency += output_tokens * self.config.per_output_token_ms
+            self.latencies_ms.append(latency)
+        await asyncio.sleep(latency / 1000)
+
+    @staticmethod
+    def _dashscope_error(status: int, code: str, message: str) -> web.Response:
+        return web.json_response(
+            {"code": code, "message": message, "request_id": str(uuid.uuid4())},
+            status=status
+        )
+
+    @staticmethod
+    def _openai_error(status: int, code: str, message: str) -> web.Response:
+        return web.json_response(
+            {"error": {"message": message, "type": code, "code": code}},
+            status=status
+        )
+
+    def _rejection(self, reason: str, dashscope_format: bool) -> web.Response:
+        if dashscope_format:
+            if reason == "throttled":
+                return self._dashscope_error(429, "Throttling.RateQuota", "Requests rate limit exceeded, please try again later.")
+            return self._dashscope_error(400, "InvalidParameter", f"Range of input length should be [1, {self.config.max_input_tokens}]")
+        if reason == "throttled":
+            return self._openai_error(429, "rate_limit_exceeded", "Rate limit reached for requests")
+        return self._openai_error(400, "context_length_exceeded", f"Maximum context length is {self.config.max_input_tokens} tokens")
+
+    async def dashscope_generation(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body.get("input", {}).get("messages", [])
+        input_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        reason = self._admit(input_tokens)
+        if reason:
+            await self._sleep()
+            return self._rejection(reason, dashscope_format=True)
+        await self._sleep(self.config.output_tokens)
+        content = json.dumps(MOCK_ANSWER, ensure_ascii=False)
+        usage = {"input_tokens": input_tokens, "output_tokens": self.config.output_tokens, "total_tokens": input_tokens + self.config.output_tokens}
+        if body.get("parameters", {}).get("result_format") == "message":
+            output = {"choices": [{"finish_reason": "stop", "message": {"role": "assistant", "content": content}}]}
+        else:
+            output = {"text": content, "finish_reason": "stop"}
+        return web.json_response({"output": output, "usage": usage, "request_id": str(uuid.uuid4())})
+
+    async def dashscope_embedding(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = body.get("input", {}).get("texts", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts or len(texts) > self.config.max_batch_size:
+            return self._dashscope_error(400, "InvalidParameter", f"Range of texts should be [1, {self.config.max_batch_size}]")
+        num_tokens = sum(estimate_tokens(text) for text in texts)
+        reason = self._admit(num_tokens)
+        await self._sleep()
+        if reason:
+            return self._rejection(reason, dashscope_format=True)
+        vectors = self.embedder.embed(texts)
+        return web.json_response({
+            "output": {"embeddings": [{"text_index": i, "embedding": vector.tolist()} for i, vector in enumerate(vectors)]},
+            "usage": {"total_tokens": num_tokens},
+            "request_id": str(uuid.uuid4())
+        })
+
+    async def openai_chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body.get("messages", [])
+        input_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages if isinstance(m.get("content"), str))
+        reason = self._admit(input_tokens)
+        if reason:
+            await self._sleep()
+            return self._rejection(reason, dashscope_format=False)
+        await self._sleep(self.config.output_tokens)
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"].get("schema", {})
+            content = json.dumps(_placeholder_from_schema(schema, schema.get("$defs", {})), ensure_ascii=False)
+        else:
+            content = json.dumps(MOCK_ANSWER, ensure_ascii=False)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": input_tokens, "completion_tokens": self.config.output_tokens, "total_tokens": input_tokens + self.config.output_tokens}
+        })
+
+    async def openai_embedding(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        num_tokens = sum(estimate_tokens(text) for text in texts)
+        reason = self._admit(num_tokens)
+        await self._sleep()
+        if reason:
+            return self._rejection(reason, dashscope_format=False)
+        vectors = self.embedder.embed(texts)
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "mock"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector.tolist()} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": num_tokens, "total_tokens": num_tokens}
+        })
+
+
+class MockServerThread:
+    """在后台线程的事件循环中运行 mock 服务，供压测脚本在同一进程内使用"""
+
+    def __init__(self, server: MockAPIServer, host: str = "127.0.0.1", port: int = 0):
+        self.server = server
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner: Optional[web.AppRunner] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.server.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 时由系统分配端口
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self) -> "MockServerThread":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._runner is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self) -> "MockServerThread":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def run_mock_server(config: Optional[MockAPIConfig] = None, host: str = "127.0.0.1", port: int = 8765):
+    """前台运行 mock 服务，直到进程退出"""
+    print(f"Mock API server listening on http://{host}:{port}")
+    print(f"  DASHSCOPE_HTTP_BASE_URL=http://{host}:{port}/api/v1")
+    print(f"  OPENAI_BASE_URL=http://{host}:{port}/v1")
+    web.run_app(MockAPIServer(config).create_app(), host=host, port=port, print=None)
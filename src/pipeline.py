@@ -1,6 +1,7 @@
 # Qwen-Turbo API的基础限流设置为每分钟不超过500次API调用（QPM）。同时，Token消耗限流为每分钟不超过500,000 Tokens
 import sys
 from dataclasses import dataclass
+from typing import Optional
 from pathlib import Path
 import os
 import json
@@ -10,7 +11,8 @@ import time
  
 from src import pdf_mineru
 from src.text_splitter import TextSplitter
-from src.ingestion import VectorDBIngestor
+from src.ingestion import VectorDBIngestor, BM25Ingestor
+from src.streaming_ingestion import StreamingIngestor
 from src.questions_processing import QuestionsProcessor
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -54,6 +56,27 @@ class RunConfig:
     api_provider: str = "dashscope" 
     answering_model: str = "qwen-turbo-latest" 
     config_suffix: str = ""
+    # 向量索引类型：auto/flat/hnsw/ivf/ivfpq，auto 按文本块数量和内存预算选择
+    vector_index_type: str = "auto"
+    vector_index_memory_budget_mb: Optional[float] = None
+    # ANN 检索参数：HNSW 的 efSearch 和 IVF 的 nprobe，越大召回越高、延迟越大
+    hnsw_ef_search: int = 64
+    ivf_nprobe: int = 16
+    # 向量编码：float32/fp16/sq8；量化索引可设置 rescore_factor 用全精度向量对 top_n*rescore_factor 个候选重打分
+    vector_encoding: str = "float32"
+    rescore_factor: int = 0
+    # 检索器按需加载报告正文和分报告索引，超过该内存上限（MB）时按 LRU 释放
+    retriever_cache_mb: Optional[float] = 1024
+    # BM25 分词模式：whitespace/char_ngram/hashed_bigram，中文报告建议 char_ngram
+    bm25_tokenizer: str = "char_ngram"
+    # 问答检索融合BM25与向量召回（需要BM25索引，与 use_bm25_db 相互独立）；默认只用向量检索
+    use_fusion_retrieval: bool = False
+    # 融合方式：rrf（倒数排名融合）或 weighted（归一化分数加权）
+    fusion_method: str = "rrf"
+    # 向量嵌入来源：dashscope，或 local（本地哈希 n-gram TF-IDF，离线运行和压测用），入库与检索需一致
+    embedding_provider: str = "dashscope"
+    # 文本块去重的 MinHash 相似度阈值（如 0.8）：重复的页眉页脚、免责声明只嵌入一次；None 为不去重
+    chunk_dedup_threshold: Optional[float] = None
 
 class Pipeline:
     def __init__(self, root_path: Path, questions_file_name: str = "questions.json", pdf_reports_dir_name: str = "pdf_reports", run_config: RunConfig = RunConfig()):
@@ -61,6 +84,8 @@ class Pipeline:
         self.run_config = run_config
         self.paths = self._initialize_paths(root_path, questions_file_name, pdf_reports_dir_name)
         self._convert_json_to_csv_if_needed()
+        # answer_single_question 复用的问题处理器，检索器由进程内注册表共享
+        self._single_question_processor = None
 
     def _initialize_paths(self, root_path: Path, questions_file_name: str, pdf_reports_dir_name: str) -> PipelineConfig:
         """根据配置初始化所有路径"""
@@ -136,31 +161,103 @@ class Pipeline:
         )
         print(f"分割完成，结果已保存到 {self.paths.documents_dir}")
 
-    def create_vector_dbs(self):
-        """从分块报告创建向量数据库"""
+    def create_vector_dbs(self, force: bool = False, max_workers: int = 1):
+        """从分块报告创建向量数据库，未变化的报告根据入库清单跳过；force=True 时全部重建"""
         input_dir = self.paths.documents_dir
         output_dir = self.paths.vector_db_dir
         
-        vdb_ingestor = VectorDBIngestor()
-        vdb_ingestor.process_reports(input_dir, output_dir)
+        vdb_ingestor = VectorDBIngestor(
+            index_type=self.run_config.vector_index_type,
+            memory_budget_mb=self.run_config.vector_index_memory_budget_mb,
+            vector_encoding=self.run_config.vector_encoding,
+            embedding_provider=self.run_config.embedding_provider,
+            dedup_threshold=self.run_config.chunk_dedup_threshold
+        )
+        vdb_ingestor.process_reports(input_dir, output_dir, force=force, max_workers=max_workers)
         print(f"Vector databases created in {output_dir}")
 
-    def process_parsed_reports(self):
+    def stream_markdown_reports(self, force: bool = False):
+        """markdown 报告流式分块、嵌入并写入向量库，不经过先写全部分块报告再读回的中间步骤"""
+        vdb_ingestor = VectorDBIngestor(
+            index_type=self.run_config.vector_index_type,
+            memory_budget_mb=self.run_config.vector_index_memory_budget_mb,
+            vector_encoding=self.run_config.vector_encoding,
+            embedding_provider=self.run_config.embedding_provider,
+            dedup_threshold=self.run_config.chunk_dedup_threshold
+        )
+        StreamingIngestor(vdb_ingestor).process_markdown_reports(
+            self.paths.reports_markdown_path,
+            self.paths.documents_dir,
+            self.paths.vector_db_dir,
+            force=force
+        )
+        print(f"Vector databases created in {self.paths.vector_db_dir}")
+
+    def create_bm25_db(self, force: bool = False, max_workers: int = 1):
+        """从分块报告创建BM25索引"""
+        input_dir = self.paths.documents_dir
+        output_dir = self.paths.bm25_db_path
+
+        bm25_ingestor = BM25Ingestor(tokenizer=self.run_config.bm25_tokenizer)
+        bm25_ingestor.process_reports(input_dir, output_dir, force=force, max_workers=max_workers)
+        print(f"BM25 databases created in {output_dir}")
+
+    def process_parsed_reports(self, max_workers: int = 1, streaming: bool = False):
         """
         处理已解析的PDF报告，主要流程：
         1. 对报告进行分块
         2. 创建向量数据库
+        3. 创建BM25索引（run_config.use_bm25_db 或 use_fusion_retrieval 为 True 时）
+        max_workers 大于1时，步骤2、3按报告分配到多个工作进程并行处理；
+        streaming=True 时步骤1、2合并为流式入库，分块、嵌入、建索引同时进行
         """
         print("开始处理报告流程...")
         
-        print("步骤1：报告分块...")
-        self.chunk_reports()
-        
-        print("步骤2：创建向量数据库...")
-        self.create_vector_dbs()
+        if streaming:
+            print("步骤1-2：流式分块并创建向量数据库...")
+            self.stream_markdown_reports()
+        else:
+            print("步骤1：报告分块...")
+            self.chunk_reports()
+
+            print("步骤2：创建向量数据库...")
+            self.create_vector_dbs(max_workers=max_workers)
+
+        if self.run_config.use_bm25_db or self.run_config.use_fusion_retrieval:
+            print("步骤3：创建BM25索引...")
+            self.create_bm25_db(max_workers=max_workers)
         
         print("报告处理流程已成功完成！")
         
+    def report_vector_index_recall(self, k: int = 10, num_queries: int = 200, quantization: bool = False):
+        """
+        汇总所有已建向量库中的向量，以 flat 暴力检索为基准，
+        输出 hnsw/ivf/ivfpq 在不同检索参数下的 recall@k、单条查询延迟和索引大小。
+        quantization=True 时改为比较 float32/fp16/sq8 编码（含全精度重打分）的内存节省与召回损失。
+        """
+        import faiss
+        import numpy as np
+        from tabulate import tabulate
+        from src.corpus_index import CorpusIndex
+        from src.vector_index import extract_vectors, quantization_report, recall_latency_report
+
+        # 全语料索引中的向量与分报告索引重复，不参与汇总
+        faiss_paths = sorted(p for p in self.paths.vector_db_dir.glob("*.faiss") if p.name != CorpusIndex.INDEX_FILE)
+        if not faiss_paths:
+            print(f"未找到向量库: {self.paths.vector_db_dir}")
+            return []
+        embeddings = np.concatenate([extract_vectors(faiss.read_index(str(path))) for path in faiss_paths])
+        print(f"共 {len(faiss_paths)} 个向量库，{len(embeddings)} 条向量，维度 {embeddings.shape[1]}")
+
+        if quantization:
+            rows = []
+            for index_type in ("flat", "hnsw"):
+                rows.extend(quantization_report(embeddings, k=k, num_queries=num_queries, index_type=index_type))
+        else:
+            rows = recall_latency_report(embeddings, k=k, num_queries=num_queries)
+        print(tabulate(rows, headers="keys", tablefmt="github"))
+        return rows
+
     def _get_next_available_filename(self, base_path: Path) -> Path:
         """
         获取下一个可用的文件名，如果文件已存在则自动添加编号后缀。
@@ -196,7 +293,14 @@ class Pipeline:
             parallel_requests=self.run_config.parallel_requests,
             api_provider=self.run_config.api_provider,
             answering_model=self.run_config.answering_model,
-            full_context=self.run_config.full_context            
+            full_context=self.run_config.full_context,
+            hnsw_ef_search=self.run_config.hnsw_ef_search,
+            ivf_nprobe=self.run_config.ivf_nprobe,
+            rescore_factor=self.run_config.rescore_factor,
+            retriever_cache_mb=self.run_config.retriever_cache_mb,
+            embedding_provider=self.run_config.embedding_provider,
+            bm25_db_dir=self.paths.bm25_db_path if self.run_config.use_fusion_retrieval else None,
+            fusion_method=self.run_config.fusion_method
         )
         
         output_path = self._get_next_available_filename(self.paths.answers_file_path)
@@ -215,8 +319,19 @@ class Pipeline:
         kind: 支持 'string'、'number'、'boolean'、'names' 等
         """
         t0 = time.time()
+        processor = self._single_question_processor or self._create_single_question_processor()
+        t1 = time.time()
+        print(f"[计时] 获取 QuestionsProcessor 耗时: {t1-t0:.2f} 秒")
+        print("[计时] 开始调用 process_single_question ...")
+        answer = processor.process_single_question(question, kind=kind)
+        t2 = time.time()
+        print(f"[计时] process_single_question 推理耗时: {t2-t1:.2f} 秒")
+        print(f"[计时] answer_single_question 总耗时: {t2-t0:.2f} 秒")
+        return answer
+
+    def _create_single_question_processor(self) -> QuestionsProcessor:
         print("[计时] 开始初始化 QuestionsProcessor ...")
-        processor = QuestionsProcessor(
+        self._single_question_processor = QuestionsProcessor(
             vector_db_dir=self.paths.vector_db_dir,
             documents_dir=self.paths.documents_dir,
             questions_file_path=None,
@@ -228,16 +343,16 @@ class Pipeline:
             parallel_requests=1,
             api_provider=self.run_config.api_provider,
             answering_model=self.run_config.answering_model,
-            full_context=self.run_config.full_context
+            full_context=self.run_config.full_context,
+            hnsw_ef_search=self.run_config.hnsw_ef_search,
+            ivf_nprobe=self.run_config.ivf_nprobe,
+            rescore_factor=self.run_config.rescore_factor,
+            retriever_cache_mb=self.run_config.retriever_cache_mb,
+            embedding_provider=self.run_config.embedding_provider,
+            bm25_db_dir=self.paths.bm25_db_path if self.run_config.use_fusion_retrieval else None,
+            fusion_method=self.run_config.fusion_method
         )
-        t1 = time.time()
-        print(f"[计时] QuestionsProcessor 初始化耗时: {t1-t0:.2f} 秒")
-        print("[计时] 开始调用 process_single_question ...")
-        answer = processor.process_single_question(question, kind=kind)
-        t2 = time.time()
-        print(f"[计时] process_single_question 推理耗时: {t2-t1:.2f} 秒")
-        print(f"[计时] answer_single_question 总耗时: {t2-t0:.2f} 秒")
-        return answer
+        return self._single_question_processor
 
 class SinglePDFPipeline:
     def __init__(
@@ -246,7 +361,8 @@ class SinglePDFPipeline:
         use_llm_reranking: bool = False,
         embedding_provider: str = "dashscope",
         answering_model: str = "qwen-turbo-latest",
-        domain: str = "universal"
+        domain: str = "universal",
+        semantic_cache_threshold: Optional[float] = 0.95
     ):
         from src.single_pdf_processor import SinglePDFProcessor
         self.domain = domain
@@ -255,7 +371,8 @@ class SinglePDFPipeline:
             use_llm_reranking=use_llm_reranking,
             embedding_provider=embedding_provider,
             answering_model=answering_model,
-            domain=domain
+            domain=domain,
+            semantic_cache_threshold=semantic_cache_threshold
         )
 
     def upload_pdf(self, pdf_path: str, document_name: str = None) -> dict:
@@ -264,6 +381,9 @@ class SinglePDFPipeline:
     def answer_question(self, question: str, kind: str = "string") -> dict:
         return self.processor.answer_question(question, kind)
 
+    async def aanswer_question(self, question: str, kind: str = "string") -> dict:
+        return await self.processor.aanswer_question(question, kind)
+
     def get_documents(self) -> list:
         return self.processor.get_uploaded_documents()
 
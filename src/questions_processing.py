@@ -2,7 +2,8 @@ import json
 from typing import Union, Dict, List, Optional
 import re
 from pathlib import Path
-from src.retrieval import VectorRetriever, HybridRetriever
+from src.retriever_registry import get_retriever_registry
+from src.retrieval_cache import get_retrieval_cache
 from src.api_requests import APIProcessor
 from tqdm import tqdm
 import pandas as pd
@@ -27,7 +28,14 @@ class QuestionsProcessor:
         parallel_requests: int = 10, # 支持并行处理，提升吞吐量
         api_provider: str = "dashscope", # openai
         answering_model: str = "qwen-turbo-latest", # gpt-4o-2024-08-06
-        full_context: bool = False
+        full_context: bool = False,
+        hnsw_ef_search: Optional[int] = None, # HNSW 索引检索参数
+        ivf_nprobe: Optional[int] = None, # IVF 索引检索参数
+        rescore_factor: int = 0, # 量化索引的全精度重打分倍数，0 表示不重打分
+        retriever_cache_mb: Optional[float] = 1024, # 检索器按需加载报告的内存上限
+        embedding_provider: str = "dashscope", # 检索嵌入来源：dashscope/openai/local，需与入库时一致
+        bm25_db_dir: Optional[Union[str, Path]] = None, # 给出时BM25与向量检索融合召回
+        fusion_method: str = "rrf" # 融合方式：rrf/weighted
     ):
         # 初始化问题处理器，配置检索、模型、并发等参数
         self.questions = self._load_questions(questions_file_path) # 需要解析json，所以调用了函数
@@ -44,10 +52,19 @@ class QuestionsProcessor:
         self.api_provider = api_provider
         self.openai_processor = APIProcessor(provider=api_provider)
         self.full_context = full_context
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nprobe = ivf_nprobe
+        self.rescore_factor = rescore_factor
+        self.retriever_cache_mb = retriever_cache_mb
+        self.embedding_provider = embedding_provider
+        self.bm25_db_dir = Path(bm25_db_dir) if bm25_db_dir is not None else None
+        self.fusion_method = fusion_method
 
         self.answer_details = []
         self.detail_counter = 0
         self._lock = threading.Lock()
+        # 批量处理时预先检索的结果：(公司名, 问题) -> 检索结果（启用LLM重排时为重排前的向量检索候选）
+        self._prefetched_retrievals: Dict[tuple, list] = {}
 
     def _load_questions(self, questions_file_path: Optional[Union[str, Path]]) -> List[Dict[str, str]]:
         # 加载问题文件，返回问题列表
@@ -103,7 +120,8 @@ class QuestionsProcessor:
             
             for result in retrieval_results:
                 page = result['page']
-                if page not in existing_pages:
+                # 页码 0 表示没有原文页码（如 markdown 报告的合成页面），不作为引用页补充
+                if page and page not in existing_pages:
                     validated_pages.append(page)
                     existing_pages.add(page)
                     
@@ -118,23 +136,41 @@ class QuestionsProcessor:
 
     # 检索增强核心函数
     # 负责针对特定公司的问题进行智能问答---若使用需要改动
+    def _get_retriever(self):
+        # 检索器由进程内注册表共享：索引只在首次使用或磁盘文件变化时加载，不随每个问题重建
+        registry = get_retriever_registry()
+        kwargs = dict(
+            vector_db_dir=self.vector_db_dir,
+            documents_dir=self.documents_dir,
+            embedding_provider=self.embedding_provider,
+            ef_search=self.hnsw_ef_search,
+            nprobe=self.ivf_nprobe,
+            rescore_factor=self.rescore_factor,
+            max_cache_mb=self.retriever_cache_mb
+        )
+        # 有BM25索引时先融合BM25与向量召回，启用LLM重排时再对融合结果重排
+        if self.llm_reranking:
+            return registry.hybrid_retriever(**kwargs, bm25_db_dir=self.bm25_db_dir, fusion_method=self.fusion_method)
+        if self.bm25_db_dir is not None:
+            return registry.fusion_retriever(**kwargs, bm25_db_dir=self.bm25_db_dir, fusion_method=self.fusion_method)
+        return registry.vector_retriever(**kwargs)
+
     def get_answer_for_company(self, company_name: str, question: str, schema: str) -> dict:
         # 针对单个公司，检索上下文并调用LLM生成答案
-        t0 = time.time() # 记录初始化检索开始时间
-        if self.llm_reranking:
-            retriever = HybridRetriever(
-                vector_db_dir=self.vector_db_dir,
-                documents_dir=self.documents_dir
-            )
-        else:
-            retriever = VectorRetriever(
-                vector_db_dir=self.vector_db_dir,
-                documents_dir=self.documents_dir
-            )
-        t1 = time.time() # 记录初始化检索结束时间
-        print(f"[计时] [get_answer_for_company] 检索器初始化耗时: {t1-t0:.2f} 秒")
+        t0 = time.time() # 记录获取检索器开始时间
+        retriever = self._get_retriever()
+        t1 = time.time() # 记录获取检索器结束时间
+        print(f"[计时] [get_answer_for_company] 获取检索器耗时: {t1-t0:.2f} 秒")
+        prefetched = self._prefetched_retrievals.get((company_name, question))
         if self.full_context: # 默认是false
             retrieval_results = retriever.retrieve_all(company_name)
+        elif prefetched is not None:
+            # 使用批量检索的结果，启用LLM重排时只需重排
+            if self.llm_reranking:
+                retrieval_results = retriever.rerank(query=question, vector_results=prefetched, top_n=self.top_n_retrieval)
+            else:
+                retrieval_results = prefetched
+            print("[计时] [get_answer_for_company] 使用批量检索结果")
         else:           
             t2 = time.time()
             retrieval_results = retriever.retrieve_by_company_name(
@@ -169,6 +205,37 @@ class QuestionsProcessor:
         print(f"[计时] [get_answer_for_company] 总耗时: {t6-t0:.2f} 秒")
         return answer_dict
 
+    def _prefetch_retrievals(self, questions_list: List[dict]):
+        """
+        批量检索全部问题：问题嵌入合并为批量请求，同一报告的检索合并为一次矩阵检索，
+        结果在逐题作答时直接使用。批量检索失败时退回逐题检索，错误在对应问题中记录。
+        """
+        self._prefetched_retrievals = {}
+        if self.full_context or not questions_list:
+            return
+        key = "text" if self.new_challenge_pipeline else "question"
+        questions = list(dict.fromkeys(q.get(key) for q in questions_list if q.get(key)))
+        # 与 process_question 一致，问题不区分公司（公司名为空字符串）
+        company_names = [""] * len(questions)
+        retriever = self._get_retriever()
+        vector_retriever = retriever.vector_retriever if self.llm_reranking else retriever
+        top_n = self.llm_reranking_sample_size if self.llm_reranking else self.top_n_retrieval
+        t0 = time.time()
+        try:
+            results = vector_retriever.retrieve_many(
+                queries=questions,
+                company_names=company_names,
+                top_n=top_n,
+                return_parent_pages=self.return_parent_pages
+            )
+        except Exception as e:
+            print(f"批量检索失败，改为逐题检索: {e}")
+            return
+        self._prefetched_retrievals = {
+            (company_name, question): result for company_name, question, result in zip(company_names, questions, results)
+        }
+        print(f"[计时] 批量检索 {len(questions)} 个问题耗时: {time.time()-t0:.2f} 秒")
+
     def _extract_companies_from_subset(self, question_text: str) -> list[str]:
         """从问题文本中提取公司名，现在直接返回空列表，因为不再使用subset.csv"""
         # 由于不再使用subset.csv，返回空列表
@@ -222,6 +289,7 @@ class QuestionsProcessor:
         self.answer_details = [None] * total_questions  # 预分配答案详情列表
         processed_questions = []
         parallel_threads = self.parallel_requests
+        self._prefetch_retrievals(questions_list)
 
         if parallel_threads <= 1:
             # 单线程顺序处理
@@ -244,6 +312,8 @@ class QuestionsProcessor:
                         self._save_progress(processed_questions, output_path, submission_file=submission_file, pipeline_details=pipeline_details)
                     pbar.update(len(batch_results))
         
+        self._prefetched_retrievals = {}
+        print(f"检索结果缓存统计: {get_retrieval_cache().stats()}")
         statistics = self._calculate_statistics(processed_questions, print_stats = True)
         
         return {
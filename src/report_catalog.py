@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import difflib
+import logging
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+_log = logging.getLogger(__name__)
+
+# 生成别名时去掉的公司名后缀（按长度从长到短尝试）：英文后缀只按整词去掉，中文后缀按结尾去掉
+_COMPANY_SUFFIXES = sorted([
+    "股份有限公司", "有限责任公司", "有限公司", "集团股份", "集团", "控股", "股份", "公司",
+    "incorporated", "corporation", "holdings", "limited", "company", "group", "corp", "inc", "ltd", "plc", "co",
+], key=len, reverse=True)
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_name(name: str) -> str:
+    """公司名归一化：全角转半角、忽略大小写、去掉空白和标点"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", name or "").casefold())
+
+
+def company_aliases(company_name: str, extra: Optional[List[str]] = None) -> List[str]:
+    """公司名的别名：metainfo 中显式给出的 aliases，以及去掉 "股份有限公司"、"Inc." 等后缀后的简称"""
+    aliases = [alias for alias in (extra or []) if alias and alias != company_name]
+    # 先按空白和标点切词再去后缀，避免 "Tesco PLC" 连写后把 "tesco" 末尾的 "co" 也当作后缀
+    tokens = [token for token in _NON_WORD.split(unicodedata.normalize("NFKC", company_name or "").casefold()) if token]
+    stripped = True
+    while stripped and tokens:
+        stripped = False
+        last = tokens[-1]
+        for suffix in _COMPANY_SUFFIXES:
+            if last == suffix and len(tokens) > 1:
+                tokens.pop()
+            elif not suffix.isascii() and last.endswith(suffix) and len(last) > len(suffix) + 1:
+                tokens[-1] = last[:-len(suffix)]
+            else:
+                continue
+            stripped = True
+            break
+    short = "".join(tokens)
+    if short and short != normalize_name(company_name) and short not in aliases:
+        aliases.append(short)
+    return aliases
+
+
+# ReportCatalog：分块报告的元数据目录（sha1、公司名、文件名、别名、页数、文本块数），检索器启动时只读这一份小文件
+# 公司名和别名的归一化形式建有哈希索引，查找报告不需要读取报告正文
+class ReportCatalog:
+    FILE_NAME = "report_catalog.json"
+    # 条目字段或别名规则变化时递增，旧版本目录会被整体重新解析一次
+    VERSION = 3
+    # 模糊匹配只在其余方式都找不到时使用，且只接受唯一的高相似度候选（"中国银行" 与 "中国建设银行" 的相似度为 0.8）
+    FUZZY_CUTOFF = 0.9
+
+    def __init__(self, documents_dir: Path, catalog_dir: Path):
+        self.documents_dir = Path(documents_dir)
+        self.path = Path(catalog_dir) / self.FILE_NAME
+        # (entries, 公司名索引, 别名索引) 三元组，refresh 构建好新的一组后整体替换，检索线程不会看到半更新的状态
+        # entries: sha1 -> {"document_file", "company_name", "file_name", "aliases", "page_count", "chunk_count", "size", "mtime_ns"}，按文件名排序
+        # 公司名 / 别名索引: 归一化名称 -> [sha1]，保持 entries 的顺序
+        self._snapshot: Tuple[Dict[str, dict], Dict[str, List[str]], Dict[str, List[str]]] = ({}, {}, {})
+
+    @classmethod
+    def load(cls, documents_dir: Path, catalog_dir: Path) -> "ReportCatalog":
+        """读取已保存的目录，并按文件大小和修改时间只重新解析新增或变化的报告"""
+        catalog = cls(documents_dir, catalog_dir)
+        cached = catalog._read()
+        if catalog.refresh(cached):
+            catalog.save()
+        return catalog
+
+    def _read(self) -> Dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+        if data.get("version") != self.VERSION:
+            return {}
+        return data.get("reports", {})
+
+    def refresh(self, cached: Optional[Dict[str, dict]] = None) -> bool:
+        """与报告目录同步，返回目录内容是否有变化"""
+        cached = self.entries if cached is None else cached
+        by_file = {entry["document_file"]: (sha1, entry) for sha1, entry in cached.items()}
+        entries = {}
+        for document_path in sorted(self.documents_dir.glob("*.json")):
+            stat = document_path.stat()
+            sha1, entry = by_file.get(document_path.name, (None, None))
+            if entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+                sha1, entry = self._read_metainfo(document_path, stat)
+            if sha1:
+                entries[sha1] = entry
+        changed = entries != cached
+        self._snapshot = (entries, *self._build_index(entries))
+        return changed
+
+    @property
+    def entries(self) -> Dict[str, dict]:
+        return self._snapshot[0]
+
+    @staticmethod
+    def _build_index(entries: Dict[str, dict]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        by_company, by_alias = {}, {}
+        for sha1, entry in entries.items():
+            by_company.setdefault(normalize_name(entry["company_name"]), []).append(sha1)
+            for alias in entry.get("aliases", []):
+                key = normalize_name(alias)
+                if key:
+                    by_alias.setdefault(key, []).append(sha1)
+        return by_company, by_alias
+
+    @staticmethod
+    def _read_metainfo(document_path: Path, stat: os.stat_result):
+        try:
+            with open(document_path, 'r', encoding='utf-8') as f:
+                document = json.load(f)
+        except Exception as e:
+            _log.error(f"Error loading JSON from {document_path.name}: {e}")
+            return None, None
+        metainfo = document.get("metainfo", {})
+        content = document.get("content", {})
+        chunks = content.get("chunks", [])
+        # markdown 分块报告没有 pages，按文本块的页码计数
+        page_count = len(content["pages"]) if "pages" in content else len({chunk.get("page") for chunk in chunks if chunk.get("page") is not None})
+        sha1 = metainfo.get("sha1")
+        if not sha1:
+            _log.warning(f"No sha1 found in metainfo for document {document_path.name}")
+            return None, None
+        company_name = metainfo.get("company_name", "")
+        return sha1, {
+            "document_file": document_path.name,
+            "company_name": company_name,
+            "file_name": metainfo.get("file_name", ""),
+            "aliases": company_aliases(company_name, metainfo.get("aliases")),
+            "page_count": page_count,
+            "chunk_count": len(chunks),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns
+        }
+
+    def save(self):
+        # 先写临时文件再替换，多个进程同时刷新时不会读到半个文件
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.VERSION, "reports": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __contains__(self, sha1: str) -> bool:
+        return sha1 in self.entries
+
+    def document_path(self, sha1: str) -> Path:
+        return self.documents_dir / self.entries[sha1]["document_file"]
+
+    def get(self, sha1: str) -> Optional[dict]:
+        return self.entries.get(sha1)
+
+    def find(self, company_name: str, exact: bool = False, predicate: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        按公司名查找报告 sha1，依次尝试：
+        1. 公司名（归一化后）哈希查找
+        2. 别名哈希查找
+        3. exact=False 时：公司名包含在文件名中
+        4. exact=False 且以上都找不到时：与公司名或别名的模糊匹配（difflib 相似度不低于 FUZZY_CUTOFF），
+           多家公司都达到阈值时视为有歧义，不返回
+        """
+        def first(sha1s: List[str]) -> Optional[str]:
+            return next((sha1 for sha1 in sha1s if predicate is None or predicate(sha1)), None)
+
+        entries, by_company, by_alias = self._snapshot
+        key = normalize_name(company_name)
+        sha1 = first(by_company.get(key, [])) or first(by_alias.get(key, []))
+        if sha1 is not None or exact:
+            return sha1
+        sha1 = first([sha1 for sha1, entry in entries.items() if company_name in entry["file_name"]])
+        if sha1 is not None or not key:
+            return sha1
+        # 归一化公司名 -> 该公司第一份满足条件的报告
+        candidates: Dict[str, str] = {}
+        for index in (by_company, by_alias):
+            for match in difflib.get_close_matches(key, list(index), n=3, cutoff=self.FUZZY_CUTOFF):
+                sha1 = first(index[match])
+                if sha1 is not None:
+                    candidates.setdefault(normalize_name(entries[sha1]["company_name"]), sha1)
+        if len(candidates) > 1:
+            names = [entries[sha1]["company_name"] for sha1 in candidates.values()]
+            _log.warning(f"公司名 '{company_name}' 模糊匹配到多家公司 {names}，不使用模糊匹配")
+            return None
+        sha1 = next(iter(candidates.values()), None)
+        if sha1 is not None:
+            _log.warning(f"公司名 '{company_name}' 没有精确匹配，模糊匹配到 '{entries[sha1]['company_name']}'")
+        return sha1
+
+    def sha1s(self, predicate: Optional[Callable[[str], bool]] = None) -> List[str]:
+        return [sha1 for sha1 in self.entries if predicate is None or predicate(sha1)]
@@ -1,8 +1,12 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 from openai import OpenAI
+from openai.lib._parsing import type_to_response_format_param
 import requests
 import src.prompts as prompts
+from src import async_http
+from src.api_endpoints import configure_dashscope
 from concurrent.futures import ThreadPoolExecutor
 
 
@@ -52,14 +56,37 @@ class LLMReranker:
             return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         elif self.provider == "dashscope":
             import dashscope
-            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+            configure_dashscope()
             return dashscope
         else:
             raise ValueError(f"不支持的 LLM provider: {self.provider}")
     
+    @staticmethod
+    def _single_block_prompt(query, retrieved_document):
+        return f'/nHere is the query:/n"{query}"/n/nHere is the retrieved text block:/n"""/n{retrieved_document}/n"""/n'
+
+    @staticmethod
+    def _multiple_blocks_prompt(query, retrieved_documents):
+        formatted_blocks = "\n\n---\n\n".join([f'Block {i+1}:\n\n"""\n{text}\n"""' for i, text in enumerate(retrieved_documents)])
+        return (
+            f"Here is the query: \"{query}\"\n\n"
+            "Here are the retrieved text blocks:\n"
+            f"{formatted_blocks}\n\n"
+            f"You should provide exactly {len(retrieved_documents)} rankings, in order."
+        )
+
+    @staticmethod
+    def _dashscope_content(rsp):
+        # 健壮性检查，防止 rsp 为 None 或非 dict
+        if not rsp or not isinstance(rsp, dict):
+            raise RuntimeError(f"DashScope返回None或非dict: {rsp}")
+        if 'output' in rsp and 'choices' in rsp['output']:
+            return rsp['output']['choices'][0]['message']['content']
+        raise RuntimeError(f"DashScope返回格式异常: {rsp}")
+
     def get_rank_for_single_block(self, query, retrieved_document):
         # 针对单个文本块，调用LLM进行相关性评分
-        user_prompt = f'/nHere is the query:/n"{query}"/n/nHere is the retrieved text block:/n"""/n{retrieved_document}/n"""/n'
+        user_prompt = self._single_block_prompt(query, retrieved_document)
         if self.provider == "openai":
             completion = self.llm.beta.chat.completions.parse(
                 model="gpt-4o-mini-2024-07-18",
@@ -85,27 +112,14 @@ class LLMReranker:
                 temperature=0,
                 result_format='message'
             )
-            # 健壮性检查，防止 rsp 为 None 或非 dict
-            if not rsp or not isinstance(rsp, dict):
-                raise RuntimeError(f"DashScope返回None或非dict: {rsp}")
-            if 'output' in rsp and 'choices' in rsp['output']:
-                content = rsp['output']['choices'][0]['message']['content']
-                # 这里只返回字符串，后续可按需解析
-                return {"relevance_score": 0.0, "reasoning": content}
-            else:
-                raise RuntimeError(f"DashScope返回格式异常: {rsp}")
+            # 这里只返回字符串，后续可按需解析
+            return {"relevance_score": 0.0, "reasoning": self._dashscope_content(rsp)}
         else:
             raise ValueError(f"不支持的 LLM provider: {self.provider}")
 
     def get_rank_for_multiple_blocks(self, query, retrieved_documents):
         # 针对多个文本块，批量调用LLM进行相关性评分
-        formatted_blocks = "\n\n---\n\n".join([f'Block {i+1}:\n\n"""\n{text}\n"""' for i, text in enumerate(retrieved_documents)])
-        user_prompt = (
-            f"Here is the query: \"{query}\"\n\n"
-            "Here are the retrieved text blocks:\n"
-            f"{formatted_blocks}\n\n"
-            f"You should provide exactly {len(retrieved_documents)} rankings, in order."
-        )
+        user_prompt = self._multiple_blocks_prompt(query, retrieved_documents)
         if self.provider == "openai":
             completion = self.llm.beta.chat.completions.parse(
                 model="gpt-4o-mini-2024-07-18",
@@ -130,20 +144,84 @@ class LLMReranker:
                 temperature=0,
                 result_format='message'
             )
-            # 健壮性检查，防止 rsp 为 None 或非 dict
-            if not rsp or not isinstance(rsp, dict):
-                raise RuntimeError(f"DashScope返回None或非dict: {rsp}")
-            #print('rsp=', rsp)
-            if 'output' in rsp and 'choices' in rsp['output']:
-                content = rsp['output']['choices'][0]['message']['content']
-                # 这里只返回字符串，后续可按需解析
-                # api_requests.py中的BaseDashscopeProcessor类已经正确实现了属性访问方式
-                return {"block_rankings": [{"relevance_score": 0.0, "reasoning": content} for _ in retrieved_documents]}
-            else:
-                raise RuntimeError(f"DashScope返回格式异常: {rsp}")
+            content = self._dashscope_content(rsp)
+            # 这里只返回字符串，后续可按需解析
+            # api_requests.py中的BaseDashscopeProcessor类已经正确实现了属性访问方式
+            return {"block_rankings": [{"relevance_score": 0.0, "reasoning": content} for _ in retrieved_documents]}
         else:
             raise ValueError(f"不支持的 LLM provider: {self.provider}")
 
+    async def _arequest_rank(self, system_prompt, user_prompt, schema):
+        # 异步调用LLM评分：openai 返回解析后的结构化结果，dashscope 返回原始字符串
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        if self.provider == "openai":
+            rsp = await async_http.openai_chat({
+                "model": "gpt-4o-mini-2024-07-18",
+                "temperature": 0,
+                "messages": messages,
+                "response_format": type_to_response_format_param(schema)
+            })
+            return schema.model_validate_json(rsp["choices"][0]["message"]["content"]).model_dump()
+        elif self.provider == "dashscope":
+            rsp = await async_http.dashscope_generation("qwen-turbo", messages, temperature=0)
+            return self._dashscope_content(rsp)
+        else:
+            raise ValueError(f"不支持的 LLM provider: {self.provider}")
+
+    async def aget_rank_for_single_block(self, query, retrieved_document):
+        ranking = await self._arequest_rank(
+            self.system_prompt_rerank_single_block,
+            self._single_block_prompt(query, retrieved_document),
+            self.schema_for_single_block
+        )
+        if isinstance(ranking, str):
+            return {"relevance_score": 0.0, "reasoning": ranking}
+        return ranking
+
+    async def aget_rank_for_multiple_blocks(self, query, retrieved_documents):
+        rankings = await self._arequest_rank(
+            self.system_prompt_rerank_multiple_blocks,
+            self._multiple_blocks_prompt(query, retrieved_documents),
+            self.schema_for_multiple_blocks
+        )
+        if isinstance(rankings, str):
+            return {"block_rankings": [{"relevance_score": 0.0, "reasoning": rankings} for _ in retrieved_documents]}
+        return rankings
+
+    @staticmethod
+    def _score_batch(batch, block_rankings, llm_weight):
+        # 融合LLM相关性分数和向量分数；LLM返回的评分不足时以0分补齐
+        vector_weight = 1 - llm_weight
+        block_rankings = list(block_rankings)
+        if len(block_rankings) < len(batch):
+            print(f"\nWarning: Expected {len(batch)} rankings but got {len(block_rankings)}")
+            for i in range(len(block_rankings), len(batch)):
+                doc = batch[i]
+                print(f"Missing ranking for document on page {doc.get('page', 'unknown')}:")
+                print(f"Text preview: {doc['text'][:100]}...\n")
+
+            for _ in range(len(batch) - len(block_rankings)):
+                block_rankings.append({
+                    "relevance_score": 0.0,
+                    "reasoning": "Default ranking due to missing LLM response"
+                })
+
+        results = []
+        for doc, rank in zip(batch, block_rankings):
+            doc_with_score = doc.copy()
+            doc_with_score["relevance_score"] = rank["relevance_score"]
+            # 计算融合分数，distance越小越相关
+            doc_with_score["combined_score"] = round(
+                llm_weight * rank["relevance_score"] +
+                vector_weight * doc['distance'],
+                4
+            )
+            results.append(doc_with_score)
+        return results
+
     def rerank_documents(self, query: str, documents: list, documents_batch_size: int = 4, llm_weight: float = 0.7):
         """
         使用多线程并行方式对多个文档进行重排。
@@ -158,68 +236,44 @@ class LLMReranker:
         """
         # 按batch分组
         doc_batches = [documents[i:i + documents_batch_size] for i in range(0, len(documents), documents_batch_size)]
-        vector_weight = 1 - llm_weight
-        
+
         if documents_batch_size == 1:
-            def process_single_doc(doc):
+            def process_batch(batch):
                 # 单文档重排
-                ranking = self.get_rank_for_single_block(query, doc['text'])
-                
-                doc_with_score = doc.copy()
-                doc_with_score["relevance_score"] = ranking["relevance_score"]
-                # 计算融合分数，distance越小越相关
-                doc_with_score["combined_score"] = round(
-                    llm_weight * ranking["relevance_score"] + 
-                    vector_weight * doc['distance'],
-                    4
-                )
-                return doc_with_score
-
-            # 多线程并行处理，max_workers=1 保证 dashscope LLM 串行调用，避免 QPS 超限
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                all_results = list(executor.map(process_single_doc, documents))
-                
+                return self._score_batch(batch, [self.get_rank_for_single_block(query, batch[0]['text'])], llm_weight)
         else:
             def process_batch(batch):
                 # 批量重排
-                texts = [doc['text'] for doc in batch]
-                rankings = self.get_rank_for_multiple_blocks(query, texts)
-                results = []
-                block_rankings = rankings.get('block_rankings', [])
-                
-                if len(block_rankings) < len(batch):
-                    print(f"\nWarning: Expected {len(batch)} rankings but got {len(block_rankings)}")
-                    for i in range(len(block_rankings), len(batch)):
-                        doc = batch[i]
-                        print(f"Missing ranking for document on page {doc.get('page', 'unknown')}:")
-                        print(f"Text preview: {doc['text'][:100]}...\n")
-                    
-                    for _ in range(len(batch) - len(block_rankings)):
-                        block_rankings.append({
-                            "relevance_score": 0.0, 
-                            "reasoning": "Default ranking due to missing LLM response"
-                        })
-                
-                for doc, rank in zip(batch, block_rankings):
-                    doc_with_score = doc.copy()
-                    doc_with_score["relevance_score"] = rank["relevance_score"]
-                    doc_with_score["combined_score"] = round(
-                        llm_weight * rank["relevance_score"] + 
-                        vector_weight * doc['distance'],
-                        4
-                    )
-                    results.append(doc_with_score)
-                return results
-
-            # 多线程并行处理，max_workers=1 保证 dashscope LLM 串行调用，避免 QPS 超限
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                batch_results = list(executor.map(process_batch, doc_batches))
-            
-            # 扁平化结果
-            all_results = []
-            for batch in batch_results:
-                all_results.extend(batch)
-        
+                rankings = self.get_rank_for_multiple_blocks(query, [doc['text'] for doc in batch])
+                return self._score_batch(batch, rankings.get('block_rankings', []), llm_weight)
+
+        # 多线程并行处理，max_workers=1 保证 dashscope LLM 串行调用，避免 QPS 超限
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batch_results = list(executor.map(process_batch, doc_batches))
+
+        # 扁平化结果
+        all_results = []
+        for batch in batch_results:
+            all_results.extend(batch)
+
         # 按融合分数降序排序
         all_results.sort(key=lambda x: x["combined_score"], reverse=True)
         return all_results
+
+    async def arerank_documents(self, query: str, documents: list, documents_batch_size: int = 4, llm_weight: float = 0.7):
+        """
+        rerank_documents 的异步版本：所有批次的评分请求同时在途，
+        并发上限由 async_http 的共享连接池约束，429 由其退避重试。
+        """
+        doc_batches = [documents[i:i + documents_batch_size] for i in range(0, len(documents), documents_batch_size)]
+
+        async def process_batch(batch):
+            if documents_batch_size == 1:
+                return self._score_batch(batch, [await self.aget_rank_for_single_block(query, batch[0]['text'])], llm_weight)
+            rankings = await self.aget_rank_for_multiple_blocks(query, [doc['text'] for doc in batch])
+            return self._score_batch(batch, rankings.get('block_rankings', []), llm_weight)
+
+        batch_results = await asyncio.gather(*(process_batch(batch) for batch in doc_batches))
+        all_results = [doc for batch in batch_results for doc in batch]
+        all_results.sort(key=lambda x: x["combined_score"], reverse=True)
+        return all_results
@@ -1,6 +1,7 @@
+import asyncio
 import json
 import logging
-from typing import List, Tuple, Dict, Union
+from typing import List, Tuple, Dict, Optional, Union
 from rank_bm25 import BM25Okapi
 import pickle
 from pathlib import Path
@@ -9,68 +10,150 @@ from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import numpy as np
+from src.api_endpoints import configure_dashscope
+from src import async_http
 from src.reranking import LLMReranker
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.embedding_dispatcher import EmbeddingDispatcher
+from src.retrieval_cache import RetrievalCache, get_retrieval_cache, normalize_query
+from src.vector_index import read_index, set_search_params
+from src.report_catalog import ReportCatalog
+from src.chunk_store import ChunkStore
+from src.chunk_dedup import load_vector_chunk_ids, vector_chunk_ids_path
+from src.local_embedding import LocalEmbedder
+from src.corpus_index import CorpusIndex
+from src.bm25_index import BM25Index
+from src.tokenization import tokenizer_from_params
 import hashlib
 import pandas as pd
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 _log = logging.getLogger(__name__)
 
+
+def _file_stamp(*paths: Path) -> tuple:
+    # 文件大小和修改时间，用于判断检索器加载的文件在磁盘上是否变化（不存在的文件记为 None）
+    stamps = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def _page_fields(chunk_store: ChunkStore, page: Optional[int]) -> Dict:
+    # 检索结果的页码字段：markdown 报告的合成页码不是原文页码，不能用于引用，page 记为 0，另存为 synthetic_page
+    if chunk_store.synthetic_pages:
+        return {"page": 0, "synthetic_page": page} if page is not None else {"page": 0}
+    return {"page": page or 0}
+
+
 class BM25Retriever:
     def __init__(self, bm25_db_dir: Path, documents_dir: Path):
         self.bm25_db_dir = bm25_db_dir
         self.documents_dir = documents_dir
-        
+        # 按公司名查找报告只读元数据目录，不再逐个解析分块报告 JSON
+        self.catalog = ReportCatalog.load(documents_dir, bm25_db_dir)
+        # 已加载的BM25索引和文本块存储，按 sha1 缓存，避免每次查询重新读文件
+        self._indexes: Dict[str, Union[BM25Index, BM25Okapi]] = {}
+        self._chunk_stores: Dict[str, ChunkStore] = {}
+        self._stamps: Dict[str, tuple] = {}
+
+    def _report_stamp(self, sha1: str) -> tuple:
+        return _file_stamp(
+            self.catalog.document_path(sha1),
+            self.bm25_db_dir / f"{sha1}.bm25.npz",
+            self.bm25_db_dir / f"{sha1}.pkl"
+        )
+
+    def refresh(self) -> bool:
+        """重新同步报告目录，文件有变化的报告丢弃已加载的索引和文本块存储，返回是否有变化"""
+        changed = self.catalog.refresh()
+        if changed:
+            self.catalog.save()
+        for sha1, stamp in list(self._stamps.items()):
+            if sha1 not in self.catalog or self._report_stamp(sha1) != stamp:
+                self._indexes.pop(sha1, None)
+                self._chunk_stores.pop(sha1, None)
+                del self._stamps[sha1]
+                changed = True
+        return changed
+
+    def _load_index(self, sha1: str) -> Union[BM25Index, BM25Okapi]:
+        if sha1 not in self._stamps:
+            self._stamps[sha1] = self._report_stamp(sha1)
+        if sha1 not in self._indexes:
+            index_path = self.bm25_db_dir / f"{sha1}.bm25.npz"
+            if index_path.exists():
+                self._indexes[sha1] = BM25Index.load(index_path)
+            else:
+                # 兼容旧版本生成的 pickle 索引
+                with open(self.bm25_db_dir / f"{sha1}.pkl", 'rb') as f:
+                    self._indexes[sha1] = pickle.load(f)
+        return self._indexes[sha1]
+
+    def _load_chunk_store(self, sha1: str) -> ChunkStore:
+        if sha1 not in self._chunk_stores:
+            self._chunk_stores[sha1] = ChunkStore.open(self.documents_dir, self.catalog.document_path(sha1), sha1)
+        return self._chunk_stores[sha1]
+
+    def has_index(self, sha1: str) -> bool:
+        return (self.bm25_db_dir / f"{sha1}.bm25.npz").exists() or (self.bm25_db_dir / f"{sha1}.pkl").exists()
+
+    def search(self, sha1: str, query: str, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回报告内BM25得分最高的 top_n 个文本块下标及分数（降序）"""
+        # 加载对应的BM25索引，文件名用 sha1
+        bm25_index = self._load_index(sha1)
+        # 计算BM25分数，只对查询词的倒排记录打分，argpartition 取 top_n
+        # 查询使用与建索引时相同的分词器，转换为 token id
+        if isinstance(bm25_index, BM25Index) and bm25_index.tokenizer_params:
+            tokenized_query = tokenizer_from_params(bm25_index.tokenizer_params).encode(query)
+        else:
+            tokenized_query = query.split()
+        if isinstance(bm25_index, BM25Index):
+            top_indices, top_scores = bm25_index.top_k(tokenized_query, top_n)
+        else:
+            scores = bm25_index.get_scores(tokenized_query)
+            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:min(top_n, len(scores))]
+            top_scores = [scores[i] for i in top_indices]
+        return np.asarray(top_indices, dtype=np.int64), np.asarray(top_scores, dtype=np.float32)
+
     def retrieve_by_company_name(self, company_name: str, query: str, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
-        document_path = None
-        for path in self.documents_dir.glob("*.json"):
-            with open(path, 'r', encoding='utf-8') as f:
-                doc = json.load(f)
-                if doc["metainfo"]["company_name"] == company_name:
-                    document_path = path
-                    document = doc
-                    break
-        if document_path is None:
+        sha1 = self.catalog.find(company_name, exact=True)
+        if sha1 is None:
             raise ValueError(f"No report found with '{company_name}' company name.")
-        # 加载对应的BM25索引，文件名用 sha1
-        bm25_path = self.bm25_db_dir / f"{document['metainfo']['sha1']}.pkl"
-        with open(bm25_path, 'rb') as f:
-            bm25_index = pickle.load(f)
-            
-        # 获取文档内容和BM25索引
-        document = document
-        chunks = document["content"]["chunks"]
-        pages = document["content"]["pages"]
-        
-        # 计算BM25分数
-        tokenized_query = query.split()
-        scores = bm25_index.get_scores(tokenized_query)
-        
-        actual_top_n = min(top_n, len(scores))
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:actual_top_n]
+        top_indices, top_scores = self.search(sha1, query, top_n)
+        # 文本块按需从内存映射的存储中读取，只解码返回的 top_n 条
+        chunk_store = self._load_chunk_store(sha1)
         
         retrieval_results = []
         seen_pages = set()
         
-        for index in top_indices:
-            score = round(float(scores[index]), 4)
-            chunk = chunks[index]
-            parent_page = next(page for page in pages if page["page"] == chunk["page"])
+        for index, score in zip(top_indices, top_scores):
+            score = round(float(score), 4)
+            page = chunk_store.parent_page(index)
+            parent_text = chunk_store.page_text(page) if return_parent_pages and page is not None else None
             
-            if return_parent_pages:
-                if parent_page["page"] not in seen_pages:
-                    seen_pages.add(parent_page["page"])
+            if parent_text is not None:
+                if page not in seen_pages:
+                    seen_pages.add(page)
                     result = {
                         "distance": score,
-                        "page": parent_page["page"],
-                        "text": parent_page["text"]
+                        **_page_fields(chunk_store, page),
+                        "text": parent_text
                     }
                     retrieval_results.append(result)
             else:
                 result = {
                     "distance": score,
-                    "page": chunk["page"],
-                    "text": chunk["text"]
+                    **_page_fields(chunk_store, page),
+                    "text": chunk_store.text(index)
                 }
                 retrieval_results.append(result)
         
@@ -78,14 +161,62 @@ class BM25Retriever:
 
 
 class VectorRetriever:
-    def __init__(self, vector_db_dir: Path, documents_dir: Path, embedding_provider: str = "dashscope"):
-        # 初始化向量检索器，加载所有向量库和文档
-        self.vector_db_dir = vector_db_dir
-        self.documents_dir = documents_dir
-        self.all_dbs = self._load_dbs()
-        # 默认使用 dashscope 作为 embedding provider
+    # 各 embedding provider 使用的模型，同时作为嵌入缓存的命名空间
+    EMBEDDING_MODELS = {
+        "openai": "text-embedding-3-large",
+        "dashscope": "text-embedding-v1"
+    }
+    # 批量嵌入查询时每次请求的条数（DashScope text-embedding-v1 单次最多 25 条）
+    EMBEDDING_BATCH_SIZE = 25
+    # 并行检索多个分报告索引的线程数（faiss 检索时释放 GIL）
+    SEARCH_THREADS = min(8, os.cpu_count() or 1)
+
+    def __init__(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        embedding_provider: str = "dashscope",
+        embedding_cache: Optional[EmbeddingCache] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024,
+        result_cache: Optional[RetrievalCache] = None
+    ):
+        # 初始化向量检索器：启动时只加载报告元数据目录和全语料索引（内存映射），
+        # 报告正文和分报告索引在首次使用时加载，按 LRU 在 max_cache_mb 内存上限内保留
+        self.vector_db_dir = Path(vector_db_dir)
+        self.documents_dir = Path(documents_dir)
+        # ANN 检索参数：HNSW 的 efSearch、IVF 的 nprobe（flat 索引忽略）
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        # 量化索引取 top_n*rescore_factor 个候选，用全精度向量重打分（0 表示不重打分）
+        self.rescore_factor = rescore_factor
+        # 全语料索引存在时，所有报告共用一个索引，按文档 id 过滤检索
+        self._corpus_stamp = self._corpus_index_stamp()
+        self.corpus_index = self._load_corpus_index()
+        self.catalog = ReportCatalog.load(self.documents_dir, self.vector_db_dir)
+        self.max_cache_mb = max_cache_mb
+        self._loaded_reports: "OrderedDict[str, dict]" = OrderedDict()
+        self._loaded_bytes = 0
+        self._cache_lock = threading.Lock()
+        # 默认使用 dashscope 作为 embedding provider；local 为本地哈希 n-gram 嵌入，需与入库时一致
         self.embedding_provider = embedding_provider.lower()
+        self.local_embedder: Optional[LocalEmbedder] = None
         self.llm = self._set_up_llm()
+        if self.local_embedder is not None:
+            self.embedding_model = self.local_embedder.model_name
+        else:
+            self.embedding_model = self.EMBEDDING_MODELS[self.embedding_provider]
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        self.dispatcher = EmbeddingDispatcher(embed_batch_fn=self._request_embeddings, max_batch_size=self.EMBEDDING_BATCH_SIZE)
+        self._search_pool: Optional[ThreadPoolExecutor] = None
+        self._search_pool_lock = threading.Lock()
+        # 检索结果缓存；refresh 发现文件变化时递增索引版本，旧结果随之失效
+        # 每个实例独立命名空间：版本号从 0 开始，同一目录上新建的检索器不能命中旧实例写入的结果
+        self.result_cache = result_cache if result_cache is not None else get_retrieval_cache()
+        self._cache_namespace = uuid.uuid4().hex
+        self.index_version = 0
 
     def _set_up_llm(self):
         # 根据 embedding_provider 初始化对应的 LLM 客户端
@@ -98,40 +229,90 @@ class VectorRetriever:
             )
             return llm
         elif self.embedding_provider == "dashscope":
-            import dashscope
-            dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+            configure_dashscope()
             return None  # dashscope 不需要 client 对象
+        elif self.embedding_provider == "local":
+            # 加载入库时拟合的 IDF，不需要 client 对象
+            self._local_embedder_stamp = _file_stamp(self.vector_db_dir / LocalEmbedder.FILE_NAME)
+            self.local_embedder = LocalEmbedder.load(self.vector_db_dir)
+            return None
         else:
             raise ValueError(f"不支持的 embedding provider: {self.embedding_provider}")
 
     def _get_embedding(self, text: str):
-        # 根据 embedding_provider 获取文本的向量表示
+        # 获取文本的向量表示，相同问题命中嵌入缓存时不再调用API
+        return self.embedding_cache.get_or_compute(
+            self.embedding_provider, self.embedding_model, [text],
+            lambda texts: [self._request_embedding(texts[0])]
+        )[0]
+
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 批量获取向量：缓存未命中的文本按 EMBEDDING_BATCH_SIZE 条一批并发请求
+        def compute(missing_texts: List[str]) -> List[List[float]]:
+            if self.local_embedder is not None:
+                return self.local_embedder.embed(missing_texts).tolist()
+            return self.dispatcher.embed(missing_texts)
+
+        return self.embedding_cache.get_or_compute(self.embedding_provider, self.embedding_model, texts, compute)
+
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # _get_embeddings 的异步版本，与同步接口共用嵌入缓存
+        if self.local_embedder is not None:
+            return self._get_embeddings(texts)
+        return await self.embedding_cache.aget_or_compute(
+            self.embedding_provider, self.embedding_model, texts, self._arequest_embeddings
+        )
+
+    def _request_embedding(self, text: str):
+        return self._request_embeddings([text])[0]
+
+    async def _arequest_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 按 EMBEDDING_BATCH_SIZE 条一批并发请求，结果与输入同序
+        if self.embedding_provider == "openai":
+            request = lambda batch: async_http.openai_embeddings("text-embedding-3-large", batch)
+        elif self.embedding_provider == "dashscope":
+            request = lambda batch: async_http.dashscope_embeddings("text-embedding-v1", batch)
+        else:
+            return self._request_embeddings(texts)
+        batches = [texts[i:i + self.EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), self.EMBEDDING_BATCH_SIZE)]
+        results = await asyncio.gather(*(request(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 根据 embedding_provider 调用API获取一批文本的向量表示，结果与输入同序
         if self.embedding_provider == "openai":
             embedding = self.llm.embeddings.create(
-                input=text,
+                input=texts,
                 model="text-embedding-3-large"
             )
-            return embedding.data[0].embedding
+            return [item.embedding for item in sorted(embedding.data, key=lambda item: item.index)]
         elif self.embedding_provider == "dashscope":
             import dashscope
             rsp = dashscope.TextEmbedding.call(
                 model="text-embedding-v1",
-                input=[text]
+                input=texts
             )
+            if getattr(rsp, 'status_code', 200) != 200:
+                raise RuntimeError(f"DashScope嵌入接口返回错误 {rsp.status_code} {rsp.code}: {rsp.message}")
             # 兼容 dashscope 返回格式，不能用 resp.output，需用 resp['output']
             if 'output' in rsp and 'embeddings' in rsp['output']:
-                # 多条输入（本处只有一条）
-                emb = rsp['output']['embeddings'][0]
-                if emb['embedding'] is None or len(emb['embedding']) == 0:
-                    raise RuntimeError(f"DashScope返回的embedding为空，text_index={emb.get('text_index', None)}")
-                return emb['embedding']
-            elif 'output' in rsp and 'embedding' in rsp['output']:
+                embeddings = [None] * len(texts)
+                for emb in rsp['output']['embeddings']:
+                    if emb['embedding'] is None or len(emb['embedding']) == 0:
+                        raise RuntimeError(f"DashScope返回的embedding为空，text_index={emb.get('text_index', None)}")
+                    embeddings[emb.get('text_index', 0)] = emb['embedding']
+                if any(emb is None for emb in embeddings):
+                    raise RuntimeError(f"DashScope返回的embedding数量不足: {rsp}")
+                return embeddings
+            elif 'output' in rsp and 'embedding' in rsp['output'] and len(texts) == 1:
                 # 兼容单条输入格式
                 if rsp['output']['embedding'] is None or len(rsp['output']['embedding']) == 0:
                     raise RuntimeError("DashScope返回的embedding为空")
-                return rsp['output']['embedding']
+                return [rsp['output']['embedding']]
             else:
                 raise RuntimeError(f"DashScope embedding API返回格式异常: {rsp}")
+        elif self.embedding_provider == "local":
+            return self.local_embedder.embed(texts).tolist()
         else:
             raise ValueError(f"不支持的 embedding provider: {self.embedding_provider}")
 
@@ -145,36 +326,133 @@ class VectorRetriever:
         )
         return llm
 
-    def _load_dbs(self):
-        all_dbs = []
-        all_documents_paths = list(self.documents_dir.glob('*.json'))
-        for document_path in all_documents_paths:
-            try:
-                with open(document_path, 'r', encoding='utf-8') as f:
-                    document = json.load(f)
-            except Exception as e:
-                _log.error(f"Error loading JSON from {document_path.name}: {e}")
-                continue
-            sha1 = document.get('metainfo', {}).get('sha1', None)
-            if not sha1:
-                _log.warning(f"No sha1 found in metainfo for document {document_path.name}")
-                continue
+    def _corpus_index_stamp(self) -> tuple:
+        # id 映射文件每次保存都整体替换并记录版本号，它变化即索引变化
+        return _file_stamp(self.vector_db_dir / CorpusIndex.IDS_FILE)
+
+    def _report_stamp(self, sha1: str) -> tuple:
+        # 报告正文、分报告索引及其向量映射；检索时用到的都在这里
+        return _file_stamp(
+            self.catalog.document_path(sha1),
+            self.vector_db_dir / f"{sha1}.faiss",
+            vector_chunk_ids_path(self.vector_db_dir, sha1)
+        )
+
+    def refresh(self) -> bool:
+        """
+        检查磁盘上的文件并热更新，返回是否有变化：
+        报告目录重新同步；全语料索引或本地嵌入参数变化时重新加载；
+        已加载的报告只有自身文件变化（或语料索引归属变化）时才从缓存中移除，下次使用时重新读取。
+        """
+        changed = False
+        if self.catalog.refresh():
+            self.catalog.save()
+            changed = True
+        if self.local_embedder is not None:
+            stamp = _file_stamp(self.vector_db_dir / LocalEmbedder.FILE_NAME)
+            if stamp != self._local_embedder_stamp:
+                self._local_embedder_stamp = stamp
+                self.local_embedder = LocalEmbedder.load(self.vector_db_dir)
+                self.embedding_model = self.local_embedder.model_name
+                changed = True
+        # 新的语料索引加载完成后一次赋值替换；检索在开始时取一次引用，整个检索过程使用同一个索引
+        old_corpus_index = corpus_index = self.corpus_index
+        corpus_stamp = self._corpus_index_stamp()
+        if corpus_stamp != self._corpus_stamp:
+            self._corpus_stamp = corpus_stamp
+            corpus_index = self._load_corpus_index()
+            self.corpus_index = corpus_index
+            changed = True
+        with self._cache_lock:
+            for sha1, report in list(self._loaded_reports.items()):
+                in_corpus = corpus_index is not None and sha1 in corpus_index
+                was_in_corpus = old_corpus_index is not None and sha1 in old_corpus_index
+                if sha1 not in self.catalog or in_corpus != was_in_corpus or self._report_stamp(sha1) != report["stamp"]:
+                    del self._loaded_reports[sha1]
+                    self._loaded_bytes -= report["bytes"]
+                    changed = True
+        if changed:
+            self.index_version += 1
+            _log.info(f"Retriever refreshed from {self.vector_db_dir}")
+        return changed
+
+    def _cache_key(self, kind: str, sha1s: Tuple[str, ...], query: str, top_n: int, return_parent_pages: bool) -> tuple:
+        return (
+            "vector", self._cache_namespace, self.embedding_model, self.ef_search, self.nprobe, self.rescore_factor,
+            kind, sha1s, normalize_query(query), top_n, return_parent_pages
+        )
+
+    def _load_corpus_index(self) -> Optional[CorpusIndex]:
+        if not CorpusIndex.exists(self.vector_db_dir):
+            return None
+        try:
+            corpus_index = CorpusIndex.load(self.vector_db_dir, mmap=True)
+        except Exception as e:
+            _log.error(f"Error reading corpus index from {self.vector_db_dir}: {e}")
+            return None
+        corpus_index.set_search_params(ef_search=self.ef_search, nprobe=self.nprobe, rescore_factor=self.rescore_factor)
+        return corpus_index
+
+    def _has_vector_db(self, sha1: str) -> bool:
+        corpus_index = self.corpus_index
+        if corpus_index is not None and sha1 in corpus_index:
+            return True
+        return (self.vector_db_dir / f"{sha1}.faiss").exists()
+
+    def _get_report(self, sha1: str) -> dict:
+        """返回 {"name", "vector_db", "chunk_store"}，未加载时从磁盘读取并放入 LRU"""
+        with self._cache_lock:
+            report = self._loaded_reports.get(sha1)
+            if report is not None:
+                self._loaded_reports.move_to_end(sha1)
+                return report
+        report = self._load_report(sha1)
+        with self._cache_lock:
+            if sha1 not in self._loaded_reports:
+                self._loaded_reports[sha1] = report
+                self._loaded_bytes += report["bytes"]
+                self._evict()
+            return self._loaded_reports.get(sha1, report)
+
+    def _load_report(self, sha1: str, open_vector_db: bool = False) -> dict:
+        # 先记录文件状态再读取，读取期间文件被替换时下次 refresh 仍能发现
+        # open_vector_db 为 True 时即使报告已在语料索引中也打开分报告索引
+        corpus_index = self.corpus_index
+        stamp = self._report_stamp(sha1)
+        document_path = self.catalog.document_path(sha1)
+        # 文本块存储的元数据常驻内存，文本内存映射；内存映射的索引页可由系统回收，只按一半计入
+        chunk_store = ChunkStore.open(self.documents_dir, document_path, sha1)
+        num_bytes = chunk_store.nbytes
+        vector_chunk_ids = None
+        if not open_vector_db and corpus_index is not None and sha1 in corpus_index:
+            # 已包含在全语料索引中，不再单独打开分报告索引
+            vector_db = None
+        else:
             faiss_path = self.vector_db_dir / f"{sha1}.faiss"
             if not faiss_path.exists():
-                _log.warning(f"No matching vector DB found for document {document_path.name} (sha1={sha1})")
-                continue
-            try:
-                vector_db = faiss.read_index(str(faiss_path))
-            except Exception as e:
-                _log.error(f"Error reading vector DB for {document_path.name}: {e}")
-                continue
-            report = {
-                "name": sha1,
-                "vector_db": vector_db,
-                "document": document
-            }
-            all_dbs.append(report)
-        return all_dbs
+                raise ValueError(f"No vector DB found for document {document_path.name} (sha1: {sha1})")
+            vector_db = read_index(faiss_path, mmap=True)
+            set_search_params(vector_db, ef_search=self.ef_search, nprobe=self.nprobe)
+            num_bytes += faiss_path.stat().st_size // 2
+            # 向量 id 按映射找到文本块（跳过空文本块）；旧索引没有映射文件时向量 id 即文本块下标
+            vector_chunk_ids = load_vector_chunk_ids(self.vector_db_dir, sha1)
+        return {
+            "name": sha1,
+            "vector_db": vector_db,
+            "vector_chunk_ids": vector_chunk_ids,
+            "chunk_store": chunk_store,
+            "bytes": num_bytes,
+            "stamp": stamp
+        }
+
+    def _evict(self):
+        # 超出内存上限时释放最久未使用的报告，至少保留最近一份
+        if self.max_cache_mb is None:
+            return
+        max_bytes = self.max_cache_mb * 1024 * 1024
+        while self._loaded_bytes > max_bytes and len(self._loaded_reports) > 1:
+            _, report = self._loaded_reports.popitem(last=False)
+            self._loaded_bytes -= report["bytes"]
 
     @staticmethod
     def get_strings_cosine_similarity(str1, str2):
@@ -186,84 +464,265 @@ class VectorRetriever:
         similarity_score = round(similarity_score, 4)
         return similarity_score
 
-    def retrieve_by_company_name(self, company_name: str, query: str, llm_reranking_sample_size: int = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Tuple[str, float]]:
-        target_report = None
-        for report in self.all_dbs:
-            document = report.get("document", {})
-            metainfo = document.get("metainfo", {})
-            if metainfo.get("company_name") == company_name:
-                target_report = report
-                break
-            elif company_name in metainfo.get("file_name", ""):
-                target_report = report
-                break
-        if target_report is None:
+    def _find_report(self, company_name: str) -> str:
+        sha1 = self.catalog.find(company_name, predicate=self._has_vector_db)
+        if sha1 is None:
             _log.error(f"No report found with '{company_name}' company name.")
             raise ValueError(f"No report found with '{company_name}' company name.")
-        sha1 = target_report["document"]["metainfo"].get("sha1")
-        if not sha1:
-            raise ValueError(f"No sha1 found in metainfo for company '{company_name}'")
-        faiss_path = self.vector_db_dir / f"{sha1}.faiss"
-        if not faiss_path.exists():
-            raise ValueError(f"No vector DB found for '{company_name}' (sha1: {sha1})")
-        document = target_report["document"]
-        vector_db = target_report["vector_db"]
-        chunks = document["content"]["chunks"]
-        pages = document["content"].get("pages", [])
-        actual_top_n = min(top_n, len(chunks))
-        # 获取 query 的 embedding，支持 openai/dashscope
-        embedding = self._get_embedding(query)
-        embedding_array = np.array(embedding, dtype=np.float32).reshape(1, -1)
-        distances, indices = vector_db.search(x=embedding_array, k=actual_top_n)
+        return sha1
+
+    def _search_reports(self, sha1s: List[str], embedding_array: np.ndarray, top_n: int) -> List[List[Tuple[str, int, float]]]:
+        """
+        embedding_array 每行一条查询，返回每条查询的 [(报告 sha1, 文本块下标, 相似度)]，按相似度降序。
+        全语料索引中的报告合并为一次带文档过滤的检索；其余报告的分报告索引在线程池中并行检索，
+        各来源的候选写入预分配的分数矩阵，按行 argpartition 取 top_n，只为最终结果构造元组。
+        """
+        num_queries = len(embedding_array)
+        # 只读取一次，refresh 同时替换语料索引时本次检索仍使用同一个索引
+        corpus_index = self.corpus_index
+        corpus_sha1s = [sha1 for sha1 in sha1s if corpus_index is not None and sha1 in corpus_index]
+        report_sha1s = [sha1 for sha1 in sha1s if corpus_index is None or sha1 not in corpus_index]
+        corpus_hits = corpus_index.search(embedding_array, top_n, doc_ids=corpus_sha1s) if corpus_sha1s else None
+        if not report_sha1s:
+            return corpus_hits or [[] for _ in range(num_queries)]
+
+        # 尚未合并进语料索引的报告，退回分报告索引
+        if len(report_sha1s) > 1:
+            report_results = list(self._get_search_pool().map(lambda sha1: self._search_report(sha1, embedding_array, top_n), report_sha1s))
+        else:
+            report_results = [self._search_report(report_sha1s[0], embedding_array, top_n)]
+        if corpus_hits is None and len(report_sha1s) == 1:
+            distances, chunks = report_results[0]
+            return [
+                [(report_sha1s[0], int(chunk), float(distance)) for distance, chunk in zip(row_distances, row_chunks) if chunk >= 0]
+                for row_distances, row_chunks in zip(distances, chunks)
+            ]
+
+        # 候选矩阵：每个来源占 top_n 列，空位分数为 -inf；报告以 sha1s 中的序号表示
+        num_sources = len(report_results) + (corpus_hits is not None)
+        scores = np.full((num_queries, num_sources * top_n), -np.inf, dtype=np.float32)
+        doc_numbers = np.zeros(scores.shape, dtype=np.int32)
+        chunk_numbers = np.full(scores.shape, -1, dtype=np.int64)
+        sha1_numbers = {sha1: i for i, sha1 in enumerate(sha1s)}
+        column = 0
+        if corpus_hits is not None:
+            for row, query_hits in enumerate(corpus_hits):
+                for j, (sha1, chunk, distance) in enumerate(query_hits):
+                    scores[row, column + j] = distance
+                    doc_numbers[row, column + j] = sha1_numbers[sha1]
+                    chunk_numbers[row, column + j] = chunk
+            column += top_n
+        for sha1, (distances, chunks) in zip(report_sha1s, report_results):
+            width = distances.shape[1]
+            scores[:, column:column + width] = np.where(chunks >= 0, distances, -np.inf)
+            doc_numbers[:, column:column + width] = sha1_numbers[sha1]
+            chunk_numbers[:, column:column + width] = chunks
+            column += top_n
+
+        k = min(top_n, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable"), axis=1)
+        return [
+            [
+                (sha1s[doc_numbers[row, j]], int(chunk_numbers[row, j]), float(scores[row, j]))
+                for j in top[row] if chunk_numbers[row, j] >= 0
+            ]
+            for row in range(num_queries)
+        ]
+
+    def _search_report(self, sha1: str, embedding_array: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """在分报告索引中检索，返回 (相似度, 文本块下标) 两个 查询数×k 矩阵，不足 k 个的位置文本块下标为 -1"""
+        report = self._get_report(sha1)
+        if report["vector_db"] is None:
+            # 本次检索开始后 refresh 换上了包含该报告的语料索引，缓存中的报告不再带分报告索引；本次仍按分报告索引检索
+            report = self._load_report(sha1, open_vector_db=True)
+        vector_db, chunk_ids = report["vector_db"], report["vector_chunk_ids"]
+        distances, indices = vector_db.search(x=embedding_array, k=min(top_n, vector_db.ntotal))
+        if chunk_ids is not None:
+            # 按映射找到文本块
+            indices = np.where(indices >= 0, np.asarray(chunk_ids)[np.maximum(indices, 0)], -1)
+        return distances, indices
+
+    def _get_search_pool(self) -> ThreadPoolExecutor:
+        with self._search_pool_lock:
+            if self._search_pool is None:
+                self._search_pool = ThreadPoolExecutor(max_workers=self.SEARCH_THREADS, thread_name_prefix="report-search")
+            return self._search_pool
+
+    def _format_results(self, hits: List[Tuple[str, int, float]], return_parent_pages: bool, with_source: bool) -> List[Dict]:
         retrieval_results = []
         seen_pages = set()
-        for distance, index in zip(distances[0], indices[0]):
+        for sha1, index, distance in hits:
             distance = round(float(distance), 4)
-            chunk = chunks[index]
-            parent_page = None
-            if pages:
-                parent_page = next((page for page in pages if page["page"] == chunk.get("page")), None)
-            if return_parent_pages and parent_page:
-                if parent_page["page"] not in seen_pages:
-                    seen_pages.add(parent_page["page"])
-                    result = {
-                        "distance": distance,
-                        "page": parent_page["page"],
-                        "text": parent_page["text"]
-                    }
-                    retrieval_results.append(result)
+            # 只打开命中报告的文本块存储，并只解码返回的文本
+            chunk_store = self._get_report(sha1)["chunk_store"]
+            page = chunk_store.parent_page(index)
+            parent_text = chunk_store.page_text(page) if return_parent_pages and page is not None else None
+            if parent_text is not None:
+                if (sha1, page) in seen_pages:
+                    continue
+                seen_pages.add((sha1, page))
+                result = {
+                    "distance": distance,
+                    **_page_fields(chunk_store, page),
+                    "text": parent_text
+                }
             else:
                 result = {
                     "distance": distance,
-                    "page": chunk.get("page", 0),
-                    "text": chunk["text"]
+                    **_page_fields(chunk_store, page),
+                    "text": chunk_store.text(index)
                 }
-                retrieval_results.append(result)
+            if with_source:
+                # 跨报告检索时标明出处
+                metainfo = chunk_store.metainfo
+                result["sha1"] = sha1
+                result["source"] = metainfo.get("company_name") or metainfo.get("file_name", sha1)
+            retrieval_results.append(result)
         return retrieval_results
 
+    def _search_and_format(self, sha1s: List[str], embedding: List[float], top_n: int, return_parent_pages: bool, with_source: bool) -> List[Dict]:
+        embedding_array = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        hits = self._search_reports(sha1s, embedding_array, top_n)[0]
+        return self._format_results(hits, return_parent_pages, with_source)
+
+    def _sha1s_for(self, company_names: Optional[List[str]]) -> List[str]:
+        if company_names is None:
+            sha1s = self.catalog.sha1s(predicate=self._has_vector_db)
+        else:
+            sha1s = list(dict.fromkeys(self._find_report(name) for name in company_names))
+        if not sha1s:
+            raise ValueError("没有可检索的报告")
+        return sha1s
+
+    def retrieve_by_company_name(self, company_name: str, query: str, llm_reranking_sample_size: int = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Tuple[str, float]]:
+        sha1 = self._find_report(company_name)
+
+        def compute():
+            # 获取 query 的 embedding，支持 openai/dashscope
+            return self._search_and_format([sha1], self._get_embedding(query), top_n, return_parent_pages, with_source=False)
+
+        key = self._cache_key("company", (sha1,), query, top_n, return_parent_pages)
+        return self.result_cache.get_or_compute(key, self.index_version, compute)
+
+    async def aretrieve_by_company_name(self, company_name: str, query: str, llm_reranking_sample_size: int = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        """retrieve_by_company_name 的异步版本：查询嵌入走异步请求，索引检索在线程中执行"""
+        sha1 = self._find_report(company_name)
+
+        async def compute():
+            embedding = (await self._aget_embeddings([query]))[0]
+            return await asyncio.to_thread(self._search_and_format, [sha1], embedding, top_n, return_parent_pages, False)
+
+        key = self._cache_key("company", (sha1,), query, top_n, return_parent_pages)
+        return await self.result_cache.aget_or_compute(key, self.index_version, compute)
+
+    def retrieve(self, query: str, company_names: Optional[List[str]] = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        """
+        跨报告检索：company_names 为 None 时检索全部报告。
+        报告均在全语料索引中时只执行一次 search；结果附带 sha1 和 source（公司名）。
+        """
+        sha1s = self._sha1s_for(company_names)
+
+        def compute():
+            return self._search_and_format(sha1s, self._get_embedding(query), top_n, return_parent_pages, with_source=True)
+
+        key = self._cache_key("corpus", tuple(sha1s), query, top_n, return_parent_pages)
+        return self.result_cache.get_or_compute(key, self.index_version, compute)
+
+    async def aretrieve(self, query: str, company_names: Optional[List[str]] = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        """retrieve 的异步版本"""
+        sha1s = self._sha1s_for(company_names)
+
+        async def compute():
+            embedding = (await self._aget_embeddings([query]))[0]
+            return await asyncio.to_thread(self._search_and_format, sha1s, embedding, top_n, return_parent_pages, True)
+
+        key = self._cache_key("corpus", tuple(sha1s), query, top_n, return_parent_pages)
+        return await self.result_cache.aget_or_compute(key, self.index_version, compute)
+
+    def retrieve_many(
+        self,
+        queries: List[str],
+        company_names: Optional[List[str]] = None,
+        top_n: int = 3,
+        return_parent_pages: bool = False
+    ) -> List[List[Dict]]:
+        """
+        批量检索，返回与 queries 同序的结果列表。
+        所有查询的嵌入合并为少量批量请求，检索同一组报告的查询合并为一次矩阵检索。
+        company_names 与 queries 一一对应时按公司名检索（同 retrieve_by_company_name），
+        为 None 时检索全部报告（同 retrieve）。命中检索结果缓存的查询不再嵌入和检索。
+        """
+        if company_names is not None and len(company_names) != len(queries):
+            raise ValueError("company_names 与 queries 数量不一致")
+        if company_names is None:
+            sha1s = self.catalog.sha1s(predicate=self._has_vector_db)
+            if not sha1s:
+                raise ValueError("没有可检索的报告")
+            keys = [self._cache_key("corpus", tuple(sha1s), query, top_n, return_parent_pages) for query in queries]
+        else:
+            keys = [
+                self._cache_key("company", (self._find_report(company_name),), query, top_n, return_parent_pages)
+                for query, company_name in zip(queries, company_names)
+            ]
+        version = self.index_version
+        results = [self.result_cache.get(key, version) if self.result_cache.enabled else None for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            t0 = time.perf_counter()
+            hits_per_query = self.search_many(
+                [queries[i] for i in missing],
+                None if company_names is None else [company_names[i] for i in missing],
+                top_n
+            )
+            for i, hits in zip(missing, hits_per_query):
+                results[i] = self._format_results(hits, return_parent_pages, with_source=company_names is None)
+            # 批量检索的耗时平均分摊到每条查询
+            compute_seconds = (time.perf_counter() - t0) / len(missing)
+            for i in missing:
+                self.result_cache.put(keys[i], version, results[i], compute_seconds)
+        return results
+
+    def search_many(
+        self,
+        queries: List[str],
+        company_names: Optional[List[str]] = None,
+        top_n: int = 3
+    ) -> List[List[Tuple[str, int, float]]]:
+        """retrieve_many 的检索部分，返回每条查询的 [(报告 sha1, 文本块下标, 相似度)]"""
+        if company_names is not None and len(company_names) != len(queries):
+            raise ValueError("company_names 与 queries 数量不一致")
+        if not queries:
+            return []
+        if company_names is None:
+            sha1s = self.catalog.sha1s(predicate=self._has_vector_db)
+            if not sha1s:
+                raise ValueError("没有可检索的报告")
+            groups = {tuple(sha1s): list(range(len(queries)))}
+        else:
+            groups = {}
+            for i, company_name in enumerate(company_names):
+                groups.setdefault((self._find_report(company_name),), []).append(i)
+        embedding_array = np.array(self._get_embeddings(list(queries)), dtype=np.float32)
+        results: List[List[Tuple[str, int, float]]] = [[] for _ in queries]
+        for sha1s, indices in groups.items():
+            for i, hits in zip(indices, self._search_reports(list(sha1s), embedding_array[indices], top_n)):
+                results[i] = hits
+        return results
+
     def retrieve_all(self, company_name: str) -> List[Dict]:
-        target_report = None
-        for report in self.all_dbs:
-            document = report.get("document", {})
-            metainfo = document.get("metainfo")
-            if not metainfo:
-                continue
-            if metainfo.get("company_name") == company_name:
-                target_report = report
-                break
-        
-        if target_report is None:
+        sha1 = self.catalog.find(company_name, exact=True, predicate=self._has_vector_db)
+        if sha1 is None:
             _log.error(f"No report found with '{company_name}' company name.")
             raise ValueError(f"No report found with '{company_name}' company name.")
         
-        document = target_report["document"]
-        pages = document["content"]["pages"]
+        chunk_store = self._get_report(sha1)["chunk_store"]
         
         all_pages = []
-        for page in sorted(pages, key=lambda p: p["page"]):
+        for page in chunk_store.iter_pages():
             result = {
                 "distance": 0.5,
-                "page": page["page"],
+                **_page_fields(chunk_store, page["page"]),
                 "text": page["text"]
             }
             all_pages.append(result)
@@ -271,9 +730,196 @@ class VectorRetriever:
         return all_pages
 
 
+def reciprocal_rank_fusion(rankings: List[np.ndarray], weights: Optional[List[float]] = None, k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    RRF：每个列表中排名 r（从 1 开始）的条目得分 weight / (k + r)，同一条目在各列表的得分相加。
+    rankings 为按相关性降序的整数 id 数组，返回融合后的 (id, 得分)，按得分降序，同分时 id 小的在前。
+    """
+    weights = weights or [1.0] * len(rankings)
+    ids = np.concatenate([np.asarray(ranking, dtype=np.int64) for ranking in rankings])
+    contributions = np.concatenate([
+        weight / (k + np.arange(1, len(ranking) + 1, dtype=np.float64)) for ranking, weight in zip(rankings, weights)
+    ])
+    return _sum_by_id(ids, contributions)
+
+
+def weighted_score_fusion(rankings: List[np.ndarray], scores: List[np.ndarray], weights: Optional[List[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """加权分数融合：各列表的分数先按列表内 min-max 归一化到 [0, 1]，再加权求和"""
+    weights = weights or [1.0] * len(rankings)
+    ids = np.concatenate([np.asarray(ranking, dtype=np.int64) for ranking in rankings])
+    normalized = []
+    for score, weight in zip(scores, weights):
+        score = np.asarray(score, dtype=np.float64)
+        span = score.max() - score.min() if len(score) else 0.0
+        normalized.append(weight * ((score - score.min()) / span if span > 0 else np.ones_like(score)))
+    return _sum_by_id(ids, np.concatenate(normalized) if normalized else np.zeros(0))
+
+
+def _sum_by_id(ids: np.ndarray, contributions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    fused = np.zeros(len(unique_ids), dtype=np.float64)
+    np.add.at(fused, inverse, contributions)
+    order = np.lexsort((unique_ids, -fused))
+    return unique_ids[order], fused[order]
+
+
+class FusionRetriever:
+    """
+    BM25 与向量检索并行召回，用 RRF（默认）或加权分数融合合并，不调用LLM。
+    输出格式与 VectorRetriever 相同，distance 为归一化到 [0, 1] 的融合得分（两路都排第一时为 1），
+    与向量相似度量级相当，可直接作为答题上下文或LLM重排（与LLM评分加权）的候选。
+    """
+
+    FUSION_METHODS = ("rrf", "weighted")
+
+    def __init__(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        bm25_db_dir: Path,
+        method: str = "rrf",
+        rrf_k: int = 60,
+        vector_weight: float = 0.5,
+        candidate_multiplier: int = 4,
+        embedding_provider: str = "dashscope",
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024,
+        vector_retriever: Optional[VectorRetriever] = None,
+        bm25_retriever: Optional[BM25Retriever] = None
+    ):
+        if method not in self.FUSION_METHODS:
+            raise ValueError(f"不支持的融合方式: {method}，可选 {self.FUSION_METHODS}")
+        self.method = method
+        self.rrf_k = rrf_k
+        # 加权融合与 RRF 中向量检索的权重，BM25 为 1 - vector_weight
+        self.vector_weight = vector_weight
+        # 每路召回 top_n * candidate_multiplier 个候选再融合
+        self.candidate_multiplier = max(1, candidate_multiplier)
+        self.vector_retriever = vector_retriever or VectorRetriever(
+            vector_db_dir, documents_dir, embedding_provider=embedding_provider, ef_search=ef_search, nprobe=nprobe,
+            rescore_factor=rescore_factor, max_cache_mb=max_cache_mb
+        )
+        self.bm25_retriever = bm25_retriever or BM25Retriever(Path(bm25_db_dir), Path(documents_dir))
+
+    def refresh(self) -> bool:
+        vector_changed = self.vector_retriever.refresh()
+        bm25_changed = self.bm25_retriever.refresh()
+        return vector_changed or bm25_changed
+
+    def _lexical_hits(self, sha1s: List[str], query: str, k: int) -> List[Tuple[str, int, float]]:
+        # 没有BM25索引的报告只用向量召回；得分为 0 的文本块与查询没有共同词项，不参与融合
+        hits = []
+        for sha1 in sha1s:
+            if not self.bm25_retriever.has_index(sha1):
+                continue
+            indices, scores = self.bm25_retriever.search(sha1, query, k)
+            hits.extend((sha1, int(index), float(score)) for index, score in zip(indices, scores) if score > 0)
+        if len(sha1s) > 1:
+            hits.sort(key=lambda hit: hit[2], reverse=True)
+        return hits[:k]
+
+    def _fuse(self, dense_hits: List[Tuple[str, int, float]], lexical_hits: List[Tuple[str, int, float]], top_n: int) -> List[Tuple[str, int, float]]:
+        # (sha1, 文本块下标) 编码为 int64：报告序号占高 32 位，文本块下标占低 32 位
+        sha1s = list(dict.fromkeys(hit[0] for hit in dense_hits + lexical_hits))
+        doc_numbers = {sha1: i for i, sha1 in enumerate(sha1s)}
+        rankings = [
+            np.array([(doc_numbers[sha1] << 32) | index for sha1, index, _ in hits], dtype=np.int64)
+            for hits in (dense_hits, lexical_hits)
+        ]
+        weights = [self.vector_weight, 1.0 - self.vector_weight]
+        if self.method == "rrf":
+            ids, fused = reciprocal_rank_fusion(rankings, weights, k=self.rrf_k)
+            # RRF 得分最大为 sum(weights) / (k + 1)，约 0.016，直接作为 distance 会使LLM重排中的向量分数失效
+            max_score = sum(weights) / (self.rrf_k + 1)
+        else:
+            scores = [np.array([hit[2] for hit in hits], dtype=np.float64) for hits in (dense_hits, lexical_hits)]
+            ids, fused = weighted_score_fusion(rankings, scores, weights)
+            max_score = sum(weights)
+        fused = fused / max_score if max_score > 0 else fused
+        return [(sha1s[int(key) >> 32], int(key) & 0xFFFFFFFF, float(score)) for key, score in zip(ids[:top_n], fused[:top_n])]
+
+    def _target_sha1s(self, company_names: Optional[List[str]], count: int) -> List[List[str]]:
+        if company_names is None:
+            sha1s = self.vector_retriever.catalog.sha1s(predicate=self.vector_retriever._has_vector_db)
+            return [sha1s] * count
+        return [[self.vector_retriever._find_report(company_name)] for company_name in company_names]
+
+    def search_many(
+        self,
+        queries: List[str],
+        company_names: Optional[List[str]] = None,
+        top_n: int = 3
+    ) -> List[List[Tuple[str, int, float]]]:
+        """向量召回批量执行（VectorRetriever.search_many），BM25逐条召回，再逐条融合"""
+        k = top_n * self.candidate_multiplier
+        dense = self.vector_retriever.search_many(queries, company_names, k)
+        targets = self._target_sha1s(company_names, len(queries))
+        return [
+            self._fuse(dense_hits, self._lexical_hits(sha1s, query, k), top_n)
+            for query, dense_hits, sha1s in zip(queries, dense, targets)
+        ]
+
+    def retrieve_many(
+        self,
+        queries: List[str],
+        company_names: Optional[List[str]] = None,
+        top_n: int = 3,
+        return_parent_pages: bool = False
+    ) -> List[List[Dict]]:
+        return [
+            self.vector_retriever._format_results(hits, return_parent_pages, with_source=company_names is None)
+            for hits in self.search_many(queries, company_names, top_n)
+        ]
+
+    def retrieve_by_company_name(self, company_name: str, query: str, llm_reranking_sample_size: int = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        return self.retrieve_many([query], [company_name], top_n, return_parent_pages)[0]
+
+    def retrieve(self, query: str, company_names: Optional[List[str]] = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        """跨报告融合检索：company_names 为 None 时检索全部报告，结果附带 sha1 和 source"""
+        sha1s = self._target_sha1s(None, 1)[0] if company_names is None else list(dict.fromkeys(
+            self.vector_retriever._find_report(name) for name in company_names
+        ))
+        if not sha1s:
+            raise ValueError("没有可检索的报告")
+        k = top_n * self.candidate_multiplier
+        embedding_array = np.array([self.vector_retriever._get_embedding(query)], dtype=np.float32)
+        dense_hits = self.vector_retriever._search_reports(sha1s, embedding_array, k)[0]
+        hits = self._fuse(dense_hits, self._lexical_hits(sha1s, query, k), top_n)
+        return self.vector_retriever._format_results(hits, return_parent_pages, with_source=True)
+
+    async def aretrieve_by_company_name(self, company_name: str, query: str, llm_reranking_sample_size: int = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        # 查询嵌入异步写入嵌入缓存，之后的向量召回、BM25召回和融合都是本地计算，在线程中执行
+        await self.vector_retriever._aget_embeddings([query])
+        return await asyncio.to_thread(self.retrieve_by_company_name, company_name, query, top_n=top_n, return_parent_pages=return_parent_pages)
+
+    async def aretrieve(self, query: str, company_names: Optional[List[str]] = None, top_n: int = 3, return_parent_pages: bool = False) -> List[Dict]:
+        await self.vector_retriever._aget_embeddings([query])
+        return await asyncio.to_thread(self.retrieve, query, company_names, top_n, return_parent_pages)
+
+    def retrieve_all(self, company_name: str) -> List[Dict]:
+        return self.vector_retriever.retrieve_all(company_name)
+
+
 class HybridRetriever:
-    def __init__(self, vector_db_dir: Path, documents_dir: Path):
-        self.vector_retriever = VectorRetriever(vector_db_dir, documents_dir)
+    def __init__(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024,
+        embedding_provider: str = "dashscope",
+        vector_retriever: Optional[Union[VectorRetriever, "FusionRetriever"]] = None
+    ):
+        # 可传入已加载的向量检索器（如检索器注册表中共享的实例），避免重复加载索引；
+        # 传入 FusionRetriever 时以BM25+向量的融合结果作为LLM重排的候选
+        self.vector_retriever = vector_retriever or VectorRetriever(
+            vector_db_dir, documents_dir, embedding_provider=embedding_provider, ef_search=ef_search, nprobe=nprobe,
+            rescore_factor=rescore_factor, max_cache_mb=max_cache_mb
+        )
         self.reranker = LLMReranker()
         
     def retrieve_by_company_name(
@@ -312,7 +958,39 @@ class HybridRetriever:
         )
         t1 = time.time()
         print(f"[计时] [HybridRetriever] 向量检索耗时: {t1-t0:.2f} 秒")
-        # 使用LLM对结果进行重排
+        reranked_results = self.rerank(query, vector_results, documents_batch_size, top_n, llm_weight)
+        print(f"[计时] [HybridRetriever] 总耗时: {time.time()-t0:.2f} 秒")
+        return reranked_results
+
+    async def aretrieve_by_company_name(
+        self,
+        company_name: str,
+        query: str,
+        llm_reranking_sample_size: int = 28,
+        documents_batch_size: int = 10,
+        top_n: int = 6,
+        llm_weight: float = 0.7,
+        return_parent_pages: bool = False
+    ) -> List[Dict]:
+        """retrieve_by_company_name 的异步版本，各批次的LLM重排请求同时在途"""
+        vector_results = await self.vector_retriever.aretrieve_by_company_name(
+            company_name=company_name,
+            query=query,
+            top_n=llm_reranking_sample_size,
+            return_parent_pages=return_parent_pages
+        )
+        return await self.arerank(query, vector_results, documents_batch_size, top_n, llm_weight)
+
+    def rerank(
+        self,
+        query: str,
+        vector_results: List[Dict],
+        documents_batch_size: int = 10,
+        top_n: int = 6,
+        llm_weight: float = 0.7
+    ) -> List[Dict]:
+        """对已有的向量检索结果做LLM重排，返回前 top_n 条"""
+        t0 = time.time()
         print("[计时] [HybridRetriever] 开始LLM重排 ...")
         reranked_results = self.reranker.rerank_documents(
             query=query,
@@ -320,7 +998,40 @@ class HybridRetriever:
             documents_batch_size=documents_batch_size,
             llm_weight=llm_weight
         )
-        t2 = time.time()
-        print(f"[计时] [HybridRetriever] LLM重排耗时: {t2-t1:.2f} 秒")
-        print(f"[计时] [HybridRetriever] 总耗时: {t2-t0:.2f} 秒")
+        print(f"[计时] [HybridRetriever] LLM重排耗时: {time.time()-t0:.2f} 秒")
+        return reranked_results[:top_n]
+
+    async def arerank(
+        self,
+        query: str,
+        vector_results: List[Dict],
+        documents_batch_size: int = 10,
+        top_n: int = 6,
+        llm_weight: float = 0.7
+    ) -> List[Dict]:
+        reranked_results = await self.reranker.arerank_documents(
+            query=query,
+            documents=vector_results,
+            documents_batch_size=documents_batch_size,
+            llm_weight=llm_weight
+        )
         return reranked_results[:top_n]
+
+    def retrieve_many(
+        self,
+        queries: List[str],
+        company_names: Optional[List[str]] = None,
+        llm_reranking_sample_size: int = 28,
+        documents_batch_size: int = 10,
+        top_n: int = 6,
+        llm_weight: float = 0.7,
+        return_parent_pages: bool = False
+    ) -> List[List[Dict]]:
+        """向量检索阶段批量执行（见 VectorRetriever.retrieve_many），再逐条LLM重排"""
+        vector_results = self.vector_retriever.retrieve_many(
+            queries, company_names, top_n=llm_reranking_sample_size, return_parent_pages=return_parent_pages
+        )
+        return [
+            self.rerank(query, results, documents_batch_size, top_n, llm_weight)
+            for query, results in zip(queries, vector_results)
+        ]
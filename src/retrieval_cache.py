@@ -0,0 +1,151 @@
+"""
+RETRIEVAL CACHE
+
+检索结果缓存（进程内 LRU + TTL），放在 VectorRetriever、DynamicVectorRetriever 等检索器前面，
+相同或仅空白、大小写、全半角、句末标点不同的问题直接返回上次的检索结果，省去查询嵌入和索引检索。
+
+- 键：检索器命名空间 + 归一化查询 + 文档集合 + top_n + 是否返回父页面等参数
+- 值带写入时的索引版本：检索器在文档增删或索引重新加载时递增版本，旧版本的条目视为失效
+- 条目超过 ttl_seconds 过期，超过 max_entries 时淘汰最久未使用的条目
+- stats() 导出命中率和命中节省的检索耗时
+
+默认实例的容量和过期时间可通过环境变量 RETRIEVAL_CACHE_MAX_ENTRIES、RETRIEVAL_CACHE_TTL 配置，
+max_entries 或 ttl_seconds 为 0 时不缓存。
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Union
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?？!！。.，,;；:：]+$")
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、忽略大小写、合并空白、去掉句末标点"""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", query).strip())
+
+
+class _Entry:
+    __slots__ = ("results", "version", "expires_at", "compute_seconds")
+
+    def __init__(self, results: List[Dict], version: Hashable, expires_at: float, compute_seconds: float):
+        self.results = results
+        self.version = version
+        self.expires_at = expires_at
+        self.compute_seconds = compute_seconds
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.seconds_saved = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def _copy(results: List[Dict]) -> List[Dict]:
+        # 调用方可能修改返回的字典（如重排时补充分数），缓存中保留独立的副本
+        return [dict(result) for result in results]
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version:
+                self.invalidated += 1
+            elif entry.expires_at <= time.monotonic():
+                self.expired += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.seconds_saved += entry.compute_seconds
+                return self._copy(entry.results)
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, version: Hashable, results: List[Dict], compute_seconds: float = 0.0):
+        if not self.enabled:
+            return
+        entry = _Entry(self._copy(results), version, time.monotonic() + self.ttl_seconds, compute_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, version: Hashable, compute_fn: Callable[[], List[Dict]]) -> List[Dict]:
+        """命中且版本一致、未过期时返回缓存结果，否则调用 compute_fn 检索并写入缓存"""
+        if not self.enabled:
+            return compute_fn()
+        results = self.get(key, version)
+        if results is not None:
+            return results
+        t0 = time.perf_counter()
+        results = compute_fn()
+        self.put(key, version, results, time.perf_counter() - t0)
+        return results
+
+    async def aget_or_compute(self, key: Hashable, version: Hashable, compute_fn: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        """get_or_compute 的异步版本，compute_fn 为协程函数"""
+        if not self.enabled:
+            return await compute_fn()
+        results = self.get(key, version)
+        if results is not None:
+            return results
+        t0 = time.perf_counter()
+        results = await compute_fn()
+        self.put(key, version, results, time.perf_counter() - t0)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "entries": len(self._entries),
+            "seconds_saved": round(self.seconds_saved, 4)
+        }
+
+
+_default_cache: Optional[RetrievalCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """返回进程内共享的检索结果缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RetrievalCache(
+                max_entries=int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "1024")),
+                ttl_seconds=float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+            )
+        return _default_cache
@@ -0,0 +1,146 @@
+"""
+RETRIEVER REGISTRY
+
+进程内共享的检索器注册表：相同目录和参数的检索器只创建一次，在问题之间、线程之间复用，
+已加载的全语料索引、报告正文和分报告索引都保留在检索器的 LRU 缓存中。
+
+每个检索器最多每 check_interval 秒检查一次磁盘文件（refresh），
+只有变化的报告（或全语料索引）会被重新加载，重新入库后无需重启进程。
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from src.retrieval import BM25Retriever, FusionRetriever, HybridRetriever, VectorRetriever
+
+
+class _Entry:
+    def __init__(self, retriever):
+        self.retriever = retriever
+        self.last_checked = time.monotonic()
+        self.refresh_lock = threading.Lock()
+
+
+class RetrieverRegistry:
+    def __init__(self, check_interval: float = 2.0):
+        self.check_interval = check_interval
+        self._entries: Dict[Tuple, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple, create: Callable[[], object], refresh: bool = True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # 创建期间持有注册表锁，并发的首个问题只加载一次
+                entry = _Entry(create())
+                self._entries[key] = entry
+                return entry.retriever
+        if refresh and time.monotonic() - entry.last_checked >= self.check_interval:
+            # 只让一个线程检查文件，其余线程直接使用当前实例
+            if entry.refresh_lock.acquire(blocking=False):
+                try:
+                    entry.retriever.refresh()
+                    entry.last_checked = time.monotonic()
+                finally:
+                    entry.refresh_lock.release()
+        return entry.retriever
+
+    def vector_retriever(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        embedding_provider: str = "dashscope",
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024
+    ) -> VectorRetriever:
+        vector_db_dir, documents_dir = Path(vector_db_dir).resolve(), Path(documents_dir).resolve()
+        key = ("vector", vector_db_dir, documents_dir, embedding_provider.lower(), ef_search, nprobe, rescore_factor, max_cache_mb)
+        return self._get(key, lambda: VectorRetriever(
+            vector_db_dir=vector_db_dir,
+            documents_dir=documents_dir,
+            embedding_provider=embedding_provider,
+            ef_search=ef_search,
+            nprobe=nprobe,
+            rescore_factor=rescore_factor,
+            max_cache_mb=max_cache_mb
+        ))
+
+    def fusion_retriever(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        bm25_db_dir: Path,
+        embedding_provider: str = "dashscope",
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024,
+        fusion_method: str = "rrf"
+    ) -> FusionRetriever:
+        # 与相同参数的向量检索器、BM25检索器共用实例，热更新由各自的条目负责
+        vector_retriever = self.vector_retriever(
+            vector_db_dir, documents_dir, embedding_provider, ef_search, nprobe, rescore_factor, max_cache_mb
+        )
+        bm25_retriever = self.bm25_retriever(bm25_db_dir, documents_dir)
+        key = ("fusion", id(vector_retriever), id(bm25_retriever), fusion_method)
+        return self._get(key, lambda: FusionRetriever(
+            vector_db_dir=vector_db_dir,
+            documents_dir=documents_dir,
+            bm25_db_dir=bm25_db_dir,
+            method=fusion_method,
+            vector_retriever=vector_retriever,
+            bm25_retriever=bm25_retriever
+        ), refresh=False)
+
+    def hybrid_retriever(
+        self,
+        vector_db_dir: Path,
+        documents_dir: Path,
+        embedding_provider: str = "dashscope",
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        rescore_factor: int = 0,
+        max_cache_mb: Optional[float] = 1024,
+        bm25_db_dir: Optional[Path] = None,
+        fusion_method: str = "rrf"
+    ) -> HybridRetriever:
+        # 与相同参数的向量检索器（给出 bm25_db_dir 时为融合检索器）共用一个实例，热更新由其条目负责
+        if bm25_db_dir is not None:
+            candidate_retriever = self.fusion_retriever(
+                vector_db_dir, documents_dir, bm25_db_dir, embedding_provider, ef_search, nprobe, rescore_factor, max_cache_mb, fusion_method
+            )
+        else:
+            candidate_retriever = self.vector_retriever(
+                vector_db_dir, documents_dir, embedding_provider, ef_search, nprobe, rescore_factor, max_cache_mb
+            )
+        key = ("hybrid", id(candidate_retriever))
+        return self._get(key, lambda: HybridRetriever(
+            vector_db_dir=vector_db_dir,
+            documents_dir=documents_dir,
+            vector_retriever=candidate_retriever
+        ), refresh=False)
+
+    def bm25_retriever(self, bm25_db_dir: Path, documents_dir: Path) -> BM25Retriever:
+        bm25_db_dir, documents_dir = Path(bm25_db_dir).resolve(), Path(documents_dir).resolve()
+        return self._get(("bm25", bm25_db_dir, documents_dir), lambda: BM25Retriever(bm25_db_dir, documents_dir))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_default_registry: Optional[RetrieverRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_retriever_registry() -> RetrieverRegistry:
+    """返回进程内共享的注册表"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = RetrieverRegistry()
+        return _default_registry
@@ -0,0 +1,132 @@
+"""
+SEMANTIC ANSWER CACHE
+
+按问题嵌入相似度命中的答案缓存，供 SinglePDFProcessor 在检索、重排和 LLM 调用之前查询。
+近似重复的问题（"2024年营收是多少" 与 "2024年的营业收入"）直接返回已生成的答案。
+
+- 作用域：文档集合、答案类型（kind）、领域（domain）、答题模型，以及问题中出现的数字（年份、金额等）
+  完全一致的问题才会互相命中，避免 "2023年营收" 命中 "2024年营收" 的答案
+- 每个作用域一个小型 faiss 内积索引（向量 L2 归一化，内积即余弦相似度），
+  最相似的条目相似度不低于 threshold 时命中
+- 每个作用域最多保留 max_entries 条，超出时淘汰最早写入的条目；ttl_seconds 为 None 时不过期，
+  否则查询和写入时先清除作用域内已过期的条目，过期条目不会挡住同一问题的新答案
+- 命中的答案带 semantic_cache 审计字段：相似度、命中的原问题、写入时间
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+import faiss
+import numpy as np
+
+_NUMBERS = re.compile(r"\d+(?:\.\d+)?")
+
+
+def question_numbers(question: str) -> Tuple[str, ...]:
+    """问题中出现的数字（全角转半角后），作为作用域的一部分"""
+    return tuple(_NUMBERS.findall(unicodedata.normalize("NFKC", question)))
+
+
+class _Scope:
+    def __init__(self, dim: int):
+        self.index = faiss.IndexFlatIP(dim)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.entries: List[dict] = []
+
+    def rebuild(self):
+        self.index.reset()
+        if len(self.vectors):
+            self.index.add(self.vectors)
+
+    def drop_oldest(self, count: int):
+        # 条目按写入顺序排列，淘汰最早的 count 条后重建索引（作用域内条目很少，重建开销可忽略）
+        self.entries = self.entries[count:]
+        self.vectors = self.vectors[count:]
+        self.rebuild()
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._scopes: Dict[Hashable, _Scope] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope_key(document_ids: Sequence[str], kind: str, domain: str, model: str, question: str) -> tuple:
+        return (tuple(sorted(set(document_ids))), kind, domain, model, question_numbers(question))
+
+    @staticmethod
+    def _normalize(embedding: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+        vector = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding: Union[Sequence[float], np.ndarray], scope_key: tuple) -> Optional[dict]:
+        """返回命中的答案副本（带 semantic_cache 审计字段），未命中返回 None"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if scope is not None:
+                self._purge_expired(scope)
+            if scope is not None and scope.index.ntotal and scope.index.d == vector.shape[1]:
+                similarities, rows = scope.index.search(vector, 1)
+                similarity, row = float(similarities[0][0]), int(rows[0][0])
+                if row >= 0 and similarity >= self.threshold:
+                    entry = scope.entries[row]
+                    self.hits += 1
+                    answer = dict(entry["answer"])
+                    answer["semantic_cache"] = {
+                        "hit": True,
+                        "similarity": round(similarity, 4),
+                        "cached_question": entry["question"],
+                        "cached_at": entry["created_at"]
+                    }
+                    return answer
+            self.misses += 1
+            return None
+
+    def _purge_expired(self, scope: _Scope):
+        # 条目按写入时间递增，过期的条目是开头的一段
+        if self.ttl_seconds is None:
+            return
+        deadline = time.time() - self.ttl_seconds
+        expired = 0
+        while expired < len(scope.entries) and scope.entries[expired]["created_at"] < deadline:
+            expired += 1
+        if expired:
+            scope.drop_oldest(expired)
+
+    def store(self, embedding: Union[Sequence[float], np.ndarray], scope_key: tuple, question: str, answer: dict):
+        vector = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if scope is None or scope.index.d != vector.shape[1]:
+                scope = self._scopes[scope_key] = _Scope(vector.shape[1])
+            self._purge_expired(scope)
+            scope.entries.append({"question": question, "answer": dict(answer), "created_at": time.time()})
+            scope.vectors = np.concatenate([scope.vectors, vector])
+            if len(scope.entries) > self.max_entries:
+                scope.drop_oldest(len(scope.entries) - self.max_entries)
+            else:
+                scope.index.add(vector)
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "scopes": len(self._scopes),
+            "entries": sum(len(scope.entries) for scope in self._scopes.values())
+        }
@@ -7,6 +7,8 @@ from pathlib import Path
 from typing import Optional, List, Dict, Union
 from datetime import datetime
 
+from src.semantic_cache import SemanticAnswerCache
+
 import logging
 
 # 配置日志级别，减少调试信息输出
@@ -27,13 +29,16 @@ class SinglePDFProcessor:
         use_llm_reranking: bool = False,
         embedding_provider: str = "dashscope",
         answering_model: str = "qwen-turbo-latest",
-        domain: str = "universal"
+        domain: str = "universal",
+        semantic_cache_threshold: Optional[float] = 0.95
     ):
         self.temp_dir = Path(temp_dir) if temp_dir else Path(tempfile.mkdtemp(prefix="pdf_rag_"))
         self.use_llm_reranking = use_llm_reranking
         self.embedding_provider = embedding_provider
         self.answering_model = answering_model
         self.domain = domain
+        # 语义答案缓存：同一文档集合下相似度不低于阈值的问题直接返回已生成的答案，None 表示关闭
+        self.semantic_cache = SemanticAnswerCache(threshold=semantic_cache_threshold) if semantic_cache_threshold is not None else None
 
         self.uploaded_documents: Dict[str, dict] = {}
         self.retriever = None
@@ -90,27 +95,22 @@ class SinglePDFProcessor:
 
     def _split_and_index(self, md_path: Path, document_id: str) -> dict:
         from src.text_splitter import TextSplitter
+        from src.chunk_store import ChunkStore
 
+        # 只分块本次上传的文件，分块结果直接在内存中补充 metainfo 后写出一次，不再读回 JSON
         splitter = TextSplitter()
-        splitter.split_markdown_reports(
-            all_md_dir=self.markdown_dir,
-            output_dir=self.chunks_dir,
-            chunk_size=30,
-            chunk_overlap=5
-        )
+        metainfo = splitter.markdown_metainfo(md_path)
+        metainfo["document_id"] = document_id
+        metainfo["original_filename"] = md_path.stem
+        document = {
+            "metainfo": metainfo,
+            "content": {"chunks": splitter.split_markdown_file(md_path, chunk_size=30, chunk_overlap=5)}
+        }
 
         json_path = self.chunks_dir / f"{md_path.stem}.json"
-        if not json_path.exists():
-            raise FileNotFoundError(f"分块后的JSON文件不存在: {json_path}")
-
-        with open(json_path, 'r', encoding='utf-8') as f:
-            document = json.load(f)
-
-        document["metainfo"]["document_id"] = document_id
-        document["metainfo"]["original_filename"] = md_path.stem
-
         with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(document, f, indent=2, ensure_ascii=False)
+            json.dump(document, f, ensure_ascii=False)
+        ChunkStore.write(self.chunks_dir, json_path, document)
 
         return document
 
@@ -192,6 +192,20 @@ class SinglePDFProcessor:
         kind: str = "string",
         document_ids: Optional[List[str]] = None
     ) -> dict:
+        document_ids = self._prepare_question(question, document_ids)
+        return self._answer_with_retrieval(question, kind, document_ids)
+
+    async def aanswer_question(
+        self,
+        question: str,
+        kind: str = "string",
+        document_ids: Optional[List[str]] = None
+    ) -> dict:
+        """answer_question 的异步版本，嵌入、重排和答题请求不占用线程，可在一个事件循环上并发大量问题"""
+        document_ids = self._prepare_question(question, document_ids)
+        return await self._aanswer_with_retrieval(question, kind, document_ids)
+
+    def _prepare_question(self, question: str, document_ids: Optional[List[str]]) -> List[str]:
         if not self._initialized or self.retriever is None:
             raise RuntimeError("请先上传并处理PDF文件")
 
@@ -202,12 +216,19 @@ class SinglePDFProcessor:
             document_ids = list(self.uploaded_documents.keys())
 
         _log.info(f"开始回答问题: {question[:50]}...")
-
-        return self._answer_with_retrieval(question, kind, document_ids)
+        return document_ids
 
     def _answer_with_retrieval(self, question: str, kind: str, document_ids: List[str]) -> dict:
         from src.api_requests import APIProcessor
 
+        query_embedding = cache_scope = None
+        if self.semantic_cache is not None:
+            # 查询嵌入经嵌入缓存复用，下面的检索不会重复请求
+            query_embedding = self.retriever.vector_retriever._get_embedding(question)
+            cache_scope, cached_answer = self._lookup_semantic_cache(question, kind, document_ids, query_embedding)
+            if cached_answer is not None:
+                return cached_answer
+
         if self.use_llm_reranking:
             retrieval_results = self.retriever.retrieve(
                 query=question,
@@ -224,12 +245,7 @@ class SinglePDFProcessor:
             )
 
         if not retrieval_results:
-            return {
-                "final_answer": "抱歉，未在文档中找到与问题相关的内容。",
-                "step_by_step_analysis": "1. 检索阶段：未找到任何相关文本块",
-                "reasoning_summary": "文档中未找到回答问题所需的信息",
-                "relevant_pages": []
-            }
+            return self._no_results_answer()
 
         rag_context = self._format_retrieval_results(retrieval_results)
 
@@ -242,10 +258,75 @@ class SinglePDFProcessor:
             domain=self.domain
         )
 
+        return self._finalize_answer(answer_dict, retrieval_results, question, query_embedding, cache_scope)
+
+    async def _aanswer_with_retrieval(self, question: str, kind: str, document_ids: List[str]) -> dict:
+        from src.api_requests import APIProcessor
+
+        query_embedding = cache_scope = None
+        if self.semantic_cache is not None:
+            query_embedding = (await self.retriever.vector_retriever._aget_embeddings([question]))[0]
+            cache_scope, cached_answer = self._lookup_semantic_cache(question, kind, document_ids, query_embedding)
+            if cached_answer is not None:
+                return cached_answer
+
+        if self.use_llm_reranking:
+            retrieval_results = await self.retriever.aretrieve(
+                query=question,
+                document_ids=document_ids,
+                llm_reranking_sample_size=20,
+                top_n=10,
+                llm_weight=0.7
+            )
+        else:
+            retrieval_results = await self.retriever.vector_retriever.aretrieve(
+                query=question,
+                document_ids=document_ids,
+                top_n=10
+            )
+
+        if not retrieval_results:
+            return self._no_results_answer()
+
+        rag_context = self._format_retrieval_results(retrieval_results)
+
+        api_processor = APIProcessor(provider=self.embedding_provider)
+        answer_dict = await api_processor.aget_answer_from_rag_context(
+            question=question,
+            rag_context=rag_context,
+            schema=kind,
+            model=self.answering_model,
+            domain=self.domain
+        )
+
+        return self._finalize_answer(answer_dict, retrieval_results, question, query_embedding, cache_scope)
+
+    def _lookup_semantic_cache(self, question: str, kind: str, document_ids: List[str], query_embedding: List[float]):
+        cache_scope = SemanticAnswerCache.scope_key(document_ids, kind, self.domain, self.answering_model, question)
+        cached_answer = self.semantic_cache.lookup(query_embedding, cache_scope)
+        if cached_answer is not None:
+            audit = cached_answer["semantic_cache"]
+            _log.info(f"语义缓存命中 (相似度 {audit['similarity']}): {audit['cached_question'][:50]}")
+        return cache_scope, cached_answer
+
+    @staticmethod
+    def _no_results_answer() -> dict:
+        return {
+            "final_answer": "抱歉，未在文档中找到与问题相关的内容。",
+            "step_by_step_analysis": "1. 检索阶段：未找到任何相关文本块",
+            "reasoning_summary": "文档中未找到回答问题所需的信息",
+            "relevant_pages": []
+        }
+
+    def _finalize_answer(self, answer_dict: dict, retrieval_results: List[Dict], question: str, query_embedding, cache_scope) -> dict:
         pages = answer_dict.get("relevant_pages", [])
         validated_pages = self._validate_page_references(pages, retrieval_results)
         answer_dict["relevant_pages"] = validated_pages
 
+        if cache_scope is not None:
+            self.semantic_cache.store(query_embedding, cache_scope, question, answer_dict)
+            answer_dict["semantic_cache"] = {"hit": False}
+
         return answer_dict
 
     def _format_retrieval_results(self, retrieval_results: List[Dict]) -> str:
@@ -281,7 +362,8 @@ class SinglePDFProcessor:
             existing_pages = set(validated_pages)
             for result in retrieval_results:
                 page = result['page']
-                if page not in existing_pages:
+                # 页码 0 表示没有原文页码（如 markdown 报告的合成页面），不作为引用页补充
+                if page and page not in existing_pages:
                     validated_pages.append(page)
                     existing_pages.add(page)
                     if len(validated_pages) >= 2:
@@ -326,6 +408,8 @@ class SinglePDFProcessor:
         self.uploaded_documents.clear()
         if self.retriever:
             self.retriever.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
         self._initialized = False
         _log.info("已清空所有上传的文档")
 
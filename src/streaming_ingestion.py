@@ -0,0 +1,359 @@
+"""
+STREAMING INGESTION
+
+markdown 报告流式入库：逐行读取 → 分块 → 嵌入微批次 → 增量 index.add → 追加写入分块报告。
+各阶段运行在独立线程中，由有界队列相连，解析、嵌入和建索引相互重叠；
+内存中只保留队列中的少量微批次，峰值内存不随报告大小增长（向量索引本身除外）。
+
+输出与非流式流程一致：
+- documents_dir/<md文件名>.json    分块报告（紧凑 JSON，逐块追加写入）
+- documents_dir/chunks/<sha1>.*    检索用的文本块存储，与分块报告同步追加
+- vector_db_dir/<sha1>.faiss       分报告向量索引（及向量 id 到文本块下标的映射），并写入入库清单
+全部报告处理完成后由 VectorDBIngestor.build_corpus_index 合并全语料索引。
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from tqdm import tqdm
+
+from src.chunk_dedup import ChunkDeduplicator, save_vector_chunk_ids
+from src.chunk_store import ChunkStore, ChunkStoreWriter
+from src.embedding_checkpoint import EmbeddingCheckpoint
+from src.ingestion import VectorDBIngestor, _atomic_write
+from src.ingestion_manifest import ChunkHasher, IngestionManifest
+from src.text_splitter import TextSplitter
+
+_log = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+
+class _ChunkedReportWriter:
+    """逐块追加写入分块报告 JSON，结构与 split_markdown_reports 的输出相同"""
+
+    def __init__(self, output_path: Path, metainfo: dict):
+        self.output_path = output_path
+        self.tmp_path = output_path.with_name(output_path.name + ".tmp")
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write('{"metainfo": ' + json.dumps(metainfo, ensure_ascii=False) + ', "content": {"chunks": [')
+        self.num_chunks = 0
+
+    def append(self, chunk: dict):
+        if self.num_chunks:
+            self._file.write(', ')
+        self._file.write(json.dumps(chunk, ensure_ascii=False))
+        self.num_chunks += 1
+
+    def close(self):
+        self._file.write(']}}')
+        self._file.close()
+        self.tmp_path.replace(self.output_path)
+
+    def abort(self):
+        self._file.close()
+        if self.tmp_path.exists():
+            self.tmp_path.unlink()
+
+
+class StreamingIngestor:
+    def __init__(
+        self,
+        vector_ingestor: Optional[VectorDBIngestor] = None,
+        chunk_size: int = 30,
+        chunk_overlap: int = 5,
+        micro_batch_size: int = 64,
+        max_queued_batches: int = 4
+    ):
+        self.vector_ingestor = vector_ingestor or VectorDBIngestor()
+        self.text_splitter = TextSplitter()
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # 每个微批次的分块数，以及每个队列最多积压的微批次数（决定峰值内存）
+        self.micro_batch_size = micro_batch_size
+        self.max_queued_batches = max_queued_batches
+
+    def _streaming_index_choice(self) -> Tuple[str, str]:
+        """流式写入只能使用无需训练的索引：flat/hnsw，float32/fp16"""
+        # auto 在流式场景下不知道总向量数，直接用 flat；全语料索引仍按原配置合并构建
+        ingestor = self.vector_ingestor
+        index_type = ingestor.index_type if ingestor.index_type in ("flat", "hnsw") else "flat"
+        vector_encoding = ingestor.vector_encoding if ingestor.vector_encoding in ("float32", "fp16") else "fp16"
+        return index_type, vector_encoding
+
+    @property
+    def index_params(self) -> dict:
+        """
+        实际使用的分报告索引参数，写入入库清单。
+        与配置不同（需要训练的索引被替换）时，批量入库据此认为报告不是最新，会按配置重建索引。
+        """
+        index_type, vector_encoding = self._streaming_index_choice()
+        return {**self.vector_ingestor.index_params, "index_type": index_type, "vector_encoding": vector_encoding}
+
+    def _create_index(self, dimension: int) -> faiss.Index:
+        ingestor = self.vector_ingestor
+        index_type, vector_encoding = self._streaming_index_choice()
+        if ingestor.index_type not in ("auto", index_type) or vector_encoding != ingestor.vector_encoding:
+            _log.warning(
+                f"流式入库不支持需要训练的索引 {ingestor.index_type}/{ingestor.vector_encoding}，"
+                f"分报告索引改用 {index_type}/{vector_encoding}，之后的批量入库会按配置重建"
+            )
+        if index_type == "hnsw":
+            if vector_encoding == "fp16":
+                return faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, 32, faiss.METRIC_INNER_PRODUCT)
+            return faiss.IndexHNSWFlat(dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        if vector_encoding == "fp16":
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexFlatIP(dimension)
+
+    def _iter_micro_batches(self, md_path: Path) -> Iterator[List[dict]]:
+        batch = []
+        for chunk in self.text_splitter.iter_markdown_chunks(md_path, self.chunk_size, self.chunk_overlap):
+            batch.append(chunk)
+            if len(batch) >= self.micro_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _content_hash(self, md_path: Path) -> str:
+        # 与 VectorDBIngestor 的内容哈希一致；只顺序扫描一遍文件，不保留文本
+        hasher = ChunkHasher()
+        for chunk in self.text_splitter.iter_markdown_chunks(md_path, self.chunk_size, self.chunk_overlap):
+            if chunk["text"].strip():
+                hasher.update(chunk["text"][:self.vector_ingestor.MAX_CHUNK_LENGTH])
+        return hasher.hexdigest()
+
+    def _embed_micro_batch(
+        self,
+        batch: List[dict],
+        start: int,
+        checkpoint: Optional[EmbeddingCheckpoint] = None,
+        deduplicator: Optional[ChunkDeduplicator] = None,
+        representative_vectors: Optional[Dict[int, np.ndarray]] = None
+    ):
+        """
+        返回 (向量, 对应的文本块下标)，start 为该微批次首个分块在报告中的下标。
+        与 VectorDBIngestor 相同的过滤、截断和去重规则，经嵌入缓存、断点续传检查点和并发限流调度器。
+        去重时只嵌入代表，重复文本块复用代表的向量（representative_vectors 按去重序号跨微批次保存）。
+        """
+        ingestor = self.vector_ingestor
+        chunk_ids, texts, new_representatives, sources = [], [], [], []
+        for offset, chunk in enumerate(batch):
+            if not chunk["text"].strip():
+                continue
+            text = chunk["text"][:ingestor.MAX_CHUNK_LENGTH]
+            chunk_ids.append(start + offset)
+            if deduplicator is None:
+                texts.append(text)
+                continue
+            # 去重状态跨微批次累积，与整份报告一次去重的结果相同
+            position = deduplicator.num_added
+            representative = deduplicator.add(text)
+            if representative is None:
+                representative = position
+                new_representatives.append(position)
+                texts.append(text)
+            sources.append(representative)
+        if not chunk_ids:
+            return np.zeros((0, 0), dtype=np.float32), chunk_ids
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        if texts:
+            embeddings = np.array(ingestor.embedding_cache.get_or_compute(
+                ingestor.embedding_provider,
+                ingestor.embedding_model,
+                texts,
+                lambda missing: ingestor._embed_texts(missing, checkpoint),
+                flush=False
+            ), dtype=np.float32)
+        if deduplicator is None:
+            return embeddings, chunk_ids
+        representative_vectors.update(zip(new_representatives, embeddings))
+        return np.stack([representative_vectors[r] for r in sources]), chunk_ids
+
+    @staticmethod
+    def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+        # 带停止检查的阻塞写入：下游出错停止后不再卡在满队列上
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _get(q: queue.Queue, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _run_stage(self, target, output_queue: queue.Queue, errors: list, stop: threading.Event):
+        # 阶段线程出错时记录异常，并向下游发送结束标记，避免下游永久阻塞
+        try:
+            target()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            self._put(output_queue, _DONE, stop)
+
+    def ingest_markdown(
+        self,
+        md_path: Path,
+        documents_dir: Path,
+        vector_db_dir: Path,
+        manifest: IngestionManifest,
+        force: bool = False
+    ) -> dict:
+        """流式处理单个 markdown 文件，返回与 _run_ingestion 相同格式的结果"""
+        metainfo = self.text_splitter.markdown_metainfo(md_path)
+        sha1 = metainfo["sha1"]
+        ingestor = self.vector_ingestor
+        ingestor._prepare_embedder(vector_db_dir)
+        report_path = documents_dir / (md_path.stem + ".json")
+        content_hash = self._content_hash(md_path)
+        if (
+            not force
+            and report_path.exists()
+            and manifest.is_current(sha1, content_hash, ingestor.embedding_model, self.index_params)
+        ):
+            print(f"报告未变化，跳过: {md_path.name}")
+            return {"status": "skipped", "report": md_path.name}
+        documents_dir.mkdir(parents=True, exist_ok=True)
+        vector_db_dir.mkdir(parents=True, exist_ok=True)
+
+        chunk_queue: queue.Queue = queue.Queue(maxsize=self.max_queued_batches)
+        vector_queue: queue.Queue = queue.Queue(maxsize=self.max_queued_batches)
+        errors: list = []
+        stop = threading.Event()
+        checkpoint = EmbeddingCheckpoint(vector_db_dir, sha1, content_hash, ingestor.embedding_model)
+        deduplicator = ChunkDeduplicator(ingestor.dedup_threshold) if ingestor.dedup_threshold is not None else None
+        representative_vectors: Dict[int, np.ndarray] = {}
+
+        def parse():
+            for batch in self._iter_micro_batches(md_path):
+                if not self._put(chunk_queue, batch, stop):
+                    return
+
+        def embed():
+            start = 0
+            while True:
+                batch = self._get(chunk_queue, stop)
+                if batch is _DONE:
+                    return
+                embeddings, chunk_ids = self._embed_micro_batch(batch, start, checkpoint, deduplicator, representative_vectors)
+                start += len(batch)
+                if not self._put(vector_queue, (batch, embeddings, chunk_ids), stop):
+                    return
+
+        # 先创建输出文件再启动线程：创建失败（目录不可写等）时没有线程阻塞在队列上
+        writer = _ChunkedReportWriter(report_path, metainfo)
+        try:
+            store_writer = ChunkStoreWriter(ChunkStore.store_dir(documents_dir), sha1)
+        except BaseException:
+            writer.abort()
+            raise
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(parse, chunk_queue, errors, stop), daemon=True),
+            threading.Thread(target=self._run_stage, args=(embed, vector_queue, errors, stop), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        index = None
+        vector_chunk_ids: List[int] = []
+        t0 = time.time()
+        try:
+            # 主线程：增量 add 到索引，并把分块追加写入分块报告
+            while True:
+                item = vector_queue.get()
+                if item is _DONE:
+                    break
+                batch, embeddings, chunk_ids = item
+                for chunk in batch:
+                    writer.append(chunk)
+                    store_writer.append_chunk(chunk)
+                if len(embeddings):
+                    if index is None:
+                        index = self._create_index(embeddings.shape[1])
+                    index.add(embeddings)
+                    vector_chunk_ids.extend(chunk_ids)
+            if errors:
+                raise errors[0]
+            if index is None:
+                raise ValueError(f"{md_path.name} 没有可嵌入的文本块")
+        except BaseException:
+            stop.set()
+            writer.abort()
+            store_writer.abort()
+            raise
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            ingestor.embedding_cache.flush()
+
+        writer.close()
+        store_writer.close(metainfo, report_path)
+        faiss_path = vector_db_dir / f"{sha1}.faiss"
+        save_vector_chunk_ids(vector_db_dir, sha1, vector_chunk_ids)
+        _atomic_write(faiss_path, lambda tmp_file: faiss.write_index(index, str(tmp_file)))
+        checkpoint.remove()
+        if deduplicator is not None:
+            stats = deduplicator.stats
+            print(f"文本块去重: 精确重复 {stats.exact_duplicates}，近似重复 {stats.near_duplicates}，嵌入 {stats.num_representatives} 个")
+        print(f"流式入库完成: {md_path.name}，{writer.num_chunks} 个分块，{len(vector_chunk_ids)} 条向量，耗时 {time.time() - t0:.2f} 秒")
+        return {
+            "status": "processed",
+            "report": md_path.name,
+            "manifest_entry": {
+                "sha1": sha1,
+                "content_hash": content_hash,
+                "embedding_model": ingestor.embedding_model,
+                "index_params": self.index_params,
+                "output_file": faiss_path.name,
+                "source_file": report_path.name,
+                "num_chunks": len(vector_chunk_ids)
+            }
+        }
+
+    def process_markdown_reports(self, all_md_dir: Path, documents_dir: Path, vector_db_dir: Path, force: bool = False) -> dict:
+        """
+        流式处理目录下所有 markdown 报告，逐份更新入库清单，最后合并全语料索引。
+        任一报告失败时，在全部报告处理完后抛出汇总异常。
+        """
+        manifest = IngestionManifest(vector_db_dir)
+        summary = {"processed": [], "skipped": [], "failed": []}
+        for md_path in tqdm(sorted(all_md_dir.glob("*.md")), desc="Streaming markdown reports"):
+            try:
+                result = self.ingest_markdown(md_path, documents_dir, vector_db_dir, manifest, force)
+            except Exception as e:
+                result = {"status": "failed", "report": md_path.name, "error": f"{type(e).__name__}: {e}"}
+            summary[result["status"]].append(result)
+            if result["status"] == "processed":
+                manifest.record(**result["manifest_entry"])
+                manifest.save()
+
+        print(
+            f"Processed {len(summary['processed'])} reports, "
+            f"skipped {len(summary['skipped'])} unchanged reports, "
+            f"failed {len(summary['failed'])} reports"
+        )
+        if summary["failed"]:
+            for result in summary["failed"]:
+                print(f"  失败: {result['report']}: {result['error']}")
+            raise RuntimeError(f"{len(summary['failed'])} 份报告流式入库失败: {[r['report'] for r in summary['failed']]}")
+        self.vector_ingestor.build_corpus_index(documents_dir, vector_db_dir, force=force)
+        return summary
@@ -1,10 +1,13 @@
 import json
+import hashlib
 import tiktoken
 from pathlib import Path
 from typing import List, Dict, Optional
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import pandas as pd
 import os
+from collections import deque
+from src.chunk_store import ChunkStore
 
 # 文本分块工具类，支持按页分块、表格插入、token统计等
 class TextSplitter():
@@ -121,9 +124,10 @@ class TextSplitter():
             # 确保输出目录存在
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # 写入分块后的报告到目标目录
+            # 写入分块后的报告到目标目录，并生成检索用的文本块存储
             with open(output_dir / report_path.name, 'w', encoding='utf-8') as file:
                 json.dump(updated_report, file, indent=2, ensure_ascii=False)
+            ChunkStore.write(output_dir, output_dir / report_path.name, updated_report)
                 
         # 输出处理文件数统计
         print(f"已分块处理 {len(all_report_paths)} 个文件")
@@ -136,21 +140,49 @@ class TextSplitter():
         :param chunk_overlap: 分块重叠行数
         :return: 分块列表
         """
+        return list(self.iter_markdown_chunks(md_path, chunk_size, chunk_overlap))
+
+    def iter_markdown_chunks(self, md_path: Path, chunk_size: int = 30, chunk_overlap: int = 5):
+        """
+        逐行读取 markdown 文件并逐个产出分块（与 split_markdown_file 结果一致），
+        只在内存中保留当前窗口的 chunk_size 行，适合超大文件的流式处理。
+        """
+        step = chunk_size - chunk_overlap
+        if step <= 0:
+            raise ValueError("chunk_overlap 必须小于 chunk_size")
+        window = deque()
+        start = 0  # 当前窗口第一行的下标（从0开始）
+        total_lines = 0
         with open(md_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        chunks = []
-        i = 0
-        total_lines = len(lines)
-        while i < total_lines:
-            start = i
-            end = min(i + chunk_size, total_lines)
-            chunk_text = ''.join(lines[start:end])
-            chunks.append({
-                'lines': [start + 1, end],  # 行号从1开始
-                'text': chunk_text
-            })
-            i += chunk_size - chunk_overlap
-        return chunks
+            for line in f:
+                window.append(line)
+                total_lines += 1
+                if len(window) == chunk_size:
+                    yield {'lines': [start + 1, start + chunk_size], 'text': ''.join(window)}
+                    for _ in range(step):
+                        window.popleft()
+                    start += step
+        # 文件结束：输出剩余不足 chunk_size 行的分块
+        while start < total_lines:
+            end = min(start + chunk_size, total_lines)
+            yield {'lines': [start + 1, end], 'text': ''.join(list(window)[:end - start])}
+            for _ in range(min(step, len(window))):
+                window.popleft()
+            start += step
+
+    def markdown_metainfo(self, md_path: Path, file2company: Optional[Dict[str, str]] = None, file2sha1: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """根据文件名生成分块报告的 metainfo（sha1、company_name、file_name）"""
+        file_no_ext = md_path.stem
+        company_name = (file2company or {}).get(file_no_ext, "")
+        sha1 = (file2sha1 or {}).get(file_no_ext, "")
+        # 如果没有找到 company_name，尝试从文件名中提取（假设文件名格式为【公司名】...）
+        if not company_name and '【' in file_no_ext and '】' in file_no_ext:
+            company_name = file_no_ext.split('【')[1].split('】')[0]
+        # 如果没有找到 sha1，使用文件名的哈希值作为替代
+        if not sha1:
+            sha1 = hashlib.sha1(file_no_ext.encode('utf-8')).hexdigest()
+        # metainfo 只保留 sha1、company_name、file_name 字段
+        return {"sha1": sha1, "company_name": company_name, "file_name": md_path.name}
 
     def split_markdown_reports(self, all_md_dir: Path, output_dir: Path, chunk_size: int = 30, chunk_overlap: int = 5):
         """
@@ -168,20 +200,10 @@ class TextSplitter():
         for md_path in all_md_paths:
             chunks = self.split_markdown_file(md_path, chunk_size, chunk_overlap)
             output_json_path = output_dir / (md_path.stem + ".json")
-            # 查找 company_name 和 sha1
-            file_no_ext = md_path.stem
-            company_name = file2company.get(file_no_ext, "")
-            sha1 = file2sha1.get(file_no_ext, "")
-            # 如果没有找到 company_name，尝试从文件名中提取（假设文件名格式为【公司名】...）
-            if not company_name and '【' in file_no_ext and '】' in file_no_ext:
-                company_name = file_no_ext.split('【')[1].split('】')[0]
-            # 如果没有找到 sha1，使用文件名的哈希值作为替代
-            if not sha1:
-                import hashlib
-                sha1 = hashlib.sha1(file_no_ext.encode('utf-8')).hexdigest()
-            # metainfo 只保留 sha1、company_name、file_name 字段
-            metainfo = {"sha1": sha1, "company_name": company_name, "file_name": md_path.name}
+            metainfo = self.markdown_metainfo(md_path, file2company, file2sha1)
+            document = {"metainfo": metainfo, "content": {"chunks": chunks}}
             with open(output_json_path, 'w', encoding='utf-8') as f:
-                json.dump({"metainfo": metainfo, "content": {"chunks": chunks}}, f, ensure_ascii=False, indent=2)
+                json.dump(document, f, ensure_ascii=False, indent=2)
+            ChunkStore.write(output_dir, output_json_path, document)
             print(f"已处理: {md_path.name} -> {output_json_path.name}")
         print(f"共分割 {len(all_md_paths)} 个 markdown 文件")
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+TOKENIZATION
+
+词法检索（BM25）使用的分词器，以及按文本块缓存的 token id 数组。
+
+分词模式：
+- whitespace     按空白切分（原有行为，适合英文）
+- char_ngram     中日韩字符切成字符 n-gram（默认 1~2 元），其余部分按字母数字单词切分并小写
+- hashed_bigram  中日韩字符二元组 + 单词，哈希到固定数量的桶，词表大小有上限
+
+char_ngram、hashed_bigram 先做 NFKC 规范化（全角数字、字母转半角，"２０２４" 与 "2024" 为同一 token）。
+所有分词器都输出 int32 token id（crc32 哈希），BM25 索引与查询直接使用 id，
+每份报告的 token id 数组保存在分块报告目录的 tokens/ 子目录，重复建索引时不再分词。
+"""
+
+import os
+import re
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from src.ingestion_manifest import IngestionManifest
+
+# 中日韩统一表意文字、扩展A、兼容表意文字、日文假名、韩文音节
+_CJK_CHARS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_SEGMENT_PATTERN = re.compile(f"([{_CJK_CHARS}]+)|([A-Za-z0-9]+(?:[.,][0-9]+)*)")
+
+
+def hash_token(token: str) -> int:
+    # 31 位 crc32，保证落在 int32 正数范围内
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+class Tokenizer(ABC):
+    """分词器基类：tokenize 返回字符串 token，encode 返回 int32 token id 数组"""
+
+    name = "base"
+
+    @property
+    def params(self) -> dict:
+        return {"name": self.name}
+
+    @property
+    def key(self) -> str:
+        # 用于缓存文件名和入库清单，参数不同的分词结果互不复用
+        return "-".join(str(v) for v in self.params.values())
+
+    @abstractmethod
+    def tokenize(self, text: str) -> List[str]:
+        ...
+
+    def token_id(self, token: str) -> int:
+        return hash_token(token)
+
+    def encode(self, text: str) -> np.ndarray:
+        return np.array([self.token_id(t) for t in self.tokenize(text)], dtype=np.int32)
+
+    def encode_batch(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """批量编码，返回拼接后的 id 数组和每个文本的起止偏移（CSR 形式）"""
+        encoded = [self.encode(text) for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ids) for ids in encoded])
+        ids = np.concatenate(encoded) if encoded else np.array([], dtype=np.int32)
+        return ids.astype(np.int32, copy=False), offsets
+
+
+class WhitespaceTokenizer(Tokenizer):
+    name = "whitespace"
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.split()
+
+
+class _SegmentingTokenizer(Tokenizer):
+    """按中日韩字符片段和字母数字单词切分的分词器，切分前按 normalization 做 Unicode 规范化"""
+
+    def __init__(self, normalization: Optional[str] = "NFKC"):
+        # None 表示不规范化（规范化之前建的索引，参数中没有 normalization）
+        self.normalization = normalization
+
+    def segments(self, text: str) -> List[Tuple[str, str]]:
+        if self.normalization:
+            text = unicodedata.normalize(self.normalization, text)
+        return _SEGMENT_PATTERN.findall(text)
+
+
+class CharNgramTokenizer(_SegmentingTokenizer):
+    name = "char_ngram"
+
+    def __init__(self, min_n: int = 1, max_n: int = 2, normalization: Optional[str] = "NFKC"):
+        if not 1 <= min_n <= max_n:
+            raise ValueError(f"n-gram 范围无效: {min_n}~{max_n}")
+        super().__init__(normalization)
+        self.min_n = min_n
+        self.max_n = max_n
+
+    @property
+    def params(self) -> dict:
+        return {"name": self.name, "min_n": self.min_n, "max_n": self.max_n, "normalization": self.normalization}
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for cjk, word in self.segments(text):
+            if word:
+                tokens.append(word.lower())
+                continue
+            for n in range(self.min_n, self.max_n + 1):
+                tokens.extend(cjk[i:i + n] for i in range(len(cjk) - n + 1))
+            # 比 min_n 还短的片段整体作为一个 token
+            if len(cjk) < self.min_n:
+                tokens.append(cjk)
+        return tokens
+
+
+class HashedBigramTokenizer(_SegmentingTokenizer):
+    name = "hashed_bigram"
+
+    def __init__(self, num_buckets: int = 1 << 20, normalization: Optional[str] = "NFKC"):
+        super().__init__(normalization)
+        self.num_buckets = num_buckets
+
+    @property
+    def params(self) -> dict:
+        return {"name": self.name, "num_buckets": self.num_buckets, "normalization": self.normalization}
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for cjk, word in self.segments(text):
+            if word:
+                tokens.append(word.lower())
+            elif len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        return tokens
+
+    def token_id(self, token: str) -> int:
+        return hash_token(token) % self.num_buckets
+
+
+TOKENIZERS: Dict[str, Type[Tokenizer]] = {
+    "whitespace": WhitespaceTokenizer,
+    "char_ngram": CharNgramTokenizer,
+    "hashed_bigram": HashedBigramTokenizer,
+}
+
+
+def get_tokenizer(name: str = "char_ngram", **kwargs) -> Tokenizer:
+    if name not in TOKENIZERS:
+        raise ValueError(f"不支持的分词模式: {name}，可选: {list(TOKENIZERS)}")
+    return TOKENIZERS[name](**kwargs)
+
+
+def tokenizer_from_params(params: dict) -> Tokenizer:
+    """由 Tokenizer.params 还原分词器（BM25 索引文件中保存的就是这份参数）"""
+    params = dict(params)
+    name = params.pop("name")
+    if issubclass(TOKENIZERS.get(name, Tokenizer), _SegmentingTokenizer):
+        # 参数中没有 normalization 的是规范化之前建的索引，查询保持相同的切分方式
+        params.setdefault("normalization", None)
+    return get_tokenizer(name, **params)
+
+
+class TokenStore:
+    """
+    按报告缓存文本块的 token id 数组：<报告目录>/tokens/<sha1>.<分词器key>.npz，
+    内含拼接后的 ids、每个文本块的偏移 offsets 和文本内容哈希；内容变化时重新分词。
+    """
+
+    DIR_NAME = "tokens"
+
+    def __init__(self, documents_dir: Path, tokenizer: Tokenizer):
+        self.store_dir = Path(documents_dir) / self.DIR_NAME
+        self.tokenizer = tokenizer
+
+    def _path(self, sha1: str) -> Path:
+        return self.store_dir / f"{sha1}.{self.tokenizer.key}.npz"
+
+    def load_or_encode(self, sha1: str, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (ids, offsets)，第 i 个文本块的 token 为 ids[offsets[i]:offsets[i+1]]"""
+        path = self._path(sha1)
+        content_hash = IngestionManifest.hash_chunks(texts)
+        if path.exists():
+            try:
+                with np.load(path) as data:
+                    if str(data["content_hash"]) == content_hash:
+                        return data["ids"], data["offsets"]
+            except (OSError, KeyError, ValueError):
+                pass
+
+        ids, offsets = self.tokenizer.encode_batch(texts)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=ids, offsets=offsets, content_hash=np.array(content_hash))
+        os.replace(tmp_path, path)
+        return ids, offsets
@@ -0,0 +1,394 @@
+"""
+VECTOR INDEX
+
+FAISS 向量索引的构建、检索参数设置与评估工具。
+
+支持的索引类型（均使用内积/余弦相似度）：
+- flat   暴力检索，结果精确，适合小规模语料
+- hnsw   图索引，召回高、内存比 flat 略大，检索参数 efSearch
+- ivf    倒排索引（IVF-Flat），需要训练，检索参数 nprobe
+- ivfpq  倒排 + 乘积量化（IVF-PQ），内存最小，召回有损，检索参数 nprobe
+- auto   根据向量数量和内存预算自动选择
+
+向量编码（flat/hnsw/ivf 适用，ivfpq 本身已量化）：
+- float32  原始精度
+- fp16     半精度，内存减半，召回几乎无损
+- sq8      8 位标量量化，内存为 1/4，可配合全精度向量对候选重打分（rescore_top_k）
+"""
+
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf", "ivfpq")
+VECTOR_ENCODINGS = ("float32", "fp16", "sq8")
+_SCALAR_QUANTIZER_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+_BYTES_PER_DIMENSION = {"float32": 4, "fp16": 2, "sq8": 1}
+
+# 自动选择阈值：小于该数量直接暴力检索
+FLAT_MAX_VECTORS = 20_000
+# 超过该数量时 HNSW 的构建时间和图内存开销不再划算，改用 IVF
+HNSW_MAX_VECTORS = 1_000_000
+# IVF 每个聚类中心至少需要的训练样本数（faiss 推荐 39 个）
+IVF_MIN_POINTS_PER_CENTROID = 39
+# PQ 每个子空间 256 个码字，训练样本需不少于此数
+PQ_MIN_TRAINING_POINTS = 256 * IVF_MIN_POINTS_PER_CENTROID
+
+
+def estimate_index_bytes(
+    index_type: str,
+    num_vectors: int,
+    dimension: int,
+    hnsw_m: int = 32,
+    pq_m: Optional[int] = None,
+    vector_encoding: str = "float32"
+) -> int:
+    """粗略估算索引常驻内存（字节），用于按内存预算选择索引类型"""
+    flat_bytes = num_vectors * dimension * _BYTES_PER_DIMENSION[vector_encoding]
+    if index_type == "flat":
+        return flat_bytes
+    if index_type == "hnsw":
+        # 第0层每个节点 2*M 条边，每条边 4 字节
+        return flat_bytes + num_vectors * hnsw_m * 2 * 4
+    if index_type == "ivf":
+        # 向量 + 8 字节 id
+        return flat_bytes + num_vectors * 8
+    if index_type == "ivfpq":
+        pq_m = pq_m or _default_pq_m(dimension)
+        return num_vectors * (pq_m + 8)
+    raise ValueError(f"不支持的索引类型: {index_type}")
+
+
+def choose_index_type(num_vectors: int, dimension: int, memory_budget_mb: Optional[float] = None, vector_encoding: str = "float32") -> str:
+    """根据向量数量、向量编码和内存预算选择索引类型"""
+    budget_bytes = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+
+    def fits(index_type: str) -> bool:
+        return budget_bytes is None or estimate_index_bytes(index_type, num_vectors, dimension, vector_encoding=vector_encoding) <= budget_bytes
+
+    if num_vectors < FLAT_MAX_VECTORS and fits("flat"):
+        return "flat"
+    if num_vectors < HNSW_MAX_VECTORS and fits("hnsw"):
+        return "hnsw"
+    if fits("ivf") or num_vectors < PQ_MIN_TRAINING_POINTS:
+        return "ivf"
+    return "ivfpq"
+
+
+def _default_nlist(num_vectors: int) -> int:
+    # 经验值 4*sqrt(N)，并保证每个中心有足够训练样本
+    nlist = int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // IVF_MIN_POINTS_PER_CENTROID))
+
+
+def _default_pq_m(dimension: int) -> int:
+    # 子空间数需整除维度，优先每个子空间 16~32 维
+    for pq_m in (96, 64, 48, 32, 24, 16, 8, 4, 2, 1):
+        if dimension % pq_m == 0 and dimension // pq_m >= 16:
+            return pq_m
+    return 1
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "auto",
+    memory_budget_mb: Optional[float] = None,
+    hnsw_m: int = 32,
+    hnsw_ef_construction: int = 200,
+    ivf_nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+    vector_encoding: str = "float32"
+) -> faiss.Index:
+    """用给定向量构建索引并完成训练和添加"""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    num_vectors, dimension = embeddings.shape
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选: {INDEX_TYPES}")
+    if vector_encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"不支持的向量编码: {vector_encoding}，可选: {VECTOR_ENCODINGS}")
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors, dimension, memory_budget_mb, vector_encoding)
+
+    # 训练样本不足时退化为能训练的类型
+    if index_type == "ivfpq" and num_vectors < PQ_MIN_TRAINING_POINTS:
+        index_type = "ivf"
+    if index_type == "ivf" and num_vectors < IVF_MIN_POINTS_PER_CENTROID * 2:
+        index_type = "flat"
+
+    sq_type = _SCALAR_QUANTIZER_TYPES.get(vector_encoding)
+    if index_type == "flat":
+        if sq_type is None:
+            index = faiss.IndexFlatIP(dimension)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, sq_type, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "hnsw":
+        if sq_type is None:
+            index = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, sq_type, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = hnsw_ef_construction
+    else:
+        nlist = ivf_nlist or _default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf" and sq_type is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "ivf":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, sq_type, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or _default_pq_m(dimension), 8, faiss.METRIC_INNER_PRODUCT)
+    # 标量量化需要训练每一维的取值范围，IVF 需要训练聚类中心
+    if not index.is_trained or sq_type is not None:
+        index.train(embeddings)
+
+    index.add(embeddings)
+    _log.info(f"构建 {index_type} 索引: {num_vectors} 条向量, 维度 {dimension}, 编码 {vector_encoding}")
+    return index
+
+
+# IO_FLAG_MMAP_IFC 对 flat/SQ/HNSW 的向量数据同样使用内存映射（faiss >= 1.8），旧版本退回只映射 IVF 倒排表
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def read_index(path, mmap: bool = False) -> faiss.Index:
+    """读取索引；mmap=True 时以只读内存映射方式打开，向量数据按需换入，不计入常驻内存"""
+    if mmap:
+        try:
+            return faiss.read_index(str(path), _MMAP_FLAGS)
+        except RuntimeError as e:
+            _log.warning(f"内存映射读取失败，改为完整读取 {path}: {e}")
+    return faiss.read_index(str(path))
+
+
+def set_search_params(index: faiss.Index, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> faiss.Index:
+    """设置检索参数：HNSW 的 efSearch、IVF 的 nprobe；对不适用的索引类型无影响"""
+    if ef_search is not None:
+        hnsw_index = faiss.downcast_index(index)
+        if isinstance(hnsw_index, faiss.IndexHNSW):
+            hnsw_index.hnsw.efSearch = ef_search
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+    return index
+
+
+def make_search_params(
+    index: faiss.Index,
+    selector: Optional[faiss.IDSelector] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None
+) -> faiss.SearchParameters:
+    """
+    构造单次检索参数（可带 ID 过滤器）。
+    faiss 的 SearchParameters 默认值会覆盖索引上的设置（efSearch=16, nprobe=1），
+    未显式指定时沿用索引当前的值。
+    """
+    concrete = faiss.downcast_index(index)
+    if isinstance(concrete, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or concrete.hnsw.efSearch
+    elif isinstance(concrete, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or concrete.nprobe
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def describe_index(index: faiss.Index) -> str:
+    """返回索引类型名称，用于日志和报告"""
+    concrete = faiss.downcast_index(index)
+    if isinstance(concrete, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(concrete, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(concrete, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(concrete, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return "flat"
+    return type(concrete).__name__
+
+
+def describe_encoding(index: faiss.Index) -> str:
+    """返回索引的向量编码：float32/fp16/sq8，乘积量化返回 pq"""
+    concrete = faiss.downcast_index(index)
+    if isinstance(concrete, faiss.IndexHNSW):
+        concrete = faiss.downcast_index(concrete.storage)
+    if isinstance(concrete, faiss.IndexIVFPQ):
+        return "pq"
+    sq = getattr(concrete, "sq", None)
+    if sq is not None:
+        for name, sq_type in _SCALAR_QUANTIZER_TYPES.items():
+            if sq.qtype == sq_type:
+                return name
+        return "sq"
+    return "float32"
+
+
+def rescore_top_k(query_vectors: np.ndarray, candidate_ids: np.ndarray, full_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    用全精度向量对量化索引返回的候选重新打分，取前 k 个。
+    full_vectors 可以是内存映射数组，只有候选所在的行会被读入。
+    candidate_ids 中的 -1 表示空位。返回 (scores, ids)，形状均为 (nq, k)。
+    """
+    num_queries = len(query_vectors)
+    scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((num_queries, k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(query_vectors, candidate_ids)):
+        candidates = candidates[candidates >= 0]
+        if len(candidates) == 0:
+            continue
+        # 按 id 排序读取，内存映射时顺序访问磁盘
+        sorted_candidates = np.sort(candidates)
+        exact = np.asarray(full_vectors[sorted_candidates], dtype=np.float32) @ query
+        top = np.argsort(-exact, kind="stable")[:k]
+        scores[row, :len(top)] = exact[top]
+        ids[row, :len(top)] = sorted_candidates[top]
+    return scores, ids
+
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    """从已有索引中取回全部向量（IVF 索引需要先建立 direct map，量化索引取回的是有损重建值）"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+        ivf_index.make_direct_map()
+    except RuntimeError:
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _sample_queries(embeddings: np.ndarray, queries: Optional[np.ndarray], num_queries: int, seed: int) -> np.ndarray:
+    # 未提供查询时，从语料中随机抽样并加入少量噪声
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+        queries = embeddings[sample] + rng.normal(scale=0.01, size=(len(sample), embeddings.shape[1])).astype(np.float32)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+
+def recall_latency_report(
+    embeddings: np.ndarray,
+    queries: Optional[np.ndarray] = None,
+    k: int = 10,
+    num_queries: int = 200,
+    index_types: Sequence[str] = ("hnsw", "ivf", "ivfpq"),
+    ef_search_values: Sequence[int] = (16, 32, 64, 128),
+    nprobe_values: Sequence[int] = (1, 4, 16, 64),
+    seed: int = 0
+) -> List[Dict]:
+    """
+    以 flat 暴力检索为基准，评估各索引类型在不同检索参数下的 recall@k 与单条查询延迟。
+    未提供 queries 时，从语料中随机抽样并加入少量噪声作为查询。
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = _sample_queries(embeddings, queries, num_queries, seed)
+    k = min(k, len(embeddings))
+
+    def timed_search(index: faiss.Index):
+        t0 = time.perf_counter()
+        _, indices = index.search(queries, k)
+        return indices, (time.perf_counter() - t0) * 1000 / len(queries)
+
+    t0 = time.perf_counter()
+    flat_index = build_index(embeddings, index_type="flat")
+    flat_build_seconds = time.perf_counter() - t0
+    ground_truth, flat_latency = timed_search(flat_index)
+    rows = [{
+        "index_type": "flat",
+        "params": "-",
+        f"recall@{k}": 1.0,
+        "latency_ms": round(flat_latency, 4),
+        "build_seconds": round(flat_build_seconds, 3),
+        "size_mb": round(faiss.serialize_index(flat_index).nbytes / 1024 / 1024, 2)
+    }]
+
+    for index_type in index_types:
+        t0 = time.perf_counter()
+        index = build_index(embeddings, index_type=index_type)
+        build_seconds = time.perf_counter() - t0
+        actual_type = describe_index(index)
+        if actual_type != index_type:
+            _log.warning(f"语料规模不足以构建 {index_type}，实际为 {actual_type}，跳过")
+            continue
+        size_mb = round(faiss.serialize_index(index).nbytes / 1024 / 1024, 2)
+        if index_type == "hnsw":
+            settings = [("efSearch", v, {"ef_search": v}) for v in ef_search_values]
+        else:
+            settings = [("nprobe", v, {"nprobe": v}) for v in nprobe_values]
+        for name, value, params in settings:
+            set_search_params(index, **params)
+            indices, latency = timed_search(index)
+            hits = sum(len(np.intersect1d(found, truth)) for found, truth in zip(indices, ground_truth))
+            rows.append({
+                "index_type": index_type,
+                "params": f"{name}={value}",
+                f"recall@{k}": round(hits / (len(queries) * k), 4),
+                "latency_ms": round(latency, 4),
+                "build_seconds": round(build_seconds, 3),
+                "size_mb": size_mb
+            })
+    return rows
+
+
+def quantization_report(
+    embeddings: np.ndarray,
+    queries: Optional[np.ndarray] = None,
+    k: int = 10,
+    num_queries: int = 200,
+    index_type: str = "flat",
+    vector_encodings: Sequence[str] = VECTOR_ENCODINGS,
+    rescore_factors: Sequence[int] = (0, 4),
+    seed: int = 0
+) -> List[Dict]:
+    """
+    比较同一索引类型在 float32/fp16/sq8 编码下的索引大小和 recall@k。
+    rescore_factor > 1 时先取 k*rescore_factor 个候选，再用全精度向量重打分。
+    以 float32 flat 暴力检索为基准。
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = _sample_queries(embeddings, queries, num_queries, seed)
+    k = min(k, len(embeddings))
+    _, ground_truth = build_index(embeddings, index_type="flat").search(queries, k)
+
+    rows = []
+    baseline_mb = None
+    for vector_encoding in vector_encodings:
+        index = build_index(embeddings, index_type=index_type, vector_encoding=vector_encoding)
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        if baseline_mb is None:
+            baseline_mb = size_mb
+        for rescore_factor in rescore_factors:
+            if rescore_factor > 1 and vector_encoding == "float32":
+                continue
+            t0 = time.perf_counter()
+            if rescore_factor > 1:
+                _, candidates = index.search(queries, min(k * rescore_factor, len(embeddings)))
+                _, indices = rescore_top_k(queries, candidates, embeddings, k)
+            else:
+                _, indices = index.search(queries, k)
+            latency = (time.perf_counter() - t0) * 1000 / len(queries)
+            hits = sum(len(np.intersect1d(found, truth)) for found, truth in zip(indices, ground_truth))
+            rows.append({
+                "index_type": describe_index(index),
+                "encoding": vector_encoding,
+                "rescore": f"x{rescore_factor}" if rescore_factor > 1 else "-",
+                f"recall@{k}": round(hits / (len(queries) * k), 4),
+                "latency_ms": round(latency, 4),
+                "size_mb": round(size_mb, 2),
+                "memory_saving": f"{1 - size_mb / baseline_mb:.0%}"
+            })
+    return rows
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 测试以 src.xxx 导入，与 main.py 等入口一致
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,61 @@
+import io
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from src.bm25_index import BM25Index
+
+DOCS = [
+    "revenue grew strongly in 2024".split(),
+    "operating cost fell while revenue grew".split(),
+    "net income rose".split(),
+    "the board approved a dividend".split(),
+    "revenue revenue revenue".split(),
+]
+
+
+@pytest.mark.parametrize("query", [
+    ["revenue"],
+    ["revenue", "grew"],
+    ["revenue", "revenue", "income"],
+    ["dividend", "board", "missing"],
+    ["revenuezzz"],
+    ["re"],
+    [],
+])
+def test_scores_match_rank_bm25(query):
+    index = BM25Index.from_tokenized(DOCS)
+    expected = BM25Okapi(DOCS).get_scores(query)
+    np.testing.assert_allclose(index.get_scores(query), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_long_query_token_is_not_truncated_to_vocabulary_width():
+    index = BM25Index.from_tokenized([["revenue"], ["cost"], ["income"]])
+    assert index.vocabulary.dtype == np.dtype("<U7")
+    assert not index.get_scores(["revenuezzz"]).any()
+
+
+def test_integer_vocabulary():
+    tokenized = [[1, 2, 3], [2, 2, 4], [5]]
+    index = BM25Index.from_tokenized(tokenized)
+    np.testing.assert_allclose(index.get_scores([2, 5]), BM25Okapi(tokenized).get_scores([2, 5]), rtol=1e-5)
+
+
+def test_top_k_orders_by_score_then_index():
+    index = BM25Index.from_tokenized(DOCS)
+    order, scores = index.top_k(["revenue"], 3)
+    expected = BM25Okapi(DOCS).get_scores(["revenue"])
+    assert list(order) == sorted(range(len(DOCS)), key=lambda i: (-expected[i], i))[:3]
+    assert list(scores) == sorted(scores, reverse=True)
+    assert len(index.top_k(["revenue"], 10)[0]) == len(DOCS)
+
+
+def test_save_and_load_round_trip():
+    index = BM25Index.from_token_arrays(np.array([1, 2, 2, 3]), np.array([0, 2, 4]), tokenizer_params={"kind": "test"})
+    buffer = io.BytesIO()
+    index.save(buffer)
+    buffer.seek(0)
+    loaded = BM25Index.load(buffer)
+    assert loaded.tokenizer_params == {"kind": "test"}
+    np.testing.assert_array_equal(loaded.get_scores([2]), index.get_scores([2]))
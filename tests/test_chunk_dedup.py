@@ -0,0 +1,126 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from src.chunk_dedup import ChunkDeduplicator, load_vector_chunk_ids
+from src.embedding_cache import EmbeddingCache
+from src.ingestion import VectorDBIngestor
+from src.streaming_ingestion import StreamingIngestor
+
+HEADER = (
+    "某某股份有限公司 2024 年年度报告 全文 第 {} 页 本报告仅供参考，不构成投资建议。"
+    "投资者应当仔细阅读本公司年度报告全文，并关注本报告中关于风险因素的描述与说明"
+)
+# 逐年对比的财务表格：只有年份和个别数字不同，MinHash 相似度超过 0.8
+TABLE = (
+    "合并利润表（单位：万元） {}年 营业收入 1,234,567.89 营业成本 678,901.23 销售费用 45,678.90 "
+    "管理费用 34,567.80 研发费用 23,456.70 财务费用 -1,234.50 营业利润 345,678.90 利润总额 350,000.00 "
+    "所得税费用 52,500.00 净利润 297,500.00 归属于母公司股东的净利润 290,000.00 基本每股收益 {}"
+)
+TABLE_2023 = TABLE.format(2023, "1.20")
+TABLE_2024 = TABLE.format(2024, "1.21")
+
+
+def test_exact_duplicates_ignore_whitespace():
+    result = ChunkDeduplicator().deduplicate(["营业收入  增长", "营业收入\n增长", "净利润下降"])
+    assert result.representatives == [0, 2]
+    assert result.assignment == [0, 0, 2]
+    assert result.stats.exact_duplicates == 1
+    assert result.stats.near_duplicates == 0
+
+
+def test_near_duplicate_page_headers():
+    texts = [HEADER.format(1), "董事会批准了年度利润分配方案", HEADER.format(2)]
+    result = ChunkDeduplicator(threshold=0.8).deduplicate(texts)
+    assert result.assignment == [0, 1, 0]
+    assert result.stats.near_duplicates == 1
+    assert result.stats.num_representatives == 2
+
+
+def test_distinct_texts_are_kept():
+    texts = ["营业收入同比增长 12%", "研发投入占营业收入的 8%", "公司实施了股票回购"]
+    result = ChunkDeduplicator().deduplicate(texts)
+    assert result.representatives == [0, 1, 2]
+
+
+def test_incremental_add_matches_deduplicate():
+    texts = [HEADER.format(1), TABLE_2023, HEADER.format(2), TABLE_2024, TABLE_2023]
+    expected = ChunkDeduplicator().deduplicate(texts).assignment
+    deduplicator = ChunkDeduplicator()
+    assignment = []
+    for text in texts:
+        position = deduplicator.num_added
+        representative = deduplicator.add(text)
+        assignment.append(position if representative is None else representative)
+    assert assignment == expected
+
+
+def test_deduplicate_requires_fresh_instance():
+    deduplicator = ChunkDeduplicator()
+    deduplicator.add("营业收入")
+    with pytest.raises(ValueError):
+        deduplicator.deduplicate(["净利润"])
+
+
+def _fake_embeddings(texts):
+    # 按文本内容确定的向量，便于比较重复文本块是否复用了代表的向量
+    return [np.random.default_rng(sum(map(ord, text))).random(8).tolist() for text in texts]
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    ingestor = VectorDBIngestor(
+        embedding_cache=EmbeddingCache(tmp_path / "cache"),
+        embedding_provider="local",
+        index_type="flat",
+        dedup_threshold=0.8
+    )
+    embedded = []
+
+    def embed_texts(texts, checkpoint=None):
+        embedded.extend(texts)
+        return _fake_embeddings(texts)
+
+    monkeypatch.setattr(ingestor, "_prepare_embedder", lambda output_dir: None)
+    monkeypatch.setattr(ingestor, "_get_embeddings", lambda texts, checkpoint=None: embed_texts(texts))
+    monkeypatch.setattr(ingestor, "_embed_texts", embed_texts)
+    ingestor.embedded = embedded
+    return ingestor
+
+
+def test_near_duplicate_tables_stay_in_index(ingestor, tmp_path):
+    assert ChunkDeduplicator(threshold=0.8).deduplicate([TABLE_2023, TABLE_2024]).assignment == [0, 0]
+    chunks = [{"text": TABLE_2023, "page": 10}, {"text": "   ", "page": 10}, {"text": TABLE_2024, "page": 11}]
+    reports_dir = tmp_path / "reports"
+    reports_dir.mkdir()
+    with open(reports_dir / "report.json", "w", encoding="utf-8") as f:
+        json.dump({"metainfo": {"sha1": "abc"}, "content": {"chunks": chunks}}, f, ensure_ascii=False)
+
+    vector_db_dir = tmp_path / "vector_dbs"
+    summary = ingestor.process_reports(reports_dir, vector_db_dir)
+    assert len(summary["processed"]) == 1
+
+    # 只嵌入代表，但两张表都以自己的文本块下标入索引
+    assert ingestor.embedded == [TABLE_2023]
+    assert load_vector_chunk_ids(vector_db_dir, "abc").tolist() == [0, 2]
+    index = faiss.read_index(str(vector_db_dir / "abc.faiss"))
+    assert index.ntotal == 2
+    np.testing.assert_array_equal(index.reconstruct(0), index.reconstruct(1))
+
+
+def test_streaming_reuses_representative_vector_across_micro_batches(ingestor):
+    streaming = StreamingIngestor(vector_ingestor=ingestor)
+    deduplicator = ChunkDeduplicator(threshold=0.8)
+    representative_vectors = {}
+    first, first_ids = streaming._embed_micro_batch(
+        [{"text": TABLE_2023}, {"text": ""}], 0, None, deduplicator, representative_vectors
+    )
+    second, second_ids = streaming._embed_micro_batch(
+        [{"text": TABLE_2024}, {"text": HEADER.format(1)}], 2, None, deduplicator, representative_vectors
+    )
+    assert first_ids == [0]
+    assert second_ids == [2, 3]
+    assert ingestor.embedded == [TABLE_2023, HEADER.format(1)]
+    np.testing.assert_array_equal(second[0], first[0])
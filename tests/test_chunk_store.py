@@ -0,0 +1,73 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from src.chunk_store import ChunkStore
+from src.retrieval import _page_fields
+
+
+def _write_store(tmp_path, document):
+    document_path = tmp_path / "report.json"
+    with open(document_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False)
+    return ChunkStore.write(tmp_path, document_path, document)
+
+
+def test_pdf_pages_are_reported(tmp_path):
+    store = _write_store(tmp_path, {
+        "metainfo": {"sha1": "pdf"},
+        "content": {
+            "chunks": [{"id": 0, "page": 3, "text": "营业收入"}, {"id": 1, "text": "没有页码"}],
+            "pages": [{"page": 3, "text": "第三页全文 营业收入"}]
+        }
+    })
+    assert not store.synthetic_pages
+    assert store.chunk_page(0) == store.parent_page(0) == 3
+    assert store.page_text(3) == "第三页全文 营业收入"
+    assert _page_fields(store, store.parent_page(0)) == {"page": 3}
+    assert store.chunk_page(1) is None
+    assert _page_fields(store, store.parent_page(1)) == {"page": 0}
+
+
+def test_markdown_synthetic_pages_are_not_reported_as_pages(tmp_path):
+    lines = [f"第 {i} 行\n" for i in range(1, 121)]
+    store = _write_store(tmp_path, {
+        "metainfo": {"sha1": "md"},
+        "content": {"chunks": [
+            {"id": 0, "lines": [1, 60], "text": "".join(lines[:60])},
+            {"id": 1, "lines": [61, 120], "text": "".join(lines[60:])},
+        ]}
+    })
+    assert store.synthetic_pages
+    # 合成页码只用于取父页面文本
+    assert store.parent_page(1) == 2
+    assert store.page_text(2) == "".join(lines[60:])
+    assert store.chunk_page(1) is None
+    assert "page" not in store.chunk(1)
+    assert _page_fields(store, store.parent_page(1)) == {"page": 0, "synthetic_page": 2}
+
+
+def test_concurrent_open_builds_store_once(tmp_path, monkeypatch):
+    document = {
+        "metainfo": {"sha1": "pdf"},
+        "content": {
+            "chunks": [{"id": i, "page": i % 5, "text": f"第 {i} 个文本块 营业收入"} for i in range(200)],
+            "pages": [{"page": i, "text": f"第 {i} 页全文"} for i in range(5)]
+        }
+    }
+    document_path = tmp_path / "report.json"
+    with open(document_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False)
+
+    writes = []
+    write = ChunkStore.write.__func__
+    monkeypatch.setattr(ChunkStore, "write", classmethod(lambda cls, *args: writes.append(1) or write(cls, *args)))
+
+    def open_store(_):
+        return ChunkStore.open(tmp_path, document_path, "pdf")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        stores = list(pool.map(open_store, range(8)))
+    assert all(len(store) == 200 and store.text(7) == "第 7 个文本块 营业收入" for store in stores)
+    assert len(writes) == 1
+    # 没有残留的临时文件
+    assert sorted(path.name for path in ChunkStore.store_dir(tmp_path).iterdir()) == ["pdf.meta.npz", "pdf.text.bin"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import src.corpus_index as corpus_index_module
+from src.corpus_index import CorpusIndex
+
+
+def _corpus(doc_ids, signature, vector_encoding="float32"):
+    rng = np.random.default_rng(0)
+    documents = []
+    for doc_id in doc_ids:
+        vectors = rng.normal(size=(20, 8)).astype(np.float32)
+        documents.append((doc_id, vectors / np.linalg.norm(vectors, axis=1, keepdims=True), list(range(20))))
+    return CorpusIndex.build(documents, index_type="flat", signature=signature, vector_encoding=vector_encoding), documents
+
+
+def test_save_and_load(tmp_path):
+    corpus, documents = _corpus(["a", "b"], "v1", vector_encoding="sq8")
+    corpus.save(tmp_path)
+    loaded = CorpusIndex.load(tmp_path, mmap=True)
+    assert CorpusIndex.read_signature(tmp_path) == "v1"
+    assert loaded.document_ids == ["a", "b"]
+    assert loaded.full_vectors is not None
+    hits = loaded.search(documents[1][1][5], 1, doc_ids=["b"])
+    assert hits[0][0][:2] == ("b", 5)
+
+
+def test_resave_removes_previous_generation(tmp_path):
+    _corpus(["a"], "v1")[0].save(tmp_path)
+    _corpus(["a", "b"], "v2")[0].save(tmp_path)
+    assert len(list((tmp_path / CorpusIndex.GENERATIONS_DIR).iterdir())) == 1
+    assert CorpusIndex.load(tmp_path).document_ids == ["a", "b"]
+
+
+def test_load_retries_when_generation_is_replaced(tmp_path, monkeypatch):
+    # 读取方读完 id 映射后、打开索引前，另一次保存替换了版本；不能把旧映射和新索引配在一起
+    _corpus(["a", "b"], "v1")[0].save(tmp_path)
+    replacement = _corpus(["c", "d"], "v2")[0]
+    read_index = corpus_index_module.read_index
+    calls = []
+
+    def racing_read_index(path, mmap=False):
+        if not calls:
+            replacement.save(tmp_path)
+        calls.append(path)
+        return read_index(path, mmap=mmap)
+
+    monkeypatch.setattr(corpus_index_module, "read_index", racing_read_index)
+    loaded = CorpusIndex.load(tmp_path)
+    assert len(calls) == 2
+    assert loaded.document_ids == ["c", "d"]
+    assert loaded.signature == "v2"
+
+
+def test_legacy_layout_needs_rebuild(tmp_path):
+    np.savez(tmp_path / CorpusIndex.IDS_FILE, doc_ids=np.array(["a"]), vector_doc=np.zeros(1, dtype=np.int32),
+             vector_chunk=np.zeros(1, dtype=np.int32), signature=np.array("v1"))
+    assert CorpusIndex.read_signature(tmp_path) is None
+    with pytest.raises(ValueError):
+        CorpusIndex.load(tmp_path)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from src.embedding_cache import EmbeddingCache
+from src.local_embedding import LocalEmbedder
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("src.embedding_cache.time.time", lambda: now[0])
+    return now
+
+
+def _compute(calls, dim=4):
+    def compute(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] * dim for text in texts]
+    return compute
+
+
+def test_hit_avoids_recomputation(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    calls = []
+    first = cache.get_or_compute("local", "model", ["营业收入", "净利润", "营业收入"], _compute(calls))
+    assert calls == [["营业收入", "净利润"]]
+    second = cache.get_or_compute("local", "model", ["净利润", "营业收入"], _compute(calls))
+    assert len(calls) == 1
+    assert second == [first[1], first[0]]
+    assert cache.stats()["hits"] == 2
+
+    # 新实例从磁盘读取，同样不再计算
+    assert EmbeddingCache(tmp_path).get_or_compute("local", "model", ["净利润"], _compute(calls)) == [first[1]]
+    assert len(calls) == 1
+
+
+def test_aget_or_compute(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    calls = []
+
+    async def compute(texts):
+        return _compute(calls)(texts)
+
+    async def run():
+        return [await cache.aget_or_compute("local", "model", ["营业收入"], compute) for _ in range(2)]
+
+    assert asyncio.run(run()) == [[[4.0] * 4], [[4.0] * 4]]
+    assert len(calls) == 1
+
+
+def test_key_changes_with_model_and_dimension(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    calls = []
+    cache.get_or_compute("local", "model-a", ["营业收入"], _compute(calls))
+    cache.get_or_compute("local", "model-b", ["营业收入"], _compute(calls))
+    cache.get_or_compute("qwen", "model-a", ["营业收入"], _compute(calls))
+    assert len(calls) == 3
+
+    # 本地嵌入的模型名包含维度，改变维度后不会命中旧向量
+    for dimension in (8, 16):
+        model = LocalEmbedder(dimension=dimension, num_features=1024).model_name
+        vectors = cache.get_or_compute("local", model, ["营业收入"], _compute(calls, dim=dimension))
+        assert len(vectors[0]) == dimension
+    assert len(calls) == 5
+
+    # 同一模型下维度不一致的向量不会混入缓存
+    with pytest.raises(ValueError):
+        cache.put_many("local", "model-a", ["净利润"], [[1.0] * 8])
+
+
+def test_compaction_keeps_most_recently_used(tmp_path, clock):
+    cache = EmbeddingCache(tmp_path, max_entries=10)
+    calls = []
+    texts = [f"文本 {i}" for i in range(10)]
+    for text in texts:
+        cache.get_or_compute("local", "model", [text], _compute(calls))
+        clock[0] += 1
+    # 最早写入的文本最近被访问过，不应被淘汰
+    cache.get_or_compute("local", "model", [texts[0]], _compute(calls))
+    clock[0] += 1
+    cache.get_or_compute("local", "model", ["文本 10"], _compute(calls))
+    assert cache.stats()["entries"] == 9
+
+    calls.clear()
+    cache.get_or_compute("local", "model", [texts[0], "文本 10"] + texts[3:], _compute(calls))
+    assert calls == []
+    cache.get_or_compute("local", "model", [texts[1]], _compute(calls))
+    assert calls == [[texts[1]]]
+
+
+def test_other_instance_sees_writes_after_compaction(tmp_path, clock):
+    writer = EmbeddingCache(tmp_path, max_entries=10)
+    reader = EmbeddingCache(tmp_path, max_entries=10)
+    calls = []
+    for i in range(10):
+        writer.get_or_compute("local", "model", [f"文本 {i}"], _compute(calls))
+        clock[0] += 1
+    assert reader.get_or_compute("local", "model", ["文本 0"], _compute(calls)) == [[4.0] * 4]
+    assert len(calls) == 10
+
+    # writer 写入新条目触发 compaction，淘汰最久未用的条目并重写文件
+    writer.get_or_compute("local", "model", ["新文本 10", "新文本 11"], _compute(calls))
+    calls.clear()
+    assert reader.get_or_compute("local", "model", ["新文本 10", "新文本 11", "文本 9"], _compute(calls)) == [[6.0] * 4] * 2 + [[4.0] * 4]
+    assert calls == []
+    reader.get_or_compute("local", "model", ["文本 0"], _compute(calls))
+    assert calls == [["文本 0"]]
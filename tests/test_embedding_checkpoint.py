@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.embedding_checkpoint import EmbeddingCheckpoint
+
+
+def _checkpoint(tmp_path, content_hash="hash", embedding_model="model"):
+    return EmbeddingCheckpoint(tmp_path, "sha1", content_hash, embedding_model)
+
+
+def test_resume_reads_completed_batches(tmp_path):
+    checkpoint = _checkpoint(tmp_path)
+    checkpoint.append(["营业收入", "净利润"], [[1.0, 2.0], [3.0, 4.0]])
+    checkpoint.append(["现金流"], [[5.0, 6.0]])
+
+    resumed = _checkpoint(tmp_path).load()
+    assert len(resumed) == 3
+    np.testing.assert_array_equal(resumed[EmbeddingCheckpoint.key("净利润")], [3.0, 4.0])
+    np.testing.assert_array_equal(resumed[EmbeddingCheckpoint.key("现金流")], [5.0, 6.0])
+
+
+def test_changed_content_or_model_discards_checkpoint(tmp_path):
+    _checkpoint(tmp_path).append(["营业收入"], [[1.0, 2.0]])
+    assert len(_checkpoint(tmp_path, content_hash="other")) == 0
+    assert not _checkpoint(tmp_path).path.exists()
+
+    _checkpoint(tmp_path).append(["营业收入"], [[1.0, 2.0]])
+    assert len(_checkpoint(tmp_path, embedding_model="other")) == 0
+
+
+def test_truncated_record_is_dropped(tmp_path):
+    checkpoint = _checkpoint(tmp_path)
+    checkpoint.append(["营业收入"], [[1.0, 2.0]])
+    checkpoint.append(["净利润"], [[3.0, 4.0]])
+    data = checkpoint.path.read_bytes()
+    checkpoint.path.write_bytes(data[:-3])
+
+    resumed = _checkpoint(tmp_path)
+    assert list(resumed.load()) == [EmbeddingCheckpoint.key("营业收入")]
+    # 截断后可以继续追加
+    resumed.append(["净利润"], [[3.0, 4.0]])
+    assert len(_checkpoint(tmp_path)) == 2
+
+
+def test_invalid_file_is_discarded(tmp_path):
+    checkpoint = _checkpoint(tmp_path)
+    checkpoint.path.parent.mkdir(parents=True)
+    checkpoint.path.write_bytes(b"not a checkpoint")
+    assert len(checkpoint) == 0
+    assert not checkpoint.path.exists()
+
+
+def test_remove(tmp_path):
+    checkpoint = _checkpoint(tmp_path)
+    checkpoint.append(["营业收入"], [[1.0, 2.0]])
+    checkpoint.remove()
+    assert not checkpoint.path.exists()
+    assert len(_checkpoint(tmp_path)) == 0
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.retrieval import FusionRetriever, reciprocal_rank_fusion, weighted_score_fusion
+
+
+def test_reciprocal_rank_fusion():
+    ids, scores = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4])], k=60)
+    assert ids.tolist() == [1, 3, 4, 2]
+    np.testing.assert_allclose(scores, [1 / 62 + 1 / 61, 1 / 61, 1 / 62, 1 / 63])
+
+
+def test_reciprocal_rank_fusion_weights_and_ties():
+    ids, scores = reciprocal_rank_fusion([np.array([7]), np.array([5])], weights=[1.0, 1.0])
+    # 同分时 id 小的在前
+    assert ids.tolist() == [5, 7]
+    ids, _ = reciprocal_rank_fusion([np.array([7]), np.array([5])], weights=[0.2, 0.8])
+    assert ids.tolist() == [5, 7]
+
+
+def test_reciprocal_rank_fusion_empty_list():
+    ids, scores = reciprocal_rank_fusion([np.array([], dtype=np.int64), np.array([2, 9])])
+    assert ids.tolist() == [2, 9]
+
+
+def test_weighted_score_fusion_normalizes_each_list():
+    ids, scores = weighted_score_fusion(
+        [np.array([1, 2, 3]), np.array([3, 1])],
+        [np.array([0.9, 0.5, 0.1]), np.array([40.0, 10.0])],
+        weights=[0.5, 0.5]
+    )
+    assert ids.tolist() == [1, 3, 2]
+    np.testing.assert_allclose(scores, [0.5, 0.5, 0.25])
+
+
+def test_weighted_score_fusion_single_candidate():
+    ids, scores = weighted_score_fusion([np.array([4]), np.array([], dtype=np.int64)], [np.array([0.3]), np.array([])])
+    assert ids.tolist() == [4]
+    np.testing.assert_allclose(scores, [1.0])
+
+
+@pytest.mark.parametrize("method", FusionRetriever.FUSION_METHODS)
+def test_fused_scores_are_normalized(method):
+    retriever = FusionRetriever(None, None, None, method=method, vector_retriever=object(), bm25_retriever=object())
+    dense = [("a", 0, 0.8), ("a", 1, 0.7), ("b", 0, 0.6)]
+    lexical = [("a", 0, 12.0), ("b", 0, 3.0)]
+    hits = retriever._fuse(dense, lexical, top_n=3)
+    assert hits[0][:2] == ("a", 0)
+    # 两路都排第一时为 1，LLM重排按 distance 加权时与向量相似度量级相当
+    assert hits[0][2] == pytest.approx(1.0)
+    assert all(0.0 <= score <= 1.0 for _, _, score in hits)
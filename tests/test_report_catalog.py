@@ -0,0 +1,78 @@
+import json
+import logging
+
+import pytest
+
+from src.report_catalog import ReportCatalog, company_aliases, normalize_name
+
+
+def _write_report(documents_dir, document_file, sha1, company_name, file_name="", aliases=None):
+    metainfo = {"sha1": sha1, "company_name": company_name, "file_name": file_name}
+    if aliases is not None:
+        metainfo["aliases"] = aliases
+    document = {"metainfo": metainfo, "content": {"chunks": [{"text": "营业收入", "page": 1}]}}
+    with open(documents_dir / document_file, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    documents_dir = tmp_path / "documents"
+    documents_dir.mkdir()
+    _write_report(documents_dir, "a.json", "sha_ccb", "中国建设银行股份有限公司", "建行2023年年度报告.pdf")
+    _write_report(documents_dir, "b.json", "sha_icbc", "中国工商银行股份有限公司", "工行2023年年度报告.pdf")
+    _write_report(documents_dir, "c.json", "sha_tesco", "Tesco PLC", "tesco_annual_report_2023.pdf")
+    _write_report(documents_dir, "d.json", "sha_cisco", "Cisco Systems, Inc.", "cisco_10k.pdf", aliases=["思科"])
+    _write_report(documents_dir, "e.json", "sha_pingan", "中国平安保险（集团）股份有限公司", "平安年报.pdf")
+    return ReportCatalog.load(documents_dir, tmp_path / "vector_dbs")
+
+
+def test_normalize_name():
+    assert normalize_name("ＡＢＣ  Co., Ltd.") == "abccoltd"
+    assert normalize_name(None) == ""
+
+
+@pytest.mark.parametrize("company_name, expected", [
+    ("Tesco PLC", ["tesco"]),
+    ("Cisco", []),
+    ("Cisco Systems, Inc.", ["ciscosystems"]),
+    ("Apple Inc.", ["apple"]),
+    ("Group", []),
+    ("某某股份有限公司", ["某某"]),
+    ("中国平安保险（集团）股份有限公司", ["中国平安保险"]),
+])
+def test_company_aliases_strip_whole_suffixes(company_name, expected):
+    assert company_aliases(company_name) == expected
+
+
+def test_find_by_name_alias_and_file_name(catalog):
+    assert catalog.find("中国建设银行股份有限公司") == "sha_ccb"
+    assert catalog.find("中国建设银行", exact=True) == "sha_ccb"
+    assert catalog.find("TESCO") == "sha_tesco"
+    assert catalog.find("思科", exact=True) == "sha_cisco"
+    assert catalog.find("工行") == "sha_icbc"
+    assert catalog.find("工行", exact=True) is None
+
+
+def test_find_respects_predicate(catalog):
+    assert catalog.find("Tesco", predicate=lambda sha1: sha1 != "sha_tesco") is None
+
+
+def test_fuzzy_match_does_not_confuse_similar_banks(catalog):
+    assert catalog.find("中国银行") is None
+    assert catalog.find("Cisco") is None
+
+
+def test_fuzzy_match_is_last_resort_and_logged(catalog, caplog):
+    with caplog.at_level(logging.WARNING, logger="src.report_catalog"):
+        assert catalog.find("中国平安保险集团股份有限司") == "sha_pingan"
+    assert "模糊匹配" in caplog.text
+    assert catalog.find("中国平安保险集团股份有限司", exact=True) is None
+
+
+def test_refresh_picks_up_new_reports(catalog):
+    assert catalog.find("招商银行", exact=True) is None
+    _write_report(catalog.documents_dir, "f.json", "sha_cmb", "招商银行股份有限公司")
+    assert catalog.refresh()
+    assert catalog.find("招商银行", exact=True) == "sha_cmb"
+    assert not catalog.refresh()
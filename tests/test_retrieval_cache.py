@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from src.retrieval import VectorRetriever
+from src.retrieval_cache import RetrievalCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.retrieval_cache.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_normalize_query():
+    assert normalize_query("  ２０２４年 营业收入是多少？ ") == normalize_query("2024年 营业收入是多少")
+    assert normalize_query("What was   Revenue?") == "what was revenue"
+
+
+def test_get_or_compute_hits_and_copies():
+    cache = RetrievalCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [{"text": "营业收入", "distance": 0.9}]
+
+    first = cache.get_or_compute("key", 0, compute)
+    first[0]["relevance_score"] = 1.0
+    second = cache.get_or_compute("key", 0, compute)
+    assert len(calls) == 1
+    assert second == [{"text": "营业收入", "distance": 0.9}]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_version_change_invalidates():
+    cache = RetrievalCache()
+    cache.put("key", 0, [{"text": "旧"}])
+    assert cache.get("key", 1) is None
+    assert cache.stats()["invalidated"] == 1
+    assert len(cache) == 0
+
+
+def test_ttl_expiry(clock):
+    cache = RetrievalCache(ttl_seconds=10)
+    cache.put("key", 0, [{"text": "a"}])
+    clock[0] += 9
+    assert cache.get("key", 0) == [{"text": "a"}]
+    clock[0] += 2
+    assert cache.get("key", 0) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_lru_eviction():
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", 0, [])
+    cache.put("b", 0, [])
+    assert cache.get("a", 0) == []
+    cache.put("c", 0, [])
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == []
+    assert cache.get("c", 0) == []
+
+
+def test_disabled_cache_always_computes():
+    cache = RetrievalCache(max_entries=0)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute("key", 0, lambda: calls.append(1) or [])
+    assert len(calls) == 2
+    assert len(cache) == 0
+
+
+def test_aget_or_compute():
+    cache = RetrievalCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return [{"text": "a"}]
+
+    async def run():
+        return [await cache.aget_or_compute("key", 0, compute) for _ in range(2)]
+
+    assert asyncio.run(run()) == [[{"text": "a"}], [{"text": "a"}]]
+    assert len(calls) == 1
+
+
+def test_new_retriever_on_same_directory_does_not_reuse_results(tmp_path):
+    # 重新入库后新建的检索器版本号同样从 0 开始，不能命中旧实例写入的结果
+    cache = RetrievalCache()
+    old = VectorRetriever(tmp_path, tmp_path, embedding_provider="local", result_cache=cache)
+    new = VectorRetriever(tmp_path, tmp_path, embedding_provider="local", result_cache=cache)
+    key = old._cache_key("company", ("sha1",), "营业收入", 3, False)
+    cache.put(key, old.index_version, [{"text": "旧索引的结果"}])
+    assert cache.get(new._cache_key("company", ("sha1",), "营业收入", 3, False), new.index_version) is None
+    assert cache.get(old._cache_key("company", ("sha1",), "营业收入？", 3, False), old.index_version) == [{"text": "旧索引的结果"}]
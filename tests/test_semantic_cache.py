@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from src.semantic_cache import SemanticAnswerCache, question_numbers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("src.semantic_cache.time.time", lambda: now[0])
+    return now
+
+
+def _scope(question, kind="number"):
+    return SemanticAnswerCache.scope_key(["sha1"], kind, "finance", "qwen-turbo", question)
+
+
+def test_question_numbers():
+    assert question_numbers("２０２４年营收增长3.5%吗") == ("2024", "3.5")
+
+
+def test_threshold_hit_and_miss():
+    cache = SemanticAnswerCache(threshold=0.95)
+    scope = _scope("2024年营收是多少")
+    cache.store([1.0, 0.0, 0.0], scope, "2024年营收是多少", {"value": 100})
+
+    answer = cache.lookup([0.99, 0.05, 0.0], scope)
+    assert answer["value"] == 100
+    assert answer["semantic_cache"]["hit"] is True
+    assert answer["semantic_cache"]["cached_question"] == "2024年营收是多少"
+    assert cache.lookup([0.6, 0.8, 0.0], scope) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_returned_answer_is_a_copy():
+    cache = SemanticAnswerCache()
+    scope = _scope("营收")
+    cache.store([1.0, 0.0], scope, "营收", {"value": 1})
+    cache.lookup([1.0, 0.0], scope)["value"] = 2
+    assert cache.lookup([1.0, 0.0], scope)["value"] == 1
+
+
+def test_numbers_and_documents_scope_the_cache():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], _scope("2024年营收是多少"), "2024年营收是多少", {"value": 100})
+    assert _scope("2024年的营业收入") == _scope("2024年营收是多少")
+    assert cache.lookup([1.0, 0.0], _scope("2023年营收是多少")) is None
+    assert cache.lookup([1.0, 0.0], _scope("2024年营收是多少", kind="boolean")) is None
+    other_documents = SemanticAnswerCache.scope_key(["other"], "number", "finance", "qwen-turbo", "2024年营收是多少")
+    assert cache.lookup([1.0, 0.0], other_documents) is None
+    assert cache.lookup([1.0, 0.0], _scope("2024年的营业收入"))["value"] == 100
+
+
+def test_max_entries_evicts_oldest():
+    cache = SemanticAnswerCache(max_entries=2)
+    scope = _scope("营收")
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.store(vector, scope, f"问题{i}", {"value": i})
+    assert cache.lookup([1.0, 0.0, 0.0], scope) is None
+    assert cache.lookup([0.0, 1.0, 0.0], scope)["value"] == 1
+    assert cache.lookup([0.0, 0.0, 1.0], scope)["value"] == 2
+    assert cache.stats()["entries"] == 2
+
+
+def test_ttl_expiry_does_not_shadow_fresh_answer(clock):
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    scope = _scope("营收")
+    cache.store([1.0, 0.0], scope, "营收", {"value": "旧"})
+    clock[0] += 30
+    assert cache.lookup([1.0, 0.0], scope)["value"] == "旧"
+    clock[0] += 31
+    assert cache.lookup([1.0, 0.0], scope) is None
+    assert cache.stats()["entries"] == 0
+
+    cache.store([1.0, 0.0], scope, "营收", {"value": "新"})
+    assert cache.lookup([1.0, 0.0], scope)["value"] == "新"
+
+
+def test_expired_entry_is_purged_on_store(clock):
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    scope = _scope("营收")
+    cache.store([1.0, 0.0], scope, "营收", {"value": "旧"})
+    clock[0] += 61
+    cache.store(np.array([1.0, 0.0]), scope, "营收", {"value": "新"})
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0], scope)["value"] == "新"
@@ -0,0 +1,44 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.embedding_cache import EmbeddingCache
+from src.ingestion import VectorDBIngestor
+from src.ingestion_manifest import IngestionManifest
+from src.streaming_ingestion import StreamingIngestor
+
+
+@pytest.fixture
+def streaming(tmp_path, monkeypatch):
+    ingestor = VectorDBIngestor(embedding_cache=EmbeddingCache(tmp_path / "cache"), embedding_provider="local", index_type="flat")
+    monkeypatch.setattr(ingestor, "_prepare_embedder", lambda output_dir: None)
+    monkeypatch.setattr(ingestor, "_embed_texts", lambda texts, checkpoint=None: np.ones((len(texts), 4)).tolist())
+    return StreamingIngestor(vector_ingestor=ingestor, chunk_size=5, chunk_overlap=1, micro_batch_size=2, max_queued_batches=1)
+
+
+@pytest.fixture
+def md_path(tmp_path):
+    path = tmp_path / "report.md"
+    path.write_text("".join(f"第 {i} 行 营业收入 {i}\n" for i in range(200)), encoding="utf-8")
+    return path
+
+
+def test_ingest_markdown(streaming, md_path, tmp_path):
+    vector_db_dir = tmp_path / "vector_dbs"
+    result = streaming.ingest_markdown(md_path, tmp_path / "documents", vector_db_dir, IngestionManifest(vector_db_dir))
+    assert result["status"] == "processed"
+    assert (tmp_path / "documents" / "report.json").exists()
+
+
+def test_writer_failure_does_not_leave_threads_blocked(streaming, md_path, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("目录不可写")
+
+    monkeypatch.setattr("src.streaming_ingestion.ChunkStoreWriter", fail)
+    threads_before = threading.active_count()
+    vector_db_dir = tmp_path / "vector_dbs"
+    with pytest.raises(OSError):
+        streaming.ingest_markdown(md_path, tmp_path / "documents", vector_db_dir, IngestionManifest(vector_db_dir))
+    assert threading.active_count() == threads_before
+    assert list((tmp_path / "documents").iterdir()) == []
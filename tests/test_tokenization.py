@@ -0,0 +1,28 @@
+from src.ingestion_manifest import IngestionManifest
+from src.tokenization import TokenStore, get_tokenizer, tokenizer_from_params
+
+
+def test_full_width_digits_and_letters_are_normalized():
+    tokenizer = get_tokenizer("char_ngram")
+    assert tokenizer.tokenize("２０２４年营收ＡＢＣ") == tokenizer.tokenize("2024年营收ABC")
+    assert "2024" in tokenizer.tokenize("２０２４年") and "abc" in tokenizer.tokenize("ＡＢＣ")
+    assert "2024" in get_tokenizer("hashed_bigram").tokenize("２０２４年")
+
+
+def test_params_round_trip_and_legacy_params_keep_old_segmentation():
+    tokenizer = get_tokenizer("hashed_bigram", num_buckets=1024)
+    assert tokenizer_from_params(tokenizer.params).params == tokenizer.params
+    legacy = tokenizer_from_params({"name": "char_ngram", "min_n": 1, "max_n": 2})
+    assert legacy.normalization is None
+    assert "2024" not in legacy.tokenize("２０２４年")
+
+
+def test_token_store_reencodes_when_content_changes(tmp_path):
+    store = TokenStore(tmp_path, get_tokenizer("char_ngram"))
+    ids, offsets = store.load_or_encode("sha", ["营收 2024", "利润"])
+    assert len(offsets) == 3
+    cached_ids, _ = store.load_or_encode("sha", ["营收 2024", "利润"])
+    assert (cached_ids == ids).all()
+    changed_ids, _ = store.load_or_encode("sha", ["营收 2025", "利润"])
+    assert (changed_ids != ids).any()
+    assert IngestionManifest.hash_chunks(["a"]) != IngestionManifest.hash_chunks(["b"])